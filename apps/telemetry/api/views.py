@@ -399,6 +399,8 @@ class SolarDataListView(ListAPIView):
     def _select_collection(self, start_time, end_time):
         if start_time is None or end_time is None:
             return "solar_data"
+        if settings.TCP_STORAGE_MODE == "single":
+            return "solar_data"
 
         delta = end_time - start_time
         if delta <= timedelta(hours=24):
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+STORAGE_MODES = ("batch", "celery", "celery_batch", "none")
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded MQTT traffic (JSONL or tshark field exports) through the MQTT "
+        "processing pipeline, to backfill gaps or to load-test it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="Recording files, replayed in order.")
+        parser.add_argument(
+            "--format",
+            choices=("jsonl", "tshark"),
+            help="Recording format (default: tshark for .tsv/.txt files, jsonl otherwise).",
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=0.0,
+            help="Multiple of real time, e.g. 10 for 10x; 0 (default) replays at full speed.",
+        )
+        parser.add_argument(
+            "--storage-mode",
+            choices=STORAGE_MODES,
+            default="batch",
+            help="MQTT_STORAGE_MODE for the replay; 'none' skips Mongo writes.",
+        )
+        parser.add_argument(
+            "--no-broadcast", action="store_true", help="Skip the WebSocket fan-out."
+        )
+        parser.add_argument(
+            "--track-devices",
+            action="store_true",
+            help="Update device online status (off by default: replayed readings are old).",
+        )
+        parser.add_argument("--repeat", type=int, default=1, help="Replay the files N times.")
+        parser.add_argument("--limit", type=int, default=0, help="Stop after N messages.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        # The replay gets its own journals and never drops: a full queue waits.
+        os.environ["MQTT_WORKER_INDEX"] = "replay"
+        os.environ["MQTT_DROP_ON_FULL"] = "false"
+        os.environ["MQTT_FLOW_CONTROL"] = "false"
+        os.environ["MQTT_STORAGE_MODE"] = options["storage_mode"]
+        os.environ["MQTT_BROADCAST_ENABLED"] = "false" if options["no_broadcast"] else "true"
+        os.environ["MQTT_TRACK_DEVICES"] = "true" if options["track_devices"] else "false"
+
+        from services.mqtt.processor import MessageProcessor
+        from services.mqtt.recording import paced, read_recording
+
+        def _messages():
+            for _ in range(max(options["repeat"], 1)):
+                for path in options["files"]:
+                    yield from read_recording(path, options["format"])
+
+        messages = _messages()
+        if options["limit"] > 0:
+            messages = itertools.islice(messages, options["limit"])
+
+        processor = MessageProcessor()
+        processor.start()
+        replayed = 0
+        started = time.monotonic()
+        try:
+            for message in paced(messages, options["speed"]):
+                processor.enqueue(message.envelope())
+                replayed += 1
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+        finally:
+            fed = time.monotonic() - started
+            processor.stop()
+        elapsed = time.monotonic() - started
+
+        metrics = processor.metrics()
+        report = {
+            "replayed": replayed,
+            "processed": metrics["processed"],
+            "feed_seconds": round(fed, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "messages_per_second": round(replayed / elapsed, 1) if elapsed else 0.0,
+            "storage_mode": options["storage_mode"],
+            "assembly": metrics["assembly"],
+        }
+        if "writer" in metrics:
+            report["writer"] = metrics["writer"]
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replayed {replayed} message(s) in {report['elapsed_seconds']}s "
+                f"({report['messages_per_second']} msg/s); {report['processed']} processed."
+            )
+        )
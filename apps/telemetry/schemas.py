@@ -1,8 +1,18 @@
 from __future__ import annotations
 
-from typing import Any
+from functools import lru_cache
+from typing import Annotated, Any
 
-from pydantic import BaseModel, ConfigDict, Field, RootModel, ValidationError
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    RootModel,
+    TypeAdapter,
+    ValidationError,
+    create_model,
+    model_validator,
+)
 
 
 class TelemetryMessage(BaseModel):
@@ -13,6 +23,10 @@ class TelemetryMessage(BaseModel):
 
     model_config = ConfigDict(extra="forbid")
 
+    def to_dict(self) -> dict:
+        """Plain dict for Mongo, Celery and WebSocket payloads; payload keys keep their aliases."""
+        return self.model_dump(by_alias=True, warnings=False)
+
 
 class RTDataPayload(BaseModel):
     ua: float
@@ -139,47 +153,53 @@ class GeneratorPayload(RootModel[dict[str, float | int | str]]):
     pass
 
 
-class GeneratorDataModel(BaseModel):
-    timestamp: int = Field(..., ge=0, description="Unix timestamp in milliseconds")
-    payload: GeneratorPayload
-
-    def model_dump(self, *args, **kwargs):
-        base = super().model_dump(*args, **kwargs)
-        return {"timestamp": base["timestamp"], **base["payload"]}
+_GENERATOR_TIMESTAMP = TypeAdapter(Annotated[int, Field(ge=0)])
 
-    @classmethod
-    def from_flat_dict(cls, data: dict[str, float | int | str]):
-        payload = dict(data)
-        ts = payload.pop("timestamp", None)
-        return cls(timestamp=ts, payload=GeneratorPayload(payload))
 
+class GeneratorReadingPayload(RootModel[dict[str, float | int | str]]):
+    """Flattened generator reading: ``timestamp`` (ms) plus one entry per point id."""
 
-def validate_message(message: dict) -> None:
-    msg = TelemetryMessage.model_validate(message)
+    @model_validator(mode="before")
+    @classmethod
+    def _coerce_timestamp(cls, data):
+        if isinstance(data, dict):
+            try:
+                timestamp = _GENERATOR_TIMESTAMP.validate_python(data.get("timestamp"))
+            except ValidationError as exc:
+                raise ValueError(f"timestamp: {exc.errors()[0]['msg']}") from None
+            data["timestamp"] = timestamp
+        return data
+
+
+PAYLOAD_SCHEMAS: dict[str, type[BaseModel]] = {
+    "rt_data": RTDataPayload,
+    "energy_now": EnergyNowPayload,
+    "environment": EnvironmentPayload,
+    "generic": GeneratorPayload,
+    "generator_reading": GeneratorReadingPayload,
+}
+
+
+@lru_cache(maxsize=64)
+def message_adapter(payload_model: type[BaseModel] | None = None) -> TypeAdapter:
+    """``TypeAdapter`` for a message whose payload is typed by ``payload_model``."""
+    if payload_model is None:
+        return TypeAdapter(TelemetryMessage)
+    model = create_model(
+        f"{payload_model.__name__}Message",
+        __base__=TelemetryMessage,
+        payload=(payload_model, ...),
+    )
+    return TypeAdapter(model)
+
+
+def validate_message(
+    message: dict, payload_model: type[BaseModel] | None = None
+) -> TelemetryMessage:
+    msg = message_adapter(payload_model).validate_python(message)
     _validate_device_id(msg)
-    _validate_payload(msg.topic, msg.payload)
+    return msg
 
 
 def _validate_device_id(message: TelemetryMessage) -> None:
     return
-
-
-def _validate_payload(topic: str, payload: dict[str, Any]) -> None:
-    if topic == "MQTT_RT_DATA":
-        RTDataPayload.model_validate(payload)
-        return
-    if topic == "MQTT_ENY_NOW":
-        EnergyNowPayload.model_validate(payload)
-        return
-    if topic == "MQTT_DAY_DATA":
-        GeneratorPayload.model_validate(payload)
-        return
-    if topic == "MQTT_ENY_FRZ":
-        GeneratorPayload.model_validate(payload)
-        return
-    if topic == "CCCL/PURBACHAL/ENV_01":
-        EnvironmentPayload.model_validate(payload)
-        return
-    if topic == "CCCL/PURBACHAL/ENM_01":
-        GeneratorPayload.model_validate(payload)
-        return
@@ -2,14 +2,21 @@ from __future__ import annotations
 
 import os
 from asgiref.sync import async_to_sync
+from bson.objectid import ObjectId
 from channels.layers import get_channel_layer
 from django.conf import settings
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
 
+from apps.telemetry.schemas import TelemetryMessage
+from apps.telemetry.topic_routes import route_for
 from common.mongo import get_mongo_database
 from common.redis_client import get_redis
 
+DUPLICATE_KEY_ERROR = 11000
+
 
 def _normalize_timestamp(value):
     if value is None:
@@ -37,16 +44,57 @@ def _normalize_timestamp(value):
 
 def store_event_mongo(message: dict) -> None:
     db = get_mongo_database()
-    payload = dict(message)
-    if payload.get("topic") == "CCCL/PURBACHAL/ENV_01" and not payload.get("device_id"):
-        payload["device_id"] = "CCCL_ENVIRONMENT_DEVICE_1"
-    normalized_timestamp = _normalize_timestamp(payload.get("timestamp"))
-    payload["timestamp"] = normalized_timestamp or timezone.now()
-    collections = _collections_for_topic(payload.get("topic"))
+    payload, collections = prepare_event_document(message)
+    # The first insert pins ``_id``; later inserts reuse the same document unchanged.
     for collection in collections:
         db[collection].insert_one(payload)
     if collections:
-        db["telemetry_events"].insert_one(dict(payload))
+        db["telemetry_events"].insert_one(payload)
+
+
+def store_events_mongo(messages: list[dict]) -> None:
+    """Bulk-store ``messages``: one unordered ``bulk_write`` per target collection.
+
+    A message's ``event_id`` (an ObjectId hex string) becomes the document ``_id`` in every
+    collection, so re-running the same batch only raises duplicate-key errors, which are
+    ignored.
+    """
+    groups: dict[str, list[InsertOne]] = {}
+    for message in messages:
+        event_id = message.get("event_id")
+        payload, collections = prepare_event_document(message)
+        if not collections:
+            continue
+        payload["_id"] = ObjectId(event_id) if event_id else ObjectId()
+        operation = InsertOne(payload)
+        for collection in [*collections, "telemetry_events"]:
+            groups.setdefault(collection, []).append(operation)
+    if not groups:
+        return
+    db = get_mongo_database()
+    for collection, operations in groups.items():
+        try:
+            db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+
+
+def prepare_event_document(message: dict | TelemetryMessage) -> tuple[dict, list[str]]:
+    if isinstance(message, TelemetryMessage):
+        payload = message.to_dict()
+    else:
+        payload = {key: value for key, value in message.items() if key != "event_id"}
+    route = route_for(payload.get("topic"))
+    if route is not None and route.default_device_id and not payload.get("device_id"):
+        payload["device_id"] = route.default_device_id
+    normalized_timestamp = _normalize_timestamp(payload.get("timestamp"))
+    payload["timestamp"] = normalized_timestamp or timezone.now()
+    return payload, list(route.collections) if route is not None else []
+
+
+DEVICE_TOPICS_KEY = "telemetry:device_topics"
 
 
 def mark_device_seen(device_id: str, *, topic: str | None = None) -> None:
@@ -60,6 +108,7 @@ def mark_device_seen(device_id: str, *, topic: str | None = None) -> None:
     zset_key = f"telemetry:devices:{topic_key}"
     redis.zadd(zset_key, {device_id: now_ts})
     redis.expire(zset_key, ttl_seconds)
+    redis.sadd(DEVICE_TOPICS_KEY, topic_key)
     status_key = f"telemetry:status:{topic_key}:{device_id}"
     prev = redis.get(status_key)
     if prev != "online":
@@ -67,6 +116,37 @@ def mark_device_seen(device_id: str, *, topic: str | None = None) -> None:
         broadcast_device_status(device_id, "online", last_seen=now_ts, topic=topic)
 
 
+def mark_devices_seen(device_ids, *, topic: str | None = None) -> None:
+    device_ids = [device_id for device_id in dict.fromkeys(device_ids) if device_id]
+    if not device_ids:
+        return
+    redis = get_redis()
+    now_ts = int(timezone.now().timestamp())
+    topic_key = topic or "unknown"
+    ttl_seconds = int(getattr(settings, "TELEMETRY_DEVICE_TRACK_SECONDS", 86400))
+    zset_key = f"telemetry:devices:{topic_key}"
+    pipe = redis.pipeline(transaction=False)
+    for device_id in device_ids:
+        pipe.set(f"telemetry:last_seen:{topic_key}:{device_id}", now_ts, ex=ttl_seconds)
+    pipe.zadd(zset_key, {device_id: now_ts for device_id in device_ids})
+    pipe.expire(zset_key, ttl_seconds)
+    pipe.sadd(DEVICE_TOPICS_KEY, topic_key)
+    for device_id in device_ids:
+        pipe.get(f"telemetry:status:{topic_key}:{device_id}")
+    statuses = pipe.execute()[-len(device_ids) :]
+    came_online = [
+        device_id for device_id, prev in zip(device_ids, statuses) if prev != "online"
+    ]
+    if not came_online:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for device_id in came_online:
+        pipe.set(f"telemetry:status:{topic_key}:{device_id}", "online", ex=ttl_seconds)
+    pipe.execute()
+    for device_id in came_online:
+        broadcast_device_status(device_id, "online", last_seen=now_ts, topic=topic)
+
+
 def broadcast_device_status(device_id: str, status: str, *, last_seen: int | None = None, topic: str | None = None) -> None:
     message = {
         "type": "device_status",
@@ -78,26 +158,6 @@ def broadcast_device_status(device_id: str, status: str, *, last_seen: int | Non
     broadcast_realtime(message, event="telemetry.status")
 
 
-def _collections_for_topic(topic: str | None) -> list[str]:
-    if topic == "MQTT_RT_DATA":
-        return ["grid_rt_data"]
-    if topic == "MQTT_ENY_NOW":
-        return [
-            "grid_eny_now_data",
-            "today_grid_eny_now_data",
-            "last_7_days_grid_eny_now_data",
-        ]
-    if topic == "MQTT_DAY_DATA":
-        return ["grid_day_data"]
-    if topic == "MQTT_ENY_FRZ":
-        return ["grid_eny_frz_data"]
-    if topic == "CCCL/PURBACHAL/ENV_01":
-        return ["environment_data"]
-    if topic == "CCCL/PURBACHAL/ENM_01":
-        return ["generator_data"]
-    return []
-
-
 def _ensure_ttl_index(db, collection: str, *, ttl_seconds: int) -> None:
     if ttl_seconds <= 0:
         return
@@ -187,3 +247,23 @@ def broadcast_realtime(
         group,
         {"type": event, "message": message},
     )
+
+
+def broadcast_realtime_many(
+    messages: list[dict],
+    *,
+    group: str | None = None,
+    event: str = "telemetry.message",
+) -> None:
+    if not messages:
+        return
+    group = group or os.getenv("TELEMETRY_WS_GROUP", "telemetry")
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async def _send_all():
+        for message in messages:
+            await channel_layer.group_send(group, {"type": event, "message": message})
+
+    async_to_sync(_send_all)()
@@ -9,7 +9,13 @@ from pymongo.errors import PyMongoError
 
 from common.mongo import get_mongo_database
 from common.redis_client import get_redis
-from apps.telemetry.services import broadcast_device_status, store_event_mongo
+from apps.telemetry.services import (
+    DEVICE_TOPICS_KEY,
+    broadcast_device_status,
+    store_event_mongo,
+    store_events_mongo,
+)
+from apps.telemetry.topic_routes import get_router
 
 
 @shared_task(
@@ -23,6 +29,17 @@ def store_event_mongo_task(self, message: dict) -> None:
     store_event_mongo(message)
 
 
+@shared_task(
+    bind=True,
+    autoretry_for=(PyMongoError,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 10},
+)
+def store_events_mongo_batch(self, messages: list[dict]) -> None:
+    store_events_mongo(messages)
+
+
 def _coerce_number(value):
     if isinstance(value, (int, float)):
         return float(value)
@@ -358,14 +375,19 @@ def emit_device_offline_status() -> None:
     redis = get_redis()
     now_ts = int(timezone.now().timestamp())
     track_ttl = int(getattr(settings, "TELEMETRY_DEVICE_TRACK_SECONDS", 86400))
-    thresholds = {
-        "MQTT_RT_DATA": int(getattr(settings, "TELEMETRY_RT_STALE_SECONDS", 60)),
-        "CCCL/PURBACHAL/ENV_01": int(getattr(settings, "TELEMETRY_ENV_STALE_SECONDS", 60)),
-        "MQTT_ENY_NOW": int(getattr(settings, "TELEMETRY_ENY_NOW_STALE_SECONDS", 1020)),
-        "TCP_SOLAR_DATA": int(getattr(settings, "TELEMETRY_SOLAR_STALE_SECONDS", 150)),
-    }
-    for topic, threshold in thresholds.items():
+    router = get_router()
+    for topic in redis.smembers(DEVICE_TOPICS_KEY):
         zset_key = f"telemetry:devices:{topic}"
+        if not redis.exists(zset_key):
+            # Drop topics whose device set expired; re-add if a device was seen meanwhile.
+            redis.srem(DEVICE_TOPICS_KEY, topic)
+            if redis.exists(zset_key):
+                redis.sadd(DEVICE_TOPICS_KEY, topic)
+            continue
+        route = router.match(topic)
+        if route is None or route.stale_seconds is None:
+            continue
+        threshold = route.stale_seconds
         if track_ttl > 0:
             redis.zremrangebyscore(zset_key, 0, now_ts - track_ttl)
         offline_cutoff = now_ts - threshold
@@ -0,0 +1,39 @@
+import pytest
+
+from apps.telemetry.schemas import RTDataPayload, message_adapter
+from apps.telemetry.validators import validate_packet
+
+
+def test_validate_packet_returns_typed_message_dumped_with_aliases():
+    payload = {
+        field.alias or name: "1.5"
+        for name, field in RTDataPayload.model_fields.items()
+        if name not in {"time", "isend"}
+    }
+    payload.update(time="20260101000000", isend="1")
+
+    event = validate_packet(
+        {"device_id": "GW-1", "topic": "MQTT_RT_DATA", "timestamp": "t", "payload": payload}
+    )
+
+    document = event.to_dict()
+    assert event.payload.u_plus == 1.5
+    assert document["payload"]["uplus"] == 1.5
+    assert document["payload"]["time"] == "20260101000000"
+    assert message_adapter(RTDataPayload) is message_adapter(RTDataPayload)
+
+
+def test_generator_reading_validates_timestamp_once():
+    event = validate_packet(
+        {
+            "topic": "CCCL/PURBACHAL/ENM_01",
+            "timestamp": "t",
+            "payload": {"timestamp": "1767225600000", "7": 230.5},
+        }
+    )
+
+    assert event.to_dict()["payload"] == {"timestamp": 1767225600000, "7": 230.5}
+    with pytest.raises(ValueError, match="timestamp"):
+        validate_packet(
+            {"topic": "CCCL/PURBACHAL/ENM_01", "timestamp": "t", "payload": {"timestamp": -1}}
+        )
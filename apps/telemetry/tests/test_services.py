@@ -0,0 +1,82 @@
+import pytest
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from apps.telemetry import services
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+
+    def bulk_write(self, operations, ordered=True):
+        assert ordered is False
+        stored = self.database.documents.setdefault(self.name, {})
+        errors = []
+        for index, operation in enumerate(operations):
+            document = operation._doc
+            if document["_id"] in stored:
+                errors.append({"index": index, "code": self.database.error_code})
+            else:
+                stored[document["_id"]] = document
+        self.database.calls += 1
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class FakeDatabase:
+    def __init__(self, error_code=services.DUPLICATE_KEY_ERROR):
+        self.documents = {}
+        self.calls = 0
+        self.error_code = error_code
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+
+def _messages():
+    return [
+        {
+            "event_id": str(ObjectId()),
+            "topic": topic,
+            "device_id": device_id,
+            "timestamp": "2026-01-01T00:00:00Z",
+            "payload": {"value": 1},
+        }
+        for topic, device_id in [
+            ("MQTT_RT_DATA", "a"),
+            ("MQTT_RT_DATA", "b"),
+            ("MQTT_DAY_DATA", "a"),
+        ]
+    ]
+
+
+def test_store_events_mongo_writes_one_bulk_per_collection_and_retries_safely(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(services, "get_mongo_database", lambda: database)
+    messages = _messages()
+
+    services.store_events_mongo(messages)
+    services.store_events_mongo(messages)
+
+    assert database.calls == 6
+    assert {name: len(docs) for name, docs in database.documents.items()} == {
+        "grid_rt_data": 2,
+        "grid_day_data": 1,
+        "telemetry_events": 3,
+    }
+    assert set(database.documents["telemetry_events"]) == {
+        ObjectId(message["event_id"]) for message in messages
+    }
+    assert "event_id" in messages[0]
+
+
+def test_store_events_mongo_raises_non_duplicate_errors(monkeypatch):
+    database = FakeDatabase(error_code=121)
+    monkeypatch.setattr(services, "get_mongo_database", lambda: database)
+    messages = _messages()
+    services.store_events_mongo(messages)
+
+    with pytest.raises(BulkWriteError):
+        services.store_events_mongo(messages)
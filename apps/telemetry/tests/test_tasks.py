@@ -0,0 +1,60 @@
+from apps.telemetry import tasks
+from apps.telemetry.services import DEVICE_TOPICS_KEY
+
+
+class FakeRedis:
+    def __init__(self):
+        self.sets = {}
+        self.zsets = {}
+        self.values = {}
+
+    def scan_iter(self, match=None):
+        raise AssertionError("the offline check must not scan the keyspace")
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member)
+
+    def srem(self, key, member):
+        self.sets.get(key, set()).discard(member)
+
+    def exists(self, key):
+        return int(key in self.zsets)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.zsets.get(key, {})
+        for member in [m for m, score in members.items() if low <= score <= high]:
+            del members[member]
+
+    def zrangebyscore(self, key, low, high):
+        return [m for m, score in self.zsets.get(key, {}).items() if low <= score <= high]
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+
+def test_offline_status_iterates_tracked_topics(monkeypatch, settings):
+    settings.TELEMETRY_DEVICE_TRACK_SECONDS = 0
+    redis = FakeRedis()
+    redis.sets[DEVICE_TOPICS_KEY] = {"MQTT_RT_DATA", "expired/topic"}
+    redis.zsets["telemetry:devices:MQTT_RT_DATA"] = {"gw-1": 0}
+    broadcasts = []
+    monkeypatch.setattr(tasks, "get_redis", lambda: redis)
+    monkeypatch.setattr(
+        tasks, "broadcast_device_status", lambda *args, **kwargs: broadcasts.append(args)
+    )
+
+    tasks.emit_device_offline_status()
+    tasks.emit_device_offline_status()
+
+    assert broadcasts == [("gw-1", "offline")]
+    assert redis.values["telemetry:status:MQTT_RT_DATA:gw-1"] == "offline"
+    assert redis.sets[DEVICE_TOPICS_KEY] == {"MQTT_RT_DATA"}
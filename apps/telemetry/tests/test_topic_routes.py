@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from apps.telemetry.schemas import EnvironmentPayload
+from apps.telemetry.topic_routes import TopicRoute, TopicRouter, get_router, load_routes
+
+
+def test_router_prefers_literal_then_single_then_multi_level_filters():
+    router = TopicRouter(
+        [
+            TopicRoute("sites/+/ENV_01", collections=("single",)),
+            TopicRoute("sites/#", collections=("multi",)),
+            TopicRoute("sites/PURBACHAL/ENV_01", collections=("literal",)),
+            TopicRoute("#", collections=("catch_all",)),
+        ]
+    )
+
+    assert router.match("sites/PURBACHAL/ENV_01").collections == ("literal",)
+    assert router.match("sites/DHAKA/ENV_01").collections == ("single",)
+    assert router.match("sites/DHAKA/ENV_01/raw").collections == ("multi",)
+    assert router.match("sites").collections == ("multi",)
+    assert router.match("other").collections == ("catch_all",)
+    assert router.match("$SYS/broker") is None
+    assert router.match("sites/DHAKA/ENV_01") is router.match("sites/DHAKA/ENV_01")
+
+
+def test_router_rejects_malformed_filters():
+    with pytest.raises(ValueError):
+        TopicRouter([TopicRoute("sites/#/ENV_01")])
+    with pytest.raises(ValueError):
+        TopicRouter([TopicRoute("sites/a+")])
+    with pytest.raises(ValueError):
+        TopicRouter([TopicRoute("a"), TopicRoute("a")])
+
+
+def test_route_file_adds_sites_without_code_changes(tmp_path, settings):
+    settings.TELEMETRY_ENV_STALE_SECONDS = 45
+    path = tmp_path / "routes.json"
+    path.write_text(
+        json.dumps(
+            {
+                "routes": [
+                    {
+                        "filter": "CCCL/+/ENV_01",
+                        "payload": "environment",
+                        "collections": ["environment_data"],
+                        "default_device_id": "ENV_DEFAULT",
+                        "stale_seconds": {"setting": "TELEMETRY_ENV_STALE_SECONDS"},
+                    }
+                ]
+            }
+        )
+    )
+
+    route = load_routes(path).match("CCCL/GULSHAN/ENV_01")
+
+    assert route.payload_model is EnvironmentPayload
+    assert route.default_device_id == "ENV_DEFAULT"
+    assert route.stale_seconds == 45
+    assert get_router().match("MQTT_ENY_NOW").collections == (
+        "grid_eny_now_data",
+        "today_grid_eny_now_data",
+        "last_7_days_grid_eny_now_data",
+    )
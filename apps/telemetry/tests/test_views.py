@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.telemetry.api import views
+
+
+class FakeCursor(list):
+    def sort(self, *args):
+        return self
+
+    def skip(self, offset):
+        return self
+
+    def limit(self, size):
+        return self
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.queried = []
+
+    def __getitem__(self, name):
+        self.queried.append(name)
+        return SimpleNamespace(find=lambda query: FakeCursor(), count_documents=lambda query: 0)
+
+
+@pytest.mark.parametrize(
+    ("mode", "expected"),
+    [("single", "solar_data"), ("triple", "today_solar_data")],
+)
+def test_solar_view_queries_collection_for_storage_mode(monkeypatch, settings, mode, expected):
+    settings.TCP_STORAGE_MODE = mode
+    database = FakeDatabase()
+    monkeypatch.setattr(views, "get_mongo_database", lambda: database)
+    monkeypatch.setattr(views.SolarDataListView, "throttle_classes", [])
+    request = APIRequestFactory().get(
+        "/api/telemetry/solar/",
+        {"start_time": "2024-01-01T00:00:00Z", "end_time": "2024-01-01T06:00:00Z"},
+    )
+    force_authenticate(request, user=SimpleNamespace(is_authenticated=True, pk=1))
+
+    response = views.SolarDataListView.as_view()(request)
+
+    assert response.status_code == 200
+    assert response.data["count"] == 0
+    assert set(database.queried) == {expected}
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Sequence
+
+from django.conf import settings
+from pydantic import BaseModel
+
+from apps.telemetry.schemas import PAYLOAD_SCHEMAS
+
+logger = logging.getLogger("telemetry.topic_routes")
+
+DEFAULT_ROUTES_FILE = Path(__file__).with_name("topic_routes.json")
+MATCH_CACHE_SIZE = 4096
+
+
+def flatten_generator_reading(message: dict) -> dict:
+    """Flatten the generator's ``data[0]`` into ``{"timestamp": tp, <point id>: val}``.
+
+    Validation (including the timestamp) happens once, against the route's payload schema.
+    """
+    payload = message.get("payload")
+    if not isinstance(payload, dict):
+        return message
+    data_point = payload.get("data", [{}])[0]
+    if not data_point:
+        return message
+    flattened = {"timestamp": data_point.get("tp")}
+    for point in data_point.get("point", []):
+        if point.get("id") is not None:
+            flattened[str(point.get("id"))] = point.get("val")
+    message["payload"] = flattened
+    return message
+
+
+NORMALIZERS: Dict[str, Callable[[dict], dict]] = {"generator": flatten_generator_reading}
+
+
+@dataclass(frozen=True, slots=True)
+class TopicRoute:
+    filter: str
+    payload_model: type[BaseModel] | None = None
+    normalizer: Callable[[dict], dict] | None = None
+    collections: tuple[str, ...] = ()
+    default_device_id: str | None = None
+    stale_seconds: int | None = None
+
+
+class _Node:
+    __slots__ = ("children", "route")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.route: TopicRoute | None = None
+
+
+class TopicRouter:
+    """Maps topics to routes through a trie of MQTT topic filters.
+
+    Literal levels win over ``+``, which wins over ``#``; as in MQTT, wildcards never match
+    a first level starting with ``$``. Results (misses included) are cached per topic, so
+    steady-state dispatch is one dict lookup.
+    """
+
+    def __init__(self, routes: Sequence[TopicRoute]) -> None:
+        self._root = _Node()
+        self.routes = tuple(routes)
+        for route in self.routes:
+            self._insert(route)
+        self._cache: Dict[str, TopicRoute | None] = {}
+
+    def match(self, topic: str) -> TopicRoute | None:
+        try:
+            return self._cache[topic]
+        except KeyError:
+            pass
+        route = self._walk(self._root, topic.split("/"), 0)
+        if len(self._cache) >= MATCH_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[topic] = route
+        return route
+
+    def _insert(self, route: TopicRoute) -> None:
+        levels = route.filter.split("/")
+        node = self._root
+        for index, level in enumerate(levels):
+            if "#" in level and (level != "#" or index != len(levels) - 1):
+                raise ValueError(f"'#' must be the whole last level in {route.filter!r}")
+            if "+" in level and level != "+":
+                raise ValueError(f"'+' must be a whole level in {route.filter!r}")
+            node = node.children.setdefault(level, _Node())
+        if node.route is not None:
+            raise ValueError(f"duplicate topic filter {route.filter!r}")
+        node.route = route
+
+    def _walk(self, node: _Node, levels: list[str], index: int) -> TopicRoute | None:
+        multi = node.children.get("#")
+        if index == len(levels):
+            if node.route is not None:
+                return node.route
+            return multi.route if multi is not None else None
+        level = levels[index]
+        child = node.children.get(level)
+        if child is not None:
+            route = self._walk(child, levels, index + 1)
+            if route is not None:
+                return route
+        if index == 0 and level.startswith("$"):
+            return None
+        single = node.children.get("+")
+        if single is not None:
+            route = self._walk(single, levels, index + 1)
+            if route is not None:
+                return route
+        return multi.route if multi is not None else None
+
+
+def compile_route(spec: dict) -> TopicRoute:
+    payload = spec.get("payload")
+    if payload is not None and payload not in PAYLOAD_SCHEMAS:
+        raise ValueError(f"unknown payload schema {payload!r} for {spec['filter']}")
+    normalizer = spec.get("normalizer")
+    if normalizer is not None and normalizer not in NORMALIZERS:
+        raise ValueError(f"unknown normalizer {normalizer!r} for {spec['filter']}")
+    stale = spec.get("stale_seconds")
+    if isinstance(stale, dict):
+        stale = getattr(settings, stale["setting"], stale.get("default"))
+    return TopicRoute(
+        filter=spec["filter"],
+        payload_model=PAYLOAD_SCHEMAS[payload] if payload is not None else None,
+        normalizer=NORMALIZERS[normalizer] if normalizer is not None else None,
+        collections=tuple(spec.get("collections", ())),
+        default_device_id=spec.get("default_device_id"),
+        stale_seconds=int(stale) if stale is not None else None,
+    )
+
+
+def load_routes(path: str | Path) -> TopicRouter:
+    """Compile every route in a JSON route file."""
+    with open(path, encoding="utf-8") as handle:
+        spec = json.load(handle)
+    router = TopicRouter([compile_route(route) for route in spec["routes"]])
+    logger.info("loaded %s topic route(s) from %s", len(router.routes), path)
+    return router
+
+
+@lru_cache(maxsize=1)
+def get_router() -> TopicRouter:
+    """Routes from ``TELEMETRY_TOPIC_ROUTES``, or the bundled ``topic_routes.json``."""
+    path = getattr(settings, "TELEMETRY_TOPIC_ROUTES", "") or DEFAULT_ROUTES_FILE
+    return load_routes(path)
+
+
+def route_for(topic) -> TopicRoute | None:
+    if not isinstance(topic, str):
+        return None
+    return get_router().match(topic)
@@ -2,12 +2,15 @@ from __future__ import annotations
 
 from pydantic import ValidationError
 
-from apps.telemetry.schemas import validate_message
+from apps.telemetry.schemas import TelemetryMessage, validate_message
+from apps.telemetry.topic_routes import TopicRoute, route_for
 
 
-def validate_packet(message: dict) -> None:
+def validate_packet(message: dict, route: TopicRoute | None = None) -> TelemetryMessage:
+    if route is None:
+        route = route_for(message.get("topic"))
     try:
-        validate_message(message)
+        return validate_message(message, route.payload_model if route is not None else None)
     except ValidationError as exc:
         raise ValueError(_format_validation_error(exc)) from exc
 
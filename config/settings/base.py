@@ -58,11 +58,13 @@ TELEMETRY_ENV_STALE_SECONDS = env.int("TELEMETRY_ENV_STALE_SECONDS", default=60)
 TELEMETRY_ENY_NOW_STALE_SECONDS = env.int("TELEMETRY_ENY_NOW_STALE_SECONDS", default=1020)
 TELEMETRY_SOLAR_STALE_SECONDS = env.int("TELEMETRY_SOLAR_STALE_SECONDS", default=150)
 TELEMETRY_DEVICE_TRACK_SECONDS = env.int("TELEMETRY_DEVICE_TRACK_SECONDS", default=86400)
+TELEMETRY_TOPIC_ROUTES = env.str("TELEMETRY_TOPIC_ROUTES", default="")
 MONGO_TODAY_TTL_SECONDS = env.int("MONGO_TODAY_TTL_SECONDS")
 MONGO_LAST_7_DAYS_TTL_SECONDS = env.int("MONGO_LAST_7_DAYS_TTL_SECONDS")
 MONGO_LAST_30_DAYS_TTL_SECONDS = env.int("MONGO_LAST_30_DAYS_TTL_SECONDS")
 MONGO_LAST_6_MONTHS_TTL_SECONDS = env.int("MONGO_LAST_6_MONTHS_TTL_SECONDS")
 MONGO_THIS_YEAR_TTL_SECONDS = env.int("MONGO_THIS_YEAR_TTL_SECONDS")
+TCP_STORAGE_MODE = env.str("TCP_STORAGE_MODE", default="triple").strip().lower()
 TCP_HEALTH_URL = env.str("TCP_HEALTH_URL", default="http://tcp:7001/health")
 MQTT_HEALTH_URL = env.str("MQTT_HEALTH_URL", default="http://mqtt:7002/health")
 if not REDIS_URL and not DEBUG and ENVIRONMENT != "test":
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.dev")
+os.environ.setdefault("MQTT_LOG_LEVEL", "WARNING")
+# A bounded queue that drops when full is what "sustained rate before drops" measures.
+os.environ.setdefault("MQTT_MESSAGE_QUEUE", "10000")
+os.environ.setdefault("MQTT_DROP_ON_FULL", "true")
+
+import django  # noqa: E402
+
+django.setup()
+
+import logging  # noqa: E402
+
+logging.getLogger("mqtt").setLevel(os.environ["MQTT_LOG_LEVEL"].upper())
+
+from services.mqtt.bench import TOPICS, TrafficProfile, run_benchmark  # noqa: E402
+
+
+def _mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in TOPICS:
+            raise argparse.ArgumentTypeError(f"unknown kind {kind!r}; expected {sorted(TOPICS)}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load-test the MQTT processing pipeline with synthetic meter traffic."
+    )
+    parser.add_argument(
+        "--rates",
+        default="1000,2000,5000,10000",
+        help="comma-separated messages/s per step; 0 publishes as fast as possible",
+    )
+    parser.add_argument("--step-seconds", type=float, default=30.0)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--mix", type=_mix, default="rt=4,eny=2,env=1,generator=1")
+    parser.add_argument("--parts", type=int, default=2, help="messages per RT/energy reading")
+    parser.add_argument("--store", choices=["memory", "mongo", "none"], default="memory")
+    parser.add_argument("--insert-latency-ms", type=float, default=0.0, help="memory store only")
+    parser.add_argument("--side-effects", action="store_true", help="run WebSocket fan-out")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    profile = TrafficProfile(
+        devices=args.devices,
+        mix=args.mix if isinstance(args.mix, dict) else _mix(args.mix),
+        parts=args.parts,
+        seed=args.seed,
+    )
+    report = run_benchmark(
+        rates=[float(rate) for rate in args.rates.split(",") if rate.strip()],
+        step_seconds=args.step_seconds,
+        profile=profile,
+        store=args.store,
+        insert_latency_ms=args.insert_latency_ms,
+        side_effects=args.side_effects,
+        sample_interval=args.sample_interval,
+    )
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.dev")
+os.environ.setdefault("TCP_HEALTH_PORT", "0")
+os.environ.setdefault("TCP_LOG_LEVEL", "WARNING")
+# Every simulated gateway connects from loopback; per-IP and accept-rate limits would cap it.
+os.environ.setdefault("TCP_MAX_CONNECTIONS_PER_IP", "0")
+os.environ.setdefault("TCP_ACCEPT_RATE", "0")
+
+from services.tcp.bench import run_benchmark  # noqa: E402
+from services.tcp.server import (  # noqa: E402
+    DEFAULT_RESPONSE_CODECS,
+    DEFAULT_RESPONSE_PACKETS,
+    HEARTBEAT_PACKET,
+)
+from services.tcp.simulator import FleetProfile, register_formats  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load-test the TCP gateway server with a simulated Modbus gateway fleet."
+    )
+    parser.add_argument("--gateways", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds to spread connects")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between heartbeats")
+    parser.add_argument("--engine", choices=["threaded", "asyncio"], default="asyncio")
+    parser.add_argument("--store", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--insert-latency-ms", type=float, default=0.0, help="memory store only")
+    parser.add_argument("--slow-fraction", type=float, default=0.0)
+    parser.add_argument("--slow-delay", type=float, default=0.5)
+    parser.add_argument("--silent-fraction", type=float, default=0.0)
+    parser.add_argument("--side-effects", action="store_true", help="run Redis/WS fan-out")
+    parser.add_argument("--fleet-processes", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    pipelined = os.getenv("TCP_POLL_MODE", "cycle").strip().lower() == "pipelined"
+    profile = FleetProfile(
+        heartbeat=HEARTBEAT_PACKET,
+        register_formats=register_formats(DEFAULT_RESPONSE_PACKETS, DEFAULT_RESPONSE_CODECS),
+        requests_per_heartbeat=len(DEFAULT_RESPONSE_PACKETS) if pipelined else 1,
+        heartbeat_interval=args.interval,
+        slow_fraction=args.slow_fraction,
+        slow_delay=args.slow_delay,
+        silent_fraction=args.silent_fraction,
+        ramp_seconds=args.ramp,
+        seed=args.seed,
+    )
+    report = run_benchmark(
+        gateways=args.gateways,
+        duration=args.duration,
+        engine=args.engine,
+        store=args.store,
+        insert_latency_ms=args.insert_latency_ms,
+        side_effects=args.side_effects,
+        fleet_processes=args.fleet_processes,
+        profile=profile,
+    )
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,24 @@
+import argparse
+import os
+
 from services.tcp.server import run
+from services.tcp.supervisor import run_supervisor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the TCP solar gateway server.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("TCP_WORKERS", "1")),
+        help="number of worker processes sharing the port via SO_REUSEPORT",
+    )
+    args = parser.parse_args()
+    if args.workers > 1:
+        run_supervisor(args.workers)
+    else:
+        run()
 
 
 if __name__ == "__main__":
-    run()
+    main()
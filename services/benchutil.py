@@ -0,0 +1,41 @@
+"""Helpers shared by the TCP and MQTT benchmarks."""
+
+from __future__ import annotations
+
+import os
+import resource
+import time
+from typing import List
+
+
+class MemoryCollection:
+    """In-memory stand-in for a Mongo collection: counts inserts, optionally adds latency."""
+
+    def __init__(self, insert_latency_ms: float = 0.0) -> None:
+        self.insert_latency_ms = insert_latency_ms
+        self.count = 0
+
+    def insert_many(self, documents: List[dict], ordered: bool = True):
+        if self.insert_latency_ms:
+            time.sleep(self.insert_latency_ms / 1000)
+        self.count += len(documents)
+
+    def create_index(self, *args, **kwargs) -> None:
+        return None
+
+
+def percentile(samples: List[float], fraction: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def rss_mb() -> float:
+    """Resident set size of this process, falling back to peak RSS off Linux."""
+    try:
+        with open("/proc/self/statm") as handle:
+            pages = int(handle.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except OSError:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
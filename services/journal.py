@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+import bson
+from bson.errors import InvalidDocument
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger("ingest.journal")
+
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+LOCK_NAME = ".lock"
+DUPLICATE_KEY_ERROR = 11000
+
+
+class IngestJournal:
+    """Append-only, segment-rotated on-disk journal of BSON records.
+
+    Records are framed as ``length | crc32 | bson`` so a torn write at the tail of a segment
+    is detected and skipped on replay. Writers append to the active segment; replay only
+    reads sealed segments and deletes each one once every record in it was handled.
+
+    Each instance writes to its own subdirectory of ``directory`` and holds an exclusive
+    ``flock`` on it, so two processes sharing the directory during a hot restart never
+    touch each other's segments. Subdirectories whose lock is free belong to processes that
+    are gone; their segments (and any left directly in ``directory``) are adopted and
+    replayed.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        *,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 2 * 1024 * 1024 * 1024,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        self.root = Path(directory)
+        self.directory = self.root / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.directory.mkdir(parents=True)
+        self._owner_lock = _lock_directory(self.directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._last_fsync = time.monotonic()
+        self._offsets: Dict[Path, int] = {}
+        self._metrics = {
+            "appended": 0,
+            "dropped": 0,
+            "replayed": 0,
+            "corrupt_records": 0,
+        }
+        self._sequence = 0
+        self._total_bytes = 0
+        self._active_path: Path | None = None
+        self._active_file = None
+        self._active_size = 0
+        with self._lock:
+            self._adopt_orphans_locked()
+
+    def append(self, record: dict) -> bool:
+        try:
+            body = bson.encode(record)
+        except (InvalidDocument, TypeError, ValueError) as exc:
+            logger.warning("journal record not encodable: %s", exc)
+            with self._lock:
+                self._metrics["dropped"] += 1
+            return False
+        entry = RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+        with self._lock:
+            if self._total_bytes + len(entry) > self.max_bytes:
+                self._metrics["dropped"] += 1
+                return False
+            try:
+                if self._active_file is None or self._active_size >= self.segment_bytes:
+                    self._rotate_locked()
+                self._active_file.write(entry)
+                self._active_file.flush()
+                now = time.monotonic()
+                if now - self._last_fsync >= self.fsync_interval:
+                    os.fsync(self._active_file.fileno())
+                    self._last_fsync = now
+            except OSError as exc:
+                logger.error("journal append failed: %s", exc)
+                self._metrics["dropped"] += 1
+                return False
+            self._active_size += len(entry)
+            self._total_bytes += len(entry)
+            self._metrics["appended"] += 1
+        return True
+
+    def replay(
+        self, handler: Callable[[List[dict]], List[dict] | None], batch_size: int = 1000
+    ) -> int:
+        """Feed sealed records to ``handler`` in batches; return how many were handled.
+
+        If ``handler`` raises, the exception propagates and the unhandled remainder of the
+        segment is retried on the next call. A handler that only partly handled a batch
+        returns what is left; those records are journaled again and the pass stops there,
+        so the parts already handled are not repeated.
+        """
+        with self._lock:
+            if self._active_size and self._active_path is not None:
+                self._seal_locked()
+            self._adopt_orphans_locked()
+            sealed = [path for path in self._segments() if path != self._active_path]
+        handled = 0
+        for path in sealed:
+            batch: List[dict] = []
+            complete = True
+            for record, end in self._read_segment(path, self._offsets.get(path, 0)):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    complete = self._deliver(handler, batch)
+                    handled += len(batch)
+                    self._offsets[path] = end
+                    batch = []
+                    if not complete:
+                        break
+            else:
+                if batch:
+                    complete = self._deliver(handler, batch)
+                    handled += len(batch)
+                self._remove_segment(path)
+            if not complete:
+                break
+        if handled:
+            with self._lock:
+                self._metrics["replayed"] += handled
+        return handled
+
+    def _deliver(
+        self, handler: Callable[[List[dict]], List[dict] | None], batch: List[dict]
+    ) -> bool:
+        """Hand ``batch`` to ``handler``; ``False`` when records were left over."""
+        leftovers = handler(batch) or []
+        for record in leftovers:
+            if not self.append(record):
+                raise RuntimeError("journal full; partially replayed batch kept for retry")
+        return not leftovers
+
+    def metrics(self) -> dict:
+        with self._lock:
+            payload = dict(self._metrics)
+            payload["bytes"] = self._total_bytes
+        payload["segments"] = len(self._segments())
+        return payload
+
+    def close(self) -> None:
+        """Seal the active segment and release the directory for another process to adopt."""
+        with self._lock:
+            self._seal_locked()
+            if self._owner_lock is None:
+                return
+            if not self._segments():
+                _remove_directory(self.directory)
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    def _segments(self) -> List[Path]:
+        return _segments(self.directory)
+
+    def _adopt_orphans_locked(self) -> None:
+        """Move segments of journals whose owner exited into this journal's directory."""
+        self._adopt_segments_locked(_segments(self.root))
+        for directory in sorted(self.root.iterdir()):
+            if directory == self.directory or not (directory / LOCK_NAME).exists():
+                continue
+            try:
+                lock = _lock_directory(directory, existing=True)
+            except OSError:
+                continue  # still owned by a live process
+            try:
+                self._adopt_segments_locked(_segments(directory))
+                _remove_directory(directory)
+            finally:
+                lock.close()
+
+    def _adopt_segments_locked(self, segments: List[Path]) -> None:
+        for path in segments:
+            self._sequence += 1
+            target = self.directory / f"{SEGMENT_PREFIX}{self._sequence:012d}{SEGMENT_SUFFIX}"
+            try:
+                path.rename(target)
+                self._total_bytes += target.stat().st_size
+            except OSError as exc:
+                logger.warning("journal segment adoption failed for %s: %s", path, exc)
+                continue
+            logger.info("adopted orphaned journal segment %s", path)
+
+    def _rotate_locked(self) -> None:
+        self._seal_locked()
+        self._sequence += 1
+        name = f"{SEGMENT_PREFIX}{self._sequence:012d}{SEGMENT_SUFFIX}"
+        self._active_path = self.directory / name
+        self._active_file = open(self._active_path, "ab")
+        self._active_size = 0
+
+    def _seal_locked(self) -> None:
+        if self._active_file is None:
+            return
+        try:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+        except OSError as exc:
+            logger.warning("journal fsync failed: %s", exc)
+        self._active_file.close()
+        self._active_file = None
+        self._active_path = None
+        self._active_size = 0
+
+    def _read_segment(self, path: Path, offset: int) -> Iterator[tuple[dict, int]]:
+        with open(path, "rb") as handle:
+            handle.seek(offset)
+            while True:
+                header = handle.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, checksum = RECORD_HEADER.unpack(header)
+                body = handle.read(length)
+                if len(body) < length or zlib.crc32(body) != checksum:
+                    logger.warning("truncated or corrupt journal record in %s", path.name)
+                    with self._lock:
+                        self._metrics["corrupt_records"] += 1
+                    return
+                offset += RECORD_HEADER.size + length
+                yield bson.decode(body), offset
+
+    def _remove_segment(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError as exc:
+            logger.warning("journal segment cleanup failed for %s: %s", path.name, exc)
+            return
+        self._offsets.pop(path, None)
+        with self._lock:
+            self._total_bytes = max(self._total_bytes - size, 0)
+
+
+class JournalReplayer:
+    """Background thread that drains a journal through ``handler`` until it succeeds."""
+
+    def __init__(
+        self,
+        journal: IngestJournal,
+        handler: Callable[[List[dict]], List[dict] | None],
+        *,
+        name: str,
+        batch_size: int = 1000,
+        interval: float = 2.0,
+    ) -> None:
+        self.journal = journal
+        self.handler = handler
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.errors = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                handled = self.journal.replay(self.handler, batch_size=self.batch_size)
+            except Exception as exc:
+                self.errors += 1
+                logger.warning("journal replay deferred: %s", exc)
+                continue
+            if handled:
+                logger.info("replayed %s journaled record(s)", handled)
+
+
+def journal_record(document: dict, collections: List[str]) -> dict:
+    """Wrap a Mongo document for the journal with the collections it still has to reach.
+
+    ``_id`` is pinned so collections with a unique ``_id`` skip a document an earlier
+    attempt already stored. Time-series collections have no such index, so a record must
+    only ever list the collections that are still missing the document.
+    """
+    document.setdefault("_id", ObjectId())
+    return {"collections": list(collections), "document": document}
+
+
+def insert_unstored(collection, documents: List[dict]) -> List[int]:
+    """Insert ``documents`` unordered; return the indexes ``collection`` did not store.
+
+    A duplicate key counts as stored (an earlier attempt wrote it). Errors other than a
+    ``BulkWriteError`` propagate.
+    """
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        if exc.details.get("writeConcernErrors"):
+            return list(range(len(documents)))
+        # Unordered inserts keep going past a bad document; only the reported ones are missing.
+        return sorted(
+            {
+                error["index"]
+                for error in exc.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY_ERROR
+            }
+        )
+    return []
+
+
+def write_journal_records(db, records: List[dict]) -> List[dict]:
+    """Replay handler that bulk-inserts journaled documents grouped by collection.
+
+    Returns the records some collection did not store, narrowed to those collections, so a
+    retry never writes a collection twice. Raises ``PyMongoError`` when nothing was stored.
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, record in enumerate(records):
+        for collection in record.get("collections", []):
+            groups.setdefault(collection, []).append(index)
+    missing: Dict[int, List[str]] = {}
+    error: PyMongoError | None = None
+    for collection, indexes in groups.items():
+        documents = [records[index]["document"] for index in indexes]
+        try:
+            unstored = [
+                indexes[position] for position in insert_unstored(db[collection], documents)
+            ]
+        except PyMongoError as exc:
+            error = exc
+            unstored = indexes
+        for index in unstored:
+            missing.setdefault(index, []).append(collection)
+    if not missing:
+        return []
+    if sum(map(len, missing.values())) == sum(map(len, groups.values())):
+        raise error or PyMongoError("no journaled document could be stored")
+    return [
+        {"collections": missing[index], "document": records[index]["document"]}
+        for index in sorted(missing)
+    ]
+
+
+def journal_from_env(name: str) -> IngestJournal | None:
+    """Build the journal for ``name`` under ``INGEST_JOURNAL_DIR``; ``None`` when unset."""
+    base = os.getenv("INGEST_JOURNAL_DIR", "").strip()
+    if not base:
+        return None
+    return IngestJournal(
+        Path(base) / name,
+        segment_bytes=int(os.getenv("INGEST_JOURNAL_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+        max_bytes=int(os.getenv("INGEST_JOURNAL_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+        fsync_interval=float(os.getenv("INGEST_JOURNAL_FSYNC_INTERVAL", "1.0")),
+    )
+
+
+def replayer_from_env(
+    journal: IngestJournal,
+    handler: Callable[[List[dict]], List[dict] | None],
+    *,
+    name: str,
+) -> JournalReplayer:
+    return JournalReplayer(
+        journal,
+        handler,
+        name=name,
+        batch_size=int(os.getenv("INGEST_JOURNAL_REPLAY_BATCH", "1000")),
+        interval=float(os.getenv("INGEST_JOURNAL_REPLAY_INTERVAL", "2.0")),
+    )
+
+
+def _segments(directory: Path) -> List[Path]:
+    return sorted(directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+
+def _lock_directory(directory: Path, *, existing: bool = False):
+    """Hold an exclusive ``flock`` on ``directory``; raise ``OSError`` when it is taken.
+
+    A new owner locks a temporary file and only then renames it to ``LOCK_NAME``, so no
+    other process can see an unlocked lock file for a live journal.
+    """
+    path = directory / (LOCK_NAME if existing else f"{LOCK_NAME}.new")
+    handle = open(path, "ab")
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if not existing:
+            path.rename(directory / LOCK_NAME)
+    except OSError:
+        handle.close()
+        raise
+    return handle
+
+
+def _remove_directory(directory: Path) -> None:
+    try:
+        (directory / LOCK_NAME).unlink(missing_ok=True)
+        directory.rmdir()
+    except OSError as exc:
+        logger.warning("journal directory cleanup failed for %s: %s", directory, exc)
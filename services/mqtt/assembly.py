@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+BufferKey = Tuple[str, str | None, str | None]
+
+
+class PacketAssembler:
+    """Merges multi-part payloads (``isend`` = 0 ... 1) into one packet.
+
+    Parts are buffered under (topic, device id, time). Buffers live in an ``OrderedDict``
+    ordered by last update, so expiring buffers idle for ``ttl_seconds`` and evicting the
+    oldest ones when ``max_buffers`` or ``max_bytes`` is exceeded only ever touch the
+    front of the dict: amortized O(1) per part. Expired and evicted buffers are partial
+    packets and are counted, not stored.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_buffers: int, max_bytes: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_buffers = max_buffers
+        self.max_bytes = max_bytes
+        self._buffers: OrderedDict[BufferKey, list] = OrderedDict()
+        self._bytes = 0
+        self._metrics = {"completed": 0, "expired": 0, "evicted": 0}
+
+    def add(self, topic: str, payload, size: int, now: float | None = None, timestamp=None):
+        """Return the complete packet, ``payload`` itself when unsplit, or ``None``."""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        if not isinstance(payload, dict):
+            return payload
+        is_end = payload.get("isend")
+        if is_end is None:
+            return payload
+        key = buffer_key(topic, payload)
+        entry = self._buffers.pop(key, None)
+        if entry is None:
+            entry = [now, 0, {}]
+        entry[2].update(payload)
+        if str(is_end) == "1":
+            self._bytes -= entry[1]
+            self._metrics["completed"] += 1
+            return entry[2]
+        entry[0] = now
+        entry[1] += size
+        self._bytes += size
+        self._buffers[key] = entry
+        while self._buffers and (
+            len(self._buffers) > self.max_buffers > 0 or self._bytes > self.max_bytes > 0
+        ):
+            self._drop_oldest("evicted")
+        return None
+
+    def ready(self, now: float | None = None) -> List[Tuple[str, object, dict]]:
+        # Complete packets are returned by ``add`` directly.
+        return []
+
+    def expire(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        expired = 0
+        while self._buffers:
+            updated = next(iter(self._buffers.values()))[0]
+            if now - updated <= self.ttl_seconds:
+                break
+            self._drop_oldest("expired")
+            expired += 1
+        return expired
+
+    def metrics(self) -> dict:
+        payload = dict(self._metrics)
+        payload["partial_packets"] = payload["expired"] + payload["evicted"]
+        payload["open_buffers"] = len(self._buffers)
+        payload["buffered_bytes"] = self._bytes
+        return payload
+
+    def _drop_oldest(self, reason: str) -> None:
+        _, entry = self._buffers.popitem(last=False)
+        self._bytes -= entry[1]
+        self._metrics[reason] += 1
+
+
+def buffer_key(topic: str, payload: dict) -> BufferKey:
+    device_id = payload.get("id") or payload.get("device_id")
+    time_key = payload.get("time")
+    return (
+        topic,
+        str(device_id) if device_id is not None else None,
+        str(time_key) if time_key is not None else None,
+    )
+
+
+class SharedPacketAssembler:
+    """Packet assembly shared by every subscriber replica through Redis.
+
+    With a shared subscription the broker spreads one packet's parts over replicas, so
+    parts are merged field by field into a Redis hash per (topic, device id, time) that
+    expires after ``ttl_seconds`` of inactivity. The final part marks the hash ready
+    ``settle_ms`` later, leaving time for parts still queued on other replicas; ``ready``
+    then claims it with a ``ZREM`` that only one replica can win, checking at most every
+    ``poll_ms``. Deadlines use the Redis server clock, so replicas with skewed clocks agree.
+
+    A claimed hash is replaced by a marker that lives as long as a buffer would. Parts that
+    arrive after the claim (late or redelivered) land on the marker and are dropped and
+    counted as ``late_parts`` instead of opening a new, partial packet. ``isend`` is taken
+    from the final part only, so a part applied after it cannot reopen the packet.
+    """
+
+    KEY_PREFIX = "mqtt:assembly:"
+    READY_KEY = "mqtt:assembly:ready"
+    TIMESTAMP_FIELD = "\0timestamp"
+    CLAIMED_FIELD = "\0claimed"
+
+    def __init__(
+        self,
+        redis,
+        *,
+        ttl_seconds: float,
+        settle_ms: int,
+        poll_ms: int = 100,
+        max_claims: int = 500,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.settle_ms = settle_ms
+        self.poll_ms = poll_ms
+        self.max_claims = max_claims
+        self._next_poll = 0.0
+        self._redis = redis
+        self._metrics = {
+            "parts": 0,
+            "completed": 0,
+            "claimed": 0,
+            "lost_claims": 0,
+            "late_parts": 0,
+        }
+
+    def add(self, topic: str, payload, size: int, now: float | None = None, timestamp=None):
+        """Return ``payload`` itself when unsplit; parts are stored and give ``None``.
+
+        ``now`` overrides the Redis server time the settle deadline is based on.
+        """
+        if not isinstance(payload, dict):
+            return payload
+        is_end = payload.get("isend")
+        if is_end is None:
+            return payload
+        final = str(is_end) == "1"
+        key = self.KEY_PREFIX + json.dumps(buffer_key(topic, payload))
+        fields = {
+            name: json.dumps(value) for name, value in payload.items() if final or name != "isend"
+        }
+        if final:
+            fields[self.TIMESTAMP_FIELD] = json.dumps(timestamp)
+            deadline = (self._server_time() if now is None else now) + self.settle_ms / 1000
+        pipe = self._redis.pipeline()
+        pipe.hexists(key, self.CLAIMED_FIELD)
+        pipe.hset(key, mapping=fields)
+        if final:
+            pipe.zadd(self.READY_KEY, {key: deadline})
+        pipe.expire(key, int(self.ttl_seconds) + 1)
+        claimed = pipe.execute()[0]
+        self._metrics["parts"] += 1
+        if claimed:
+            self._metrics["late_parts"] += 1
+        elif final:
+            self._metrics["completed"] += 1
+        return None
+
+    def ready(self, now: float | None = None) -> List[Tuple[str, object, dict]]:
+        """Claim settled packets: ``(topic, timestamp of the final part, payload)`` each.
+
+        ``now`` overrides the Redis server time deadlines are compared with.
+        """
+        local_now = time.monotonic()
+        if local_now < self._next_poll:
+            return []
+        self._next_poll = local_now + self.poll_ms / 1000
+        now = self._server_time() if now is None else now
+        keys = self._redis.zrangebyscore(self.READY_KEY, "-inf", now, start=0, num=self.max_claims)
+        packets = []
+        for key in keys:
+            if not self._redis.zrem(self.READY_KEY, key):
+                continue
+            pipe = self._redis.pipeline()
+            pipe.hgetall(key)
+            pipe.delete(key)
+            pipe.hset(key, mapping={self.CLAIMED_FIELD: "1"})
+            pipe.expire(key, int(self.ttl_seconds) + 1)
+            fields = pipe.execute()[0]
+            if not fields:
+                self._metrics["lost_claims"] += 1
+                continue
+            if self.CLAIMED_FIELD in fields:
+                # A redelivered final part re-queued a packet that was already emitted.
+                continue
+            timestamp = json.loads(fields.pop(self.TIMESTAMP_FIELD, "null"))
+            payload = {name: json.loads(value) for name, value in fields.items()}
+            topic = json.loads(key[len(self.KEY_PREFIX) :])[0]
+            packets.append((topic, timestamp, payload))
+        self._metrics["claimed"] += len(packets)
+        return packets
+
+    def expire(self, now: float | None = None) -> int:
+        # Redis key expiry drops idle buffers.
+        return 0
+
+    def metrics(self) -> dict:
+        payload = dict(self._metrics)
+        try:
+            payload["waiting"] = self._redis.zcard(self.READY_KEY)
+        except Exception:
+            payload["waiting"] = None
+        return payload
+
+    def _server_time(self) -> float:
+        seconds, microseconds = self._redis.time()
+        return seconds + microseconds / 1_000_000
@@ -0,0 +1,445 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from apps.telemetry import services as telemetry_services
+from apps.telemetry.schemas import EnergyNowPayload, EnvironmentPayload, RTDataPayload
+from services.benchutil import MemoryCollection, percentile, rss_mb
+from services.mqtt.fanout import CoalescingBroadcaster
+from services.mqtt.processor import MessageEnvelope, MessageProcessor
+from services.mqtt.writer import MongoBatchWriter
+
+TOPICS = {
+    "rt": "MQTT_RT_DATA",
+    "eny": "MQTT_ENY_NOW",
+    "env": "CCCL/PURBACHAL/ENV_01",
+    "generator": "CCCL/PURBACHAL/ENM_01",
+}
+STAGES = ("queue", "parse", "handle", "store", "end_to_end")
+LATENCY_SAMPLES = 50_000
+
+
+def _wire_fields(model) -> List[str]:
+    return [info.alias or name for name, info in model.model_fields.items()]
+
+
+RT_FIELDS = [name for name in _wire_fields(RTDataPayload) if name not in {"time", "isend"}]
+ENY_FIELDS = [name for name in _wire_fields(EnergyNowPayload) if name not in {"time", "isend"}]
+ENV_FIELDS = _wire_fields(EnvironmentPayload)
+
+
+@dataclass(frozen=True)
+class TrafficProfile:
+    """Synthetic MQTT traffic.
+
+    ``mix`` weights the message kinds (``rt``, ``eny``, ``env``, ``generator``) per reading;
+    RT and energy readings are sent as ``parts`` messages (``isend`` 0 ... 1) the way the
+    meters split them. ``devices`` meters take turns, so buffers of different devices that
+    share a ``time`` interleave.
+    """
+
+    devices: int = 100
+    mix: Dict[str, float] = field(
+        default_factory=lambda: {"rt": 4.0, "eny": 2.0, "env": 1.0, "generator": 1.0}
+    )
+    parts: int = 2
+    generator_points: int = 20
+    seed: int = 1
+
+
+class TrafficGenerator:
+    """Endless ``(topic, payload bytes)`` stream following a ``TrafficProfile``."""
+
+    def __init__(self, profile: TrafficProfile) -> None:
+        unknown = set(profile.mix) - set(TOPICS)
+        if unknown:
+            raise ValueError(f"unknown message kinds {sorted(unknown)}; expected {sorted(TOPICS)}")
+        self.profile = profile
+        self._rng = random.Random(profile.seed)
+        self._kinds = [kind for kind, weight in profile.mix.items() if weight > 0]
+        self._weights = [profile.mix[kind] for kind in self._kinds]
+
+    def messages(self) -> Iterator[Tuple[str, bytes]]:
+        reading = 0
+        while True:
+            kind = self._rng.choices(self._kinds, self._weights)[0]
+            device = f"bench-{reading % self.profile.devices:05d}"
+            reading += 1
+            for payload in getattr(self, f"_{kind}")(device, reading):
+                yield TOPICS[kind], json.dumps(payload).encode("utf-8")
+
+    def _rt(self, device: str, reading: int) -> List[dict]:
+        values = {name: round(self._rng.uniform(0, 500), 3) for name in RT_FIELDS}
+        return self._split(values, device, str(reading), end_values=("0", "1"))
+
+    def _eny(self, device: str, reading: int) -> List[dict]:
+        values = {name: round(self._rng.uniform(0, 1e5), 2) for name in ENY_FIELDS}
+        return self._split(values, device, reading, end_values=(0, 1))
+
+    def _env(self, device: str, reading: int) -> List[dict]:
+        return [{name: round(self._rng.uniform(0, 100), 2) for name in ENV_FIELDS}]
+
+    def _generator(self, device: str, reading: int) -> List[dict]:
+        points = [
+            {"id": point, "val": round(self._rng.uniform(0, 400), 2)}
+            for point in range(self.profile.generator_points)
+        ]
+        return [{"data": [{"tp": int(time.time() * 1000), "point": points}]}]
+
+    def _split(self, values: dict, device: str, time_key, *, end_values) -> List[dict]:
+        names = list(values)
+        parts = max(1, self.profile.parts)
+        size = -(-len(names) // parts)
+        messages = []
+        for index in range(parts):
+            chunk = {name: values[name] for name in names[index * size : (index + 1) * size]}
+            is_end = end_values[1] if index == parts - 1 else end_values[0]
+            messages.append({"id": device, "time": time_key, "isend": is_end, **chunk})
+        return messages
+
+
+class StageTimer:
+    """Reservoir of latency samples per pipeline stage, in milliseconds."""
+
+    def __init__(self, size: int = LATENCY_SAMPLES, seed: int = 1) -> None:
+        self.size = size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            self._counts = {stage: 0 for stage in STAGES}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._counts[stage] += 1
+            samples = self._samples[stage]
+            if len(samples) < self.size:
+                samples.append(seconds * 1000)
+                return
+            slot = self._rng.randrange(self._counts[stage])
+            if slot < self.size:
+                samples[slot] = seconds * 1000
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+        report = {}
+        for stage, values in samples.items():
+            p50 = percentile(values, 0.50)
+            p99 = percentile(values, 0.99)
+            report[stage] = {
+                "p50_ms": None if p50 is None else round(p50, 2),
+                "p99_ms": None if p99 is None else round(p99, 2),
+                "max_ms": round(max(values), 2) if values else None,
+            }
+        return report
+
+
+class MemoryDatabase:
+    def __init__(self, insert_latency_ms: float = 0.0) -> None:
+        self.insert_latency_ms = insert_latency_ms
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections[name] = MemoryCollection(self.insert_latency_ms)
+        return collection
+
+
+class MemoryRedis:
+    """The few Redis commands device tracking uses, kept in a dict."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, object] = {}
+
+    def get(self, key):
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = str(value)
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            self._values.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, seconds):
+        return True
+
+
+class CountingChannelLayer:
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def group_send(self, group, message) -> None:
+        self.sent += 1
+
+
+class _TimedQueue(queue.Queue):
+    """Message queue that records when each envelope is taken off it."""
+
+    def __init__(self, maxsize: int, processor: "BenchProcessor") -> None:
+        super().__init__(maxsize=maxsize)
+        self._processor = processor
+
+    def _get(self):
+        envelope = super()._get()
+        self._processor._dequeued(envelope)
+        return envelope
+
+
+class BenchProcessor(MessageProcessor):
+    """``MessageProcessor`` with in-memory stand-ins and per-stage timing.
+
+    Each envelope's ``receipt`` carries its sequence number, so the handoff callback the
+    processor already has reports when the message was stored.
+    """
+
+    def __init__(
+        self,
+        *,
+        timer: StageTimer,
+        database: MemoryDatabase | None,
+        side_effects: bool,
+    ) -> None:
+        super().__init__(on_handoff=self._stored)
+        self.timer = timer
+        self._lock = threading.Lock()
+        self._published: Dict[int, float] = {}
+        self._handled: Dict[int, float] = {}
+        self._taken_at = 0.0
+        self._queue = _TimedQueue(self._queue.maxsize, self)
+        if database is not None and self._writer is not None:
+            self._writer = MongoBatchWriter(
+                batch_size=self._writer.state.batch_size,
+                flush_ms=self._writer.state.flush_ms,
+                queue_size=self._writer._queue.maxsize,
+                database=lambda: database,
+                on_failure=self._journal_records,
+                on_stored=self._handoff,
+            )
+        self.channel_layer = CountingChannelLayer()
+        if not side_effects:
+            stage = self._broadcaster
+            self._broadcaster = CoalescingBroadcaster(
+                maxsize=stage.maxsize,
+                flush_ms=stage.flush_ms,
+                max_batch=stage.max_batch,
+                send_timeout=stage.send_timeout,
+                channel_layer=lambda: self.channel_layer,
+            )
+
+    def publish(self, sequence: int, topic: str, payload: bytes) -> None:
+        with self._lock:
+            self._published[sequence] = time.perf_counter()
+        self.enqueue(
+            MessageEnvelope(
+                topic=topic,
+                qos=0,
+                retained=False,
+                payload=payload,
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                receipt=sequence,
+            )
+        )
+
+    def _dequeued(self, envelope: MessageEnvelope) -> None:
+        self._taken_at = time.perf_counter()
+        with self._lock:
+            published = self._published.get(envelope.receipt)
+        if published is not None:
+            self.timer.record("queue", self._taken_at - published)
+
+    def _handle(self, topic, timestamp, payload, receipt=None) -> None:
+        started = time.perf_counter()
+        if receipt is not None:
+            self.timer.record("parse", started - self._taken_at)
+        super()._handle(topic, timestamp, payload, receipt)
+        finished = time.perf_counter()
+        self.timer.record("handle", finished - started)
+        if receipt is not None:
+            with self._lock:
+                if receipt in self._published:
+                    self._handled[receipt] = finished
+
+    def _stored(self, receipts: List[int]) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            for receipt in receipts:
+                published = self._published.pop(receipt, None)
+                handled = self._handled.pop(receipt, None)
+                if handled is None or published is None:
+                    continue
+                self.timer.record("store", now - handled)
+                self.timer.record("end_to_end", now - published)
+
+
+@contextmanager
+def _redis_stand_in(enabled: bool):
+    if not enabled:
+        yield
+        return
+    redis = MemoryRedis()
+    originals = (telemetry_services.get_redis, telemetry_services.broadcast_device_status)
+    telemetry_services.get_redis = lambda: redis
+    telemetry_services.broadcast_device_status = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        telemetry_services.get_redis, telemetry_services.broadcast_device_status = originals
+
+
+def run_benchmark(
+    *,
+    rates: List[float],
+    step_seconds: float = 30.0,
+    profile: TrafficProfile | None = None,
+    store: str = "memory",
+    insert_latency_ms: float = 0.0,
+    side_effects: bool = False,
+    sample_interval: float = 1.0,
+    drain_seconds: float = 30.0,
+) -> dict:
+    """Publish synthetic traffic into a ``MessageProcessor`` in steps of increasing rate.
+
+    Each step publishes at ``rate`` messages per second (0: as fast as possible) for
+    ``step_seconds``, then lets the queue drain. ``store="memory"`` swaps Mongo and Redis
+    for in-memory stand-ins, ``"mongo"`` uses the configured ones and ``"none"`` skips
+    storage. Queue depth and RSS are sampled every ``sample_interval`` for the whole run.
+    """
+    profile = profile or TrafficProfile()
+    os.environ["MQTT_STORAGE_MODE"] = "none" if store == "none" else "batch"
+    timer = StageTimer(seed=profile.seed)
+    with _redis_stand_in(store != "mongo"):
+        processor = BenchProcessor(
+            timer=timer,
+            database=MemoryDatabase(insert_latency_ms) if store == "memory" else None,
+            side_effects=side_effects,
+        )
+        processor.start()
+        samples: List[dict] = []
+        stop_sampling = threading.Event()
+        started = time.perf_counter()
+        sampler = threading.Thread(
+            target=_sample,
+            args=(processor, samples, started, sample_interval, stop_sampling),
+            name="mqtt-bench-sampler",
+            daemon=True,
+        )
+        sampler.start()
+        traffic = TrafficGenerator(profile).messages()
+        steps = []
+        sequence = 0
+        try:
+            for rate in rates:
+                timer.reset()
+                before = processor.metrics()
+                sequence, published, elapsed = _publish(
+                    processor, traffic, rate, step_seconds, sequence
+                )
+                after = processor.metrics()
+                backlog = processor.backlog()
+                _drain(processor, drain_seconds)
+                steps.append(_step_report(rate, published, elapsed, before, after, backlog, timer))
+        finally:
+            stop_sampling.set()
+            sampler.join()
+            processor.stop()
+        metrics = processor.metrics()
+    sustained = [step for step in steps if step["sustained"]]
+    return {
+        "store": store,
+        "profile": {
+            "devices": profile.devices,
+            "mix": profile.mix,
+            "parts": profile.parts,
+            "seed": profile.seed,
+        },
+        "queue_maxsize": processor._queue.maxsize,
+        # MQTT messages per second (packet parts included) taken without drops or lag.
+        "max_sustained_rate": max(
+            (step["published_per_second"] for step in sustained), default=0.0
+        ),
+        "steps": steps,
+        "rss_start_mb": samples[0]["rss_mb"] if samples else None,
+        "rss_end_mb": samples[-1]["rss_mb"] if samples else None,
+        "rss_growth_mb": (
+            round(samples[-1]["rss_mb"] - samples[0]["rss_mb"], 1) if samples else None
+        ),
+        "queue_depth": samples,
+        "broadcasts": processor.channel_layer.sent,
+        "processor": metrics,
+    }
+
+
+def _publish(processor, traffic, rate: float, seconds: float, sequence: int):
+    published = 0
+    started = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return sequence, published, elapsed
+        due = int(elapsed * rate) + 1 if rate > 0 else published + 100
+        if published >= due:
+            time.sleep(0.001)
+            continue
+        while published < due:
+            topic, payload = next(traffic)
+            processor.publish(sequence, topic, payload)
+            sequence += 1
+            published += 1
+
+
+def _drain(processor: BenchProcessor, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while processor.backlog() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _sample(processor, samples: List[dict], started: float, interval: float, stop) -> None:
+    while True:
+        metrics = processor.metrics()
+        samples.append(
+            {
+                "t": round(time.perf_counter() - started, 2),
+                "queue_size": metrics["queue_size"],
+                "writer_queue_size": metrics.get("writer", {}).get("queue_size", 0),
+                "processed": metrics["processed"],
+                "dropped": metrics["dropped"],
+                "rss_mb": rss_mb(),
+            }
+        )
+        if stop.wait(interval):
+            return
+
+
+def _step_report(rate, published, elapsed, before, after, backlog, timer) -> dict:
+    processed = after["processed"] - before["processed"]
+    dropped = after["dropped"] - before["dropped"]
+    per_second = published / elapsed if elapsed else 0.0
+    return {
+        "offered_rate": rate,
+        "published": published,
+        "published_per_second": round(per_second, 1),
+        "processed": processed,
+        "processed_per_second": round(processed / elapsed, 1) if elapsed else 0.0,
+        "dropped": dropped,
+        "backlog_at_end": backlog,
+        # Kept up: nothing dropped and no more than a second of traffic still queued.
+        "sustained": dropped == 0 and backlog <= max(per_second, 1),
+        "latency": timer.summary(),
+    }
@@ -1,21 +1,186 @@
 from __future__ import annotations
 
+import logging
 import os
 import ssl
-from typing import Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
 
 import paho.mqtt.client as mqtt
-
-
-def build_client() -> mqtt.Client:
-    """Create and configure MQTT client using .env credentials."""
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from services.mqtt.topics import get_replica_id, get_shared_group, subscription_filters
+
+logger = logging.getLogger("mqtt.client")
+
+
+class AckingClient(mqtt.Client):
+    """paho client that can hold QoS 1 PUBACKs and stop reading under backpressure.
+
+    paho 1.x acknowledges a QoS 1 message as soon as ``on_message`` returns. With
+    ``manual_ack`` on, ``on_message`` calls ``defer_ack`` to take a receipt instead; the
+    PUBACK is sent once ``release`` reports the receipt handed off, in the order the
+    messages arrived. Unreleased messages stay unacknowledged, so the broker redelivers them
+    after a reconnect (with ``MQTT_CLEAN_SESSION=false``) and stops sending once its
+    inflight window is full.
+
+    ``read_gate`` returns the current backlog. Reading pauses when it reaches
+    ``high_water`` and resumes at ``low_water``; a paused client still reads once every half
+    keepalive so the broker connection stays up.
+    """
+
+    def __init__(self, *args, manual_ack: bool = False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.manual_ack = manual_ack
+        # Extra ``connect``/``connect_async`` arguments (MQTT v5 session settings).
+        self.connect_options: dict[str, Any] = {}
+        self.pause_interval = 0.05
+        self._read_gate: Callable[[], int] | None = None
+        self._high_water = 0
+        self._low_water = 0
+        self._paused_since: float | None = None
+        self._ack_lock = threading.Lock()
+        self._receipts: OrderedDict[int, list] = OrderedDict()
+        self._next_receipt = 0
+        self._deferred_mid: int | None = None
+        self._redeliver = False
+        self._flow_metrics = {"acks_sent": 0, "acks_deferred": 0, "read_pauses": 0}
+
+    def set_read_gate(self, backlog: Callable[[], int], *, high_water: int, low_water: int) -> None:
+        self._read_gate = backlog
+        self._high_water = high_water
+        self._low_water = min(low_water, high_water)
+
+    def defer_ack(self, message: mqtt.MQTTMessage) -> int | None:
+        """Take over the PUBACK of ``message``; ``None`` when there is nothing to defer."""
+        if not self.manual_ack or message.qos != 1:
+            return None
+        with self._ack_lock:
+            receipt = self._next_receipt
+            self._next_receipt += 1
+            self._receipts[receipt] = [message.mid, False]
+            self._deferred_mid = message.mid
+            self._flow_metrics["acks_deferred"] += 1
+        return receipt
+
+    def release(self, receipts: Iterable[int]) -> None:
+        """Mark receipts handed off and send every PUBACK that is now due, in order."""
+        due = []
+        with self._ack_lock:
+            for receipt in receipts:
+                entry = self._receipts.get(receipt)
+                if entry is not None:
+                    entry[1] = True
+            while self._receipts:
+                receipt, (mid, done) = next(iter(self._receipts.items()))
+                if not done:
+                    break
+                self._receipts.popitem(last=False)
+                due.append(mid)
+            self._flow_metrics["acks_sent"] += len(due)
+        for mid in due:
+            super()._send_puback(mid)
+
+    def redeliver(self) -> None:
+        """Drop the connection so the broker resends every unacknowledged message."""
+        self._redeliver = True
+
+    def flow_metrics(self) -> dict:
+        with self._ack_lock:
+            payload = dict(self._flow_metrics)
+            payload["pending_acks"] = len(self._receipts)
+        payload["paused"] = self._paused_since is not None
+        return payload
+
+    def subscription_status(self) -> dict:
+        group = get_shared_group()
+        return {
+            "group": group or None,
+            # The replica's member id within the shared group.
+            "partition": get_replica_id() if group else None,
+            "client_id": self._client_id.decode("utf-8"),
+            "protocol": "5" if self._protocol == mqtt.MQTTv5 else "3.1.1",
+            "filters": subscription_filters(),
+        }
+
+    def reconnect(self):
+        # Message ids belong to the connection they arrived on; the broker resends them.
+        with self._ack_lock:
+            self._receipts.clear()
+            self._deferred_mid = None
+        self._redeliver = False
+        self._paused_since = None
+        return super().reconnect()
+
+    def loop_read(self, max_packets=1):
+        if self._redeliver:
+            logger.warning("reconnecting to get unacknowledged messages redelivered")
+            return self._loop_rc_handle(mqtt.MQTT_ERR_CONN_LOST)
+        if self._should_pause():
+            time.sleep(self.pause_interval)
+            return mqtt.MQTT_ERR_SUCCESS
+        return super().loop_read(max_packets)
+
+    def _send_puback(self, mid):
+        with self._ack_lock:
+            deferred = self._deferred_mid == mid
+            self._deferred_mid = None
+        if deferred:
+            return mqtt.MQTT_ERR_SUCCESS
+        return super()._send_puback(mid)
+
+    def _should_pause(self) -> bool:
+        if self._read_gate is None:
+            return False
+        backlog = self._read_gate()
+        now = time.monotonic()
+        if self._paused_since is None:
+            if backlog < self._high_water:
+                return False
+            self._paused_since = now
+            self._flow_metrics["read_pauses"] += 1
+            logger.info("backlog %s reached high water; pausing socket reads", backlog)
+            return True
+        if backlog <= self._low_water:
+            self._paused_since = None
+            return False
+        if now - self._paused_since >= self._keepalive / 2:
+            self._paused_since = now
+            return False
+        return True
+
+
+def build_client() -> AckingClient:
+    """Create and configure MQTT client using .env credentials.
+
+    With ``MQTT_SHARED_GROUP`` set, every replica needs its own session, so the replica id
+    is appended to the client id, and the protocol defaults to MQTT v5.
+    """
     client_id = os.getenv("MQTT_CLIENT_ID") or "telemetry-subscriber"
-    protocol = _resolve_protocol(os.getenv("MQTT_PROTOCOL", "311"))
+    shared_group = get_shared_group()
+    if shared_group:
+        client_id = f"{client_id}-{get_replica_id()}"
+    protocol = _resolve_protocol(os.getenv("MQTT_PROTOCOL", ""), shared=bool(shared_group))
     clean_session = _parse_bool(os.getenv("MQTT_CLEAN_SESSION", "true"))
     username = os.getenv("MQTT_USERNAME")
     password = os.getenv("MQTT_PASSWORD")
 
-    client = mqtt.Client(client_id=client_id, protocol=protocol, clean_session=clean_session)
+    client = AckingClient(
+        client_id=client_id,
+        protocol=protocol,
+        # MQTT v5 replaces clean session with clean start plus a session expiry.
+        clean_session=None if protocol == mqtt.MQTTv5 else clean_session,
+        manual_ack=_parse_bool(os.getenv("MQTT_FLOW_CONTROL", "false")),
+    )
+    if protocol == mqtt.MQTTv5:
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = int(
+            os.getenv("MQTT_SESSION_EXPIRY_SECONDS", "0" if clean_session else "3600")
+        )
+        client.connect_options = {"clean_start": clean_session, "properties": properties}
     if username:
         client.username_pw_set(username=username, password=password)
 
@@ -24,9 +189,10 @@ def build_client() -> mqtt.Client:
     return client
 
 
-def _resolve_protocol(value: str) -> int:
+def _resolve_protocol(value: str, shared: bool = False) -> int:
+    """``MQTT_PROTOCOL`` to a paho protocol; unset means v5 for shared subscriptions."""
     value = (value or "").strip().lower()
-    if value in {"5", "v5", "mqttv5"}:
+    if value in {"5", "v5", "mqttv5"} or (shared and not value):
         return mqtt.MQTTv5
     return mqtt.MQTTv311
 
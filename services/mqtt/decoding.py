@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+logger = logging.getLogger("mqtt.decoding")
+
+JSON_DECODERS = ("auto", "orjson", "msgspec", "json")
+
+
+def json_decoder(name: str = "auto") -> Tuple[str, Callable[[bytes], object]]:
+    """Return ``(name, loads)`` for the requested JSON library.
+
+    ``auto`` prefers orjson, then msgspec, then the standard library. The fast decoders
+    take the raw bytes and are stricter than ``json`` (no ``NaN`` literals, no invalid
+    UTF-8), so callers fall back to the standard path whenever they raise.
+    """
+    name = name.strip().lower()
+    if name not in JSON_DECODERS:
+        raise ValueError(f"unknown JSON decoder {name!r}; expected one of {JSON_DECODERS}")
+    if name in {"auto", "orjson"}:
+        try:
+            import orjson
+
+            return "orjson", orjson.loads
+        except ImportError:
+            if name == "orjson":
+                logger.warning("orjson is not installed; falling back")
+    if name in {"auto", "orjson", "msgspec"}:
+        try:
+            import msgspec
+
+            return "msgspec", msgspec.json.decode
+        except ImportError:
+            if name == "msgspec":
+                logger.warning("msgspec is not installed; falling back")
+    return "json", json.loads
+
+
+def normalize_key(key) -> str:
+    new_key = (
+        str(key)
+        .strip()
+        .replace("(", "_")
+        .replace(")", "")
+        .replace("/", "_")
+        .replace("%", "percent")
+        .replace("*", "")
+        .replace("+", "plus")
+        .replace("-", "minus")
+        .replace(" ", "_")
+        .lower()
+    )
+    while "__" in new_key:
+        new_key = new_key.replace("__", "_")
+    return new_key
+
+
+class KeyNormalizer:
+    """Normalizes payload keys with a bounded cache of known key layouts.
+
+    Devices publish the same key set on every message, so the last ``max_layouts``
+    ``(topic, raw key tuple)`` pairs across all topics keep their normalized form; a known
+    layout is rebuilt with one ``zip`` instead of normalizing every key again.
+    """
+
+    def __init__(self, max_layouts: int = 1024) -> None:
+        self.max_layouts = max_layouts
+        self._layouts: OrderedDict[Tuple[str, tuple], tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, topic: str, payload):
+        if not isinstance(payload, dict):
+            return payload
+        layout = (topic, tuple(payload))
+        with self._lock:
+            normalized = self._layouts.get(layout)
+            if normalized is not None:
+                self._layouts.move_to_end(layout)
+                self.hits += 1
+            else:
+                self.misses += 1
+                normalized = tuple(normalize_key(key) for key in layout[1])
+                self._layouts[layout] = normalized
+                if len(self._layouts) > self.max_layouts:
+                    self._layouts.popitem(last=False)
+        return dict(zip(normalized, payload.values()))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            layouts = len(self._layouts)
+        return {"key_cache_hits": self.hits, "key_cache_misses": self.misses, "layouts": layouts}
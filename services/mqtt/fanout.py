@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List
+
+from channels.layers import get_channel_layer
+
+from apps.telemetry.schemas import TelemetryMessage
+
+logger = logging.getLogger("mqtt.fanout")
+
+
+class CoalescingBroadcaster:
+    """Fire-and-forget WebSocket fan-out for the MQTT processor.
+
+    ``submit`` only stores the message (a dict or a validated ``TelemetryMessage``, dumped
+    just before sending) under its (topic, device_id) key, replacing any message still
+    pending for that key, and never waits. An asyncio loop on its own thread takes up to
+    ``max_batch`` pending messages every ``flush_ms`` and sends them with concurrent
+    ``group_send`` calls. When ``maxsize`` keys are pending, new keys are dropped.
+    """
+
+    def __init__(
+        self,
+        *,
+        maxsize: int = 10000,
+        flush_ms: int = 100,
+        max_batch: int = 1000,
+        send_timeout: float = 5.0,
+        group: str | None = None,
+        event: str = "telemetry.message",
+        channel_layer: Callable[[], object] = get_channel_layer,
+    ) -> None:
+        self.maxsize = maxsize
+        self.flush_ms = flush_ms
+        self.max_batch = max_batch
+        self.send_timeout = send_timeout
+        self.group = group or os.getenv("TELEMETRY_WS_GROUP", "telemetry")
+        self.event = event
+        self._channel_layer = channel_layer
+        self._pending: OrderedDict[Hashable, dict | TelemetryMessage] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mqtt-broadcaster", daemon=True)
+        self._metrics = {
+            "submitted": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "broadcasts": 0,
+            "errors": 0,
+        }
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    def submit(self, message: dict | TelemetryMessage) -> bool:
+        if isinstance(message, TelemetryMessage):
+            key = (message.topic, message.device_id)
+        else:
+            key = (message.get("topic"), message.get("device_id"))
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = message
+                self._metrics["coalesced"] += 1
+            elif len(self._pending) >= self.maxsize:
+                self._metrics["dropped"] += 1
+                return False
+            else:
+                self._pending[key] = message
+            self._metrics["submitted"] += 1
+        return True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            payload = dict(self._metrics)
+            payload["pending"] = len(self._pending)
+        return payload
+
+    def _run(self) -> None:
+        asyncio.run(self._serve())
+
+    async def _serve(self) -> None:
+        channel_layer = self._channel_layer()
+        while True:
+            stopping = self._stop_event.is_set()
+            batch = self._take()
+            if batch:
+                await self._send(channel_layer, batch)
+            elif stopping:
+                return
+            if len(batch) < self.max_batch:
+                await asyncio.sleep(self.flush_ms / 1000)
+
+    def _take(self) -> List[dict | TelemetryMessage]:
+        with self._lock:
+            count = min(len(self._pending), self.max_batch)
+            return [self._pending.popitem(last=False)[1] for _ in range(count)]
+
+    async def _send(self, channel_layer, batch: List[dict | TelemetryMessage]) -> None:
+        if channel_layer is None:
+            return
+        sends = [
+            channel_layer.group_send(
+                self.group,
+                {
+                    "type": self.event,
+                    "message": (
+                        message.to_dict() if isinstance(message, TelemetryMessage) else message
+                    ),
+                },
+            )
+            for message in batch
+        ]
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*sends, return_exceptions=True), timeout=self.send_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("websocket broadcast timed out for %s message(s)", len(batch))
+            with self._lock:
+                self._metrics["errors"] += len(batch)
+            return
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            logger.warning("websocket broadcast failed: %s", failures[0])
+        with self._lock:
+            self._metrics["broadcasts"] += len(batch) - len(failures)
+            self._metrics["errors"] += len(failures)
@@ -6,13 +6,29 @@ import os
 import queue
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor, wait
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable
 
-from apps.telemetry.services import broadcast_realtime, mark_device_seen
-from apps.telemetry.tasks import store_event_mongo_task
-from apps.telemetry.schemas import GeneratorDataModel
+from bson.objectid import ObjectId
+
+from apps.telemetry.services import mark_device_seen, prepare_event_document
+from apps.telemetry.tasks import store_event_mongo_task, store_events_mongo_batch
+from apps.telemetry.schemas import TelemetryMessage
+from apps.telemetry.topic_routes import route_for
 from apps.telemetry.validators import validate_packet
+from common.mongo import get_mongo_database
+from common.redis_client import get_redis
+from services.journal import (
+    journal_from_env,
+    journal_record,
+    replayer_from_env,
+    write_journal_records,
+)
+from services.mqtt.assembly import PacketAssembler, SharedPacketAssembler
+from services.mqtt.decoding import KeyNormalizer, json_decoder
+from services.mqtt.fanout import CoalescingBroadcaster
+from services.mqtt.topics import get_replica_id, get_shared_group
+from services.mqtt.writer import MongoBatchWriter
 
 logger = logging.getLogger("mqtt.processor")
 
@@ -24,201 +40,367 @@ class MessageEnvelope:
     retained: bool
     payload: bytes
     timestamp: str
+    # Flow-control receipt whose PUBACK waits until the message is handed off.
+    receipt: int | None = None
 
 
 class MessageProcessor:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        on_handoff: Callable[[list[int]], None] | None = None,
+        on_lost: Callable[[], None] | None = None,
+    ) -> None:
+        self._on_handoff = on_handoff
+        # Called when a message with a receipt could be neither stored nor journaled, so the
+        # client can get it redelivered instead of acknowledging it.
+        self._on_lost = on_lost
         self._pretty_json = _parse_bool(os.getenv("MQTT_PRETTY_JSON", "false"))
+        self._decoder, loads = json_decoder(os.getenv("MQTT_JSON_DECODER", "auto"))
+        self._loads = None if self._decoder == "json" else loads
+        self._keys = KeyNormalizer(int(os.getenv("MQTT_KEY_CACHE_LAYOUTS", "1024")))
         maxsize = int(os.getenv("MQTT_MESSAGE_QUEUE", "10000"))
         self._queue: queue.Queue[MessageEnvelope] = queue.Queue(maxsize=maxsize)
         self._stop_event = threading.Event()
         self._thread = threading.Thread(target=self._run, name="mqtt-message-worker", daemon=True)
-        self._buffers: dict[tuple[str, str | None], dict[str, object]] = {}
-        self._buffer_timestamps: dict[tuple[str, str | None], float] = {}
-        self._buffer_ttl_seconds = int(os.getenv("MQTT_BUFFER_TTL_SECONDS", "300"))
-        self._executor = ThreadPoolExecutor(
-            max_workers=int(os.getenv("MQTT_FANOUT_WORKERS", "4"))
+        self._assembler = _assembler_from_env()
+        self._broadcaster = CoalescingBroadcaster(
+            maxsize=int(os.getenv("MQTT_BROADCAST_QUEUE", "10000")),
+            flush_ms=int(os.getenv("MQTT_BROADCAST_FLUSH_MS", "100")),
+            max_batch=int(os.getenv("MQTT_BROADCAST_MAX_BATCH", "1000")),
+            send_timeout=float(os.getenv("MQTT_BROADCAST_TIMEOUT_SECONDS", "5")),
         )
         self._drop_on_full = _parse_bool(os.getenv("MQTT_DROP_ON_FULL", "true"))
-        self._fanout_timeout = float(os.getenv("MQTT_FANOUT_TIMEOUT_SECONDS", "0.2"))
-        self._metrics = {"dropped": 0, "fanout_errors": 0}
+        # Under flow control the client stops reading instead; a full queue never drops.
+        self._flow_control = _parse_bool(os.getenv("MQTT_FLOW_CONTROL", "false"))
+        self._storage_mode = os.getenv("MQTT_STORAGE_MODE", "celery").strip().lower()
+        self._broadcast = _parse_bool(os.getenv("MQTT_BROADCAST_ENABLED", "true"))
+        self._track_devices = _parse_bool(os.getenv("MQTT_TRACK_DEVICES", "true"))
+        self._metrics = {
+            "processed": 0,
+            "dropped": 0,
+            "fanout_errors": 0,
+            "spilled": 0,
+            "journaled": 0,
+            "batches_enqueued": 0,
+            "unacked_lost": 0,
+        }
         self._metrics_lock = threading.Lock()
+        worker_index = os.getenv("MQTT_WORKER_INDEX")
+        suffix = "" if worker_index is None else f"-{worker_index}"
+        if get_shared_group():
+            # Replicas may share the journal volume.
+            suffix = f"-{get_replica_id()}{suffix}"
+        self._spill = journal_from_env(f"mqtt-envelopes{suffix}")
+        self._events_journal = journal_from_env(f"mqtt-events{suffix}")
+        self._replayers = []
+        if self._spill is not None:
+            self._replayers.append(
+                replayer_from_env(self._spill, self._requeue, name="mqtt-spill-replayer")
+            )
+        if self._events_journal is not None:
+            self._replayers.append(
+                replayer_from_env(
+                    self._events_journal,
+                    lambda records: write_journal_records(get_mongo_database(), records),
+                    name="mqtt-journal-replayer",
+                )
+            )
+        self._batch_size = int(os.getenv("MQTT_BATCH_SIZE", "500"))
+        self._batch_flush_seconds = int(os.getenv("MQTT_BATCH_FLUSH_MS", "200")) / 1000
+        self._pending: list[TelemetryMessage] = []
+        self._pending_receipts: list[int | None] = []
+        self._pending_since = 0.0
+        self._writer: MongoBatchWriter | None = None
+        if self._storage_mode == "batch":
+            self._writer = MongoBatchWriter(
+                batch_size=self._batch_size,
+                flush_ms=int(self._batch_flush_seconds * 1000),
+                queue_size=int(os.getenv("MQTT_BATCH_QUEUE", "10000")),
+                on_failure=self._journal_records,
+                on_stored=self._handoff,
+                on_lost=self._lose,
+                submit_timeout=float(os.getenv("MQTT_BATCH_SUBMIT_TIMEOUT_SECONDS", "5")),
+            )
 
     def start(self) -> None:
+        if self._writer is not None:
+            self._writer.start()
+        self._broadcaster.start()
         self._thread.start()
+        for replayer in self._replayers:
+            replayer.start()
 
     def stop(self) -> None:
+        for replayer in self._replayers:
+            replayer.stop()
         self._stop_event.set()
         self._queue.join()
         self._thread.join(timeout=10)
-        self._executor.shutdown(wait=True)
+        self._broadcaster.stop()
+        if self._writer is not None:
+            self._writer.stop()
+        for journal in (self._spill, self._events_journal):
+            if journal is not None:
+                journal.close()
 
     def metrics(self) -> dict:
         with self._metrics_lock:
-            return dict(self._metrics)
+            payload = dict(self._metrics)
+        payload["queue_size"] = self.backlog()
+        payload["assembly"] = self._assembler.metrics()
+        payload["decoder"] = {"name": self._decoder, **self._keys.metrics()}
+        payload["broadcast"] = self._broadcaster.metrics()
+        if self._writer is not None:
+            payload["writer"] = self._writer.metrics()
+        if self._spill is not None:
+            payload["spill_journal"] = self._spill.metrics()
+        if self._events_journal is not None:
+            payload["events_journal"] = self._events_journal.metrics()
+        return payload
+
+    def backlog(self) -> int:
+        return self._queue.qsize()
 
     def enqueue(self, envelope: MessageEnvelope) -> None:
         try:
             self._queue.put_nowait(envelope)
         except queue.Full:
-            if self._drop_on_full:
+            if self._spill is not None and self._spill.append(asdict(envelope)):
+                with self._metrics_lock:
+                    self._metrics["spilled"] += 1
+                self._handoff([envelope.receipt])
+            elif self._drop_on_full and not self._flow_control:
                 with self._metrics_lock:
                     self._metrics["dropped"] += 1
                 logger.warning("message queue full; dropping topic=%s", envelope.topic)
+                self._handoff([envelope.receipt])
             else:
                 self._queue.put(envelope)
 
     def _run(self) -> None:
         while not self._stop_event.is_set() or not self._queue.empty():
+            if self._pending and self._poll_timeout() <= 0.01:
+                self._flush_pending()
+            for topic, timestamp, packet in self._claim_packets():
+                self._handle(topic, timestamp, packet)
             try:
-                envelope = self._queue.get(timeout=0.5)
+                envelope = self._queue.get(timeout=self._poll_timeout())
             except queue.Empty:
                 continue
-            self._cleanup_stale_buffers()
-            payload = _parse_payload(envelope.payload, pretty_json=self._pretty_json)
+            payload = _parse_payload(
+                envelope.payload, pretty_json=self._pretty_json, loads=self._loads
+            )
             if isinstance(payload, str):
                 payload = " ".join(payload.splitlines())
-            assembled = self._assemble_packet(envelope.topic, payload)
+            try:
+                assembled = self._assembler.add(
+                    envelope.topic, payload, len(envelope.payload), timestamp=envelope.timestamp
+                )
+            except Exception as exc:
+                logger.warning("packet part dropped; assembly failed: %s", exc)
+                assembled = None
             if assembled is None:
-                self._queue.task_done()
-                continue
-            message = _build_message(envelope, _normalize_keys(assembled))
-            if message.get("topic") == "CCCL/PURBACHAL/ENM_01":
-                try:
-                    message = _normalize_generator_message(message)
-                except Exception as exc:
-                    logger.warning("generator normalization failed: %s", exc)
+                # Parts are acknowledged once buffered; the assembled packet is not.
+                self._handoff([envelope.receipt])
+            else:
+                self._handle(envelope.topic, envelope.timestamp, assembled, envelope.receipt)
+            self._queue.task_done()
+        self._flush_pending()
+
+    def _claim_packets(self) -> list:
+        try:
+            return self._assembler.ready()
+        except Exception as exc:
+            logger.warning("shared packet assembly unavailable: %s", exc)
+            return []
+
+    def _handle(self, topic: str, timestamp, payload, receipt: int | None = None) -> None:
+        route = route_for(topic)
+        message = _build_message(topic, timestamp, self._keys.normalize(topic, payload))
+        if route is not None and route.normalizer is not None:
             try:
-                validate_packet(message)
-            except ValueError as exc:
-                logger.warning("invalid packet dropped: %s", exc)
-                self._queue.task_done()
-                continue
-            device_id = message.get("device_id")
-            if not device_id and message.get("topic") == "CCCL/PURBACHAL/ENV_01":
-                device_id = "CCCL_ENVIRONMENT_DEVICE_1"
-                message["device_id"] = device_id
-            if device_id:
-                try:
-                    mark_device_seen(device_id, topic=message.get("topic"))
-                except Exception as exc:
-                    logger.warning("device status update failed: %s", exc)
+                message = route.normalizer(message)
+            except Exception as exc:
+                logger.warning("%s normalization failed: %s", route.filter, exc)
+        try:
+            event = validate_packet(message, route)
+        except ValueError as exc:
+            logger.warning("invalid packet dropped: %s", exc)
+            self._handoff([receipt])
+            return
+        if not event.device_id and route is not None and route.default_device_id:
+            event.device_id = route.default_device_id
+        if event.device_id and self._track_devices:
             try:
-                store_event_mongo_task.delay(message)
+                mark_device_seen(event.device_id, topic=event.topic)
             except Exception as exc:
+                logger.warning("device status update failed: %s", exc)
+        self._store(event, receipt)
+        if self._broadcast:
+            self._broadcaster.submit(event)
+        logger.info("mqtt message", extra={"mqtt_message": message})
+        with self._metrics_lock:
+            self._metrics["processed"] += 1
+
+    def _poll_timeout(self) -> float:
+        if not self._pending:
+            return 0.5
+        remaining = self._batch_flush_seconds - (time.monotonic() - self._pending_since)
+        return min(max(remaining, 0.01), 0.5)
+
+    def _store(self, event: TelemetryMessage, receipt: int | None = None) -> None:
+        if self._storage_mode == "none":
+            self._handoff([receipt])
+            return
+        if self._writer is not None:
+            try:
+                if self._writer.submit(event, receipt):
+                    return
+            except (RuntimeError, queue.Full) as exc:
                 with self._metrics_lock:
                     self._metrics["fanout_errors"] += 1
-                logger.exception("mongo enqueue error: %s", exc)
-            future = self._executor.submit(broadcast_realtime, message)
-            done, not_done = wait([future], timeout=self._fanout_timeout)
-            for future in done:
-                try:
-                    future.result()
-                except Exception as exc:
-                    with self._metrics_lock:
-                        self._metrics["fanout_errors"] += 1
-                    logger.exception("fanout error: %s", exc)
-            if not_done:
-                with self._metrics_lock:
-                    self._metrics["fanout_errors"] += len(not_done)
-                logger.warning("fanout timeout: %s pending task(s)", len(not_done))
-            logger.info("mqtt message", extra={"mqtt_message": message})
-            self._queue.task_done()
+                logger.error("mongo writer unavailable: %s", exc)
+                if not self._journal_event(event):
+                    self._lose([receipt])
+                    return
+            self._handoff([receipt])
+            return
+        if self._storage_mode == "celery_batch":
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(event)
+            self._pending_receipts.append(receipt)
+            if len(self._pending) >= self._batch_size:
+                self._flush_pending()
+            return
+        try:
+            store_event_mongo_task.delay(event.to_dict())
+        except Exception as exc:
+            with self._metrics_lock:
+                self._metrics["fanout_errors"] += 1
+            logger.exception("mongo enqueue error: %s", exc)
+            if not self._journal_event(event):
+                self._lose([receipt])
+                return
+        self._handoff([receipt])
 
-    def _assemble_packet(self, topic: str, payload):
-        if not isinstance(payload, dict):
-            return payload
-        is_end = payload.get("isend")
-        if is_end is None:
-            return payload
-        buffer_key = self._buffer_key(topic, payload)
-        buffer = self._buffers.get(buffer_key)
-        if buffer is None:
-            buffer = {}
-            self._buffers[buffer_key] = buffer
-        self._buffer_timestamps[buffer_key] = time.monotonic()
-        buffer.update(payload)
-        if str(is_end) == "1":
-            self._buffers.pop(buffer_key, None)
-            self._buffer_timestamps.pop(buffer_key, None)
-            return buffer
-        return None
-
-    def _buffer_key(self, topic: str, payload: dict) -> tuple[str, str | None]:
-        time_key = payload.get("time")
-        return (topic, str(time_key) if time_key is not None else None)
-
-    def _cleanup_stale_buffers(self) -> None:
-        if not self._buffer_timestamps:
+    def _handoff(self, receipts: Iterable[int | None]) -> None:
+        """Report messages that reached Celery, Mongo or a journal (or are dropped for good)."""
+        if self._on_handoff is None:
+            return
+        receipts = [receipt for receipt in receipts if receipt is not None]
+        if receipts:
+            self._on_handoff(receipts)
+
+    def _lose(self, receipts: Iterable[int | None]) -> None:
+        """Leave these messages unacknowledged and ask for a redelivery."""
+        receipts = [receipt for receipt in receipts if receipt is not None]
+        if not receipts:
             return
-        now = time.monotonic()
-        expired = [
-            key for key, ts in self._buffer_timestamps.items() if now - ts > self._buffer_ttl_seconds
-        ]
-        for key in expired:
-            self._buffers.pop(key, None)
-            self._buffer_timestamps.pop(key, None)
+        logger.error(
+            "%s message(s) neither stored nor journaled; requesting redelivery", len(receipts)
+        )
+        with self._metrics_lock:
+            self._metrics["unacked_lost"] += len(receipts)
+        if self._on_lost is not None:
+            self._on_lost()
+
+    def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        receipts, self._pending_receipts = self._pending_receipts, []
+        # Pinned ids make a retried task insert the same documents instead of duplicates.
+        messages = [event.to_dict() for event in batch]
+        for message in messages:
+            message["event_id"] = str(ObjectId())
+        try:
+            store_events_mongo_batch.delay(messages)
+        except Exception as exc:
+            with self._metrics_lock:
+                self._metrics["fanout_errors"] += 1
+            logger.exception("mongo batch enqueue error: %s", exc)
+            kept = [self._journal_event(event) for event in batch]
+            self._handoff(receipt for receipt, ok in zip(receipts, kept) if ok)
+            self._lose(receipt for receipt, ok in zip(receipts, kept) if not ok)
+            return
+        with self._metrics_lock:
+            self._metrics["batches_enqueued"] += 1
+        self._handoff(receipts)
+
+    def _requeue(self, records: list[dict]) -> None:
+        for record in records:
+            # Replayed envelopes were acknowledged when they were spilled.
+            self._queue.put(MessageEnvelope(**{**record, "receipt": None}))
+
+    def _journal_event(self, event: TelemetryMessage) -> bool:
+        """Journal ``event`` for replay; ``False`` when it would be lost."""
+        document, collections = prepare_event_document(event)
+        if not collections:
+            return True
+        if self._events_journal is None:
+            return False
+        record = journal_record(document, [*collections, "telemetry_events"])
+        if not self._events_journal.append(record):
+            return False
+        with self._metrics_lock:
+            self._metrics["journaled"] += 1
+        return True
+
+    def _journal_records(self, records: list[dict]) -> int:
+        """Journal ``records`` in order, stopping at the first failure; return how many."""
+        if self._events_journal is None:
+            return 0
+        stored = 0
+        for record in records:
+            if not self._events_journal.append(record):
+                break
+            stored += 1
+        with self._metrics_lock:
+            self._metrics["journaled"] += stored
+        return stored
 
 
-def _build_message(envelope: MessageEnvelope, payload):
+def _assembler_from_env() -> PacketAssembler | SharedPacketAssembler:
+    ttl_seconds = int(os.getenv("MQTT_BUFFER_TTL_SECONDS", "300"))
+    default_backend = "redis" if get_shared_group() else "local"
+    if os.getenv("MQTT_ASSEMBLY_BACKEND", default_backend).strip().lower() == "redis":
+        return SharedPacketAssembler(
+            get_redis(),
+            ttl_seconds=ttl_seconds,
+            settle_ms=int(os.getenv("MQTT_ASSEMBLY_SETTLE_MS", "1000")),
+        )
+    return PacketAssembler(
+        ttl_seconds=ttl_seconds,
+        max_buffers=int(os.getenv("MQTT_ASSEMBLY_MAX_BUFFERS", "10000")),
+        max_bytes=int(os.getenv("MQTT_ASSEMBLY_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
+
+
+def _build_message(topic: str, timestamp, payload):
     if not isinstance(payload, dict):
         return {
             "device_id": None,
-            "topic": envelope.topic,
-            "timestamp": envelope.timestamp,
+            "topic": topic,
+            "timestamp": timestamp,
             "payload": payload,
         }
-    device_id = payload.get("id") or payload.get("device_id")
-    trimmed = {k: v for k, v in payload.items() if k != "id"}
+    # ``payload`` is the processor's own freshly normalized dict, so it is trimmed in place.
+    device_id = payload.pop("id", None) or payload.get("device_id")
     return {
         "device_id": device_id,
-        "topic": envelope.topic,
-        "timestamp": envelope.timestamp,
-        "payload": trimmed,
+        "topic": topic,
+        "timestamp": timestamp,
+        "payload": payload,
     }
 
 
-def _normalize_keys(payload):
-    if not isinstance(payload, dict):
-        return payload
-    normalized = {}
-    for key, value in payload.items():
-        new_key = (
-            str(key)
-            .strip()
-            .replace("(", "_")
-            .replace(")", "")
-            .replace("/", "_")
-            .replace("%", "percent")
-            .replace("*", "")
-            .replace("+", "plus")
-            .replace("-", "minus")
-            .replace(" ", "_")
-            .lower()
-        )
-        while "__" in new_key:
-            new_key = new_key.replace("__", "_")
-        normalized[new_key] = value
-    return normalized
-
-
-def _normalize_generator_message(message: dict) -> dict:
-    payload = message.get("payload")
-    if not isinstance(payload, dict):
-        return message
-    data_point = payload.get("data", [{}])[0]
-    if not data_point:
-        return message
-    timestamp = data_point.get("tp")
-    points = {str(p.get("id")): p.get("val") for p in data_point.get("point", []) if p.get("id") is not None}
-    flattened = {"timestamp": timestamp, **points}
-    model = GeneratorDataModel.from_flat_dict(flattened)
-    normalized = dict(message)
-    normalized["payload"] = model.model_dump()
-    return normalized
-
-
-def _parse_payload(raw: bytes, *, pretty_json: bool):
+def _parse_payload(raw: bytes, *, pretty_json: bool, loads=None):
+    if loads is not None:
+        try:
+            return loads(raw)
+        except Exception:
+            pass
     try:
         text = raw.decode("utf-8")
     except UnicodeDecodeError:
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import base64
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from services.mqtt.processor import MessageEnvelope
+
+FORMATS = ("jsonl", "tshark")
+
+
+@dataclass(frozen=True)
+class RecordedMessage:
+    topic: str
+    payload: bytes
+    timestamp: float
+
+    def envelope(self, qos: int = 0) -> MessageEnvelope:
+        received = datetime.fromtimestamp(self.timestamp, timezone.utc).replace(tzinfo=None)
+        return MessageEnvelope(
+            topic=self.topic,
+            qos=qos,
+            retained=False,
+            payload=self.payload,
+            timestamp=received.isoformat() + "Z",
+        )
+
+
+def read_recording(path: str | Path, fmt: str | None = None) -> Iterator[RecordedMessage]:
+    """Messages captured in ``path``, in file order.
+
+    ``jsonl``: one ``{"topic", "payload", "timestamp"}`` object per line. ``payload`` is text,
+    a JSON value, or raw bytes as ``payload_hex``/``payload_base64``; ``timestamp`` is epoch
+    seconds (or milliseconds) or an ISO 8601 string.
+
+    ``tshark``: the tab-separated output of
+    ``tshark -Y "mqtt.msgtype == 3" -T fields -e frame.time_epoch -e mqtt.topic -e mqtt.msg``.
+    """
+    path = Path(path)
+    fmt = fmt or ("tshark" if path.suffix in {".tsv", ".txt"} else "jsonl")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown recording format {fmt!r}; expected one of {FORMATS}")
+    parse = _parse_jsonl_line if fmt == "jsonl" else _parse_tshark_line
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                yield from parse(line)
+            except (KeyError, TypeError, ValueError) as exc:
+                raise ValueError(f"{path}:{number}: {exc}") from exc
+
+
+def paced(
+    messages: Iterable[RecordedMessage],
+    speed: float,
+    *,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[RecordedMessage]:
+    """Yield ``messages`` at ``speed`` times their recorded rate; ``0`` means no pacing."""
+    started = None
+    first = None
+    for message in messages:
+        if speed > 0:
+            if started is None:
+                started, first = clock(), message.timestamp
+            delay = (message.timestamp - first) / speed - (clock() - started)
+            if delay > 0:
+                sleep(delay)
+        yield message
+
+
+def _parse_jsonl_line(line: str) -> Iterator[RecordedMessage]:
+    record = json.loads(line)
+    if "payload_hex" in record:
+        payload = bytes.fromhex(record["payload_hex"])
+    elif "payload_base64" in record:
+        payload = base64.b64decode(record["payload_base64"])
+    elif isinstance(record["payload"], str):
+        payload = record["payload"].encode("utf-8")
+    else:
+        payload = json.dumps(record["payload"]).encode("utf-8")
+    yield RecordedMessage(str(record["topic"]), payload, _epoch(record["timestamp"]))
+
+
+def _parse_tshark_line(line: str) -> Iterator[RecordedMessage]:
+    epoch, topics, messages = line.split("\t")[:3]
+    if "," not in topics:
+        yield RecordedMessage(topics, _tshark_bytes(messages), float(epoch))
+        return
+    # One frame can carry several PUBLISH packets; tshark joins their fields with commas.
+    for topic, message in zip(topics.split(","), messages.split(",")):
+        yield RecordedMessage(topic, _tshark_bytes(message), float(epoch))
+
+
+def _tshark_bytes(value: str) -> bytes:
+    try:
+        return bytes.fromhex(value.replace(":", ""))
+    except ValueError:
+        return value.encode("utf-8")
+
+
+def _epoch(value) -> float:
+    if isinstance(value, (int, float)):
+        value = float(value)
+        return value / 1000 if value > 1e12 else value
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
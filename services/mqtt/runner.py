@@ -13,6 +13,7 @@ import django
 
 from services.mqtt.client import build_client
 from services.mqtt.processor import MessageProcessor
+from services.mqtt.sharding import ShardedProcessor
 from services.mqtt.subscriber import on_connect, on_disconnect, on_message
 
 
@@ -30,13 +31,13 @@ def run() -> None:
     status = {"connected": False, "last_message": None, "dropped": 0, "fanout_errors": 0}
     status_lock = threading.Lock()
 
-    def _on_connect(client, userdata, flags, rc):
-        on_connect(client, userdata, flags, rc)
+    def _on_connect(client, userdata, flags, rc, properties=None):
+        on_connect(client, userdata, flags, rc, properties)
         with status_lock:
             status["connected"] = rc == 0
 
-    def _on_disconnect(client, userdata, rc):
-        on_disconnect(client, userdata, rc)
+    def _on_disconnect(client, userdata, rc, properties=None):
+        on_disconnect(client, userdata, rc, properties)
         with status_lock:
             status["connected"] = False
 
@@ -48,17 +49,32 @@ def run() -> None:
     _start_health_server(status, status_lock)
 
     client = build_client()
+    status["subscription"] = client.subscription_status()
     client.on_connect = _on_connect
     client.on_message = _on_message
     client.on_disconnect = _on_disconnect
-    processor = MessageProcessor()
+    workers = int(os.getenv("MQTT_PROCESS_WORKERS", "1"))
+    on_handoff = client.release if client.manual_ack else None
+    if workers > 1:
+        processor = ShardedProcessor(
+            workers, on_handoff=on_handoff, on_worker_lost=client.redeliver
+        )
+    else:
+        on_lost = client.redeliver if client.manual_ack else None
+        processor = MessageProcessor(on_handoff=on_handoff, on_lost=on_lost)
+    if client.manual_ack:
+        high_water = int(os.getenv("MQTT_FLOW_HIGH_WATER", "5000"))
+        low_water = int(os.getenv("MQTT_FLOW_LOW_WATER", str(high_water // 2)))
+        client.set_read_gate(processor.backlog, high_water=high_water, low_water=low_water)
     client.user_data_set(processor)
     processor.start()
 
     def _sync_metrics():
         while True:
+            metrics = processor.metrics()
+            metrics["flow"] = client.flow_metrics()
             with status_lock:
-                status.update(processor.metrics())
+                status.update(metrics)
             time.sleep(1.0)
 
     threading.Thread(target=_sync_metrics, name="mqtt-metrics-sync", daemon=True).start()
@@ -73,7 +89,7 @@ def run() -> None:
     signal.signal(signal.SIGINT, _shutdown)
 
     try:
-        client.connect_async(host, port, keepalive)
+        client.connect_async(host, port, keepalive, **client.connect_options)
         client.loop_start()
         stop_event.wait()
     finally:
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import threading
+import time
+import zlib
+from typing import Callable
+
+from services.mqtt.processor import MessageEnvelope, _parse_bool
+
+logger = logging.getLogger("mqtt.sharding")
+
+DEVICE_ID_PATTERN = re.compile(rb'"(?:id|device_id)"\s*:\s*"?([^",}\s]*)')
+JSON_STRING_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"')
+METRICS_INTERVAL_SECONDS = 1.0
+
+
+def shard_key(envelope: MessageEnvelope) -> bytes:
+    """``topic`` plus the payload's top-level device id, read without decoding the JSON.
+
+    Payloads without one (e.g. generator readings, whose ``id`` keys name nested points)
+    shard by topic alone.
+    """
+    device_id = _top_level_device_id(envelope.payload)
+    if device_id is None:
+        return envelope.topic.encode("utf-8")
+    return envelope.topic.encode("utf-8") + b"\0" + device_id
+
+
+def _top_level_device_id(payload: bytes) -> bytes | None:
+    for match in DEVICE_ID_PATTERN.finditer(payload):
+        # Depth of the key: open minus closed brackets before it, ignoring string contents.
+        prefix = JSON_STRING_PATTERN.sub(b'""', payload[: match.start()])
+        depth = prefix.count(b"{") + prefix.count(b"[") - prefix.count(b"}") - prefix.count(b"]")
+        if depth == 1:
+            return match.group(1)
+    return None
+
+
+def shard_for(envelope: MessageEnvelope, shards: int) -> int:
+    return zlib.crc32(shard_key(envelope)) % shards
+
+
+def _run_worker(index: int, envelopes, metrics, acks=None) -> None:
+    os.environ["MQTT_WORKER_INDEX"] = str(index)
+    # Backpressure goes to the shard queue, where the parent counts drops.
+    os.environ["MQTT_DROP_ON_FULL"] = "false"
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.dev")
+
+    import django
+
+    django.setup()
+
+    from services.mqtt.processor import MessageProcessor
+
+    on_handoff = None if acks is None else (lambda receipts: acks.put((index, receipts)))
+    # ``None`` in place of receipts tells the parent this worker lost messages.
+    on_lost = None if acks is None else (lambda: acks.put((index, None)))
+    processor = MessageProcessor(on_handoff=on_handoff, on_lost=on_lost)
+    processor.start()
+    stop_reporting = threading.Event()
+
+    def _report():
+        while not stop_reporting.wait(METRICS_INTERVAL_SECONDS):
+            metrics.put((index, processor.metrics()))
+
+    threading.Thread(target=_report, name="mqtt-worker-metrics", daemon=True).start()
+    try:
+        while True:
+            item = envelopes.get()
+            if item is None:
+                break
+            processor.enqueue(MessageEnvelope(*item))
+    finally:
+        processor.stop()
+        stop_reporting.set()
+        metrics.put((index, processor.metrics()))
+
+
+class ShardedProcessor:
+    """Spreads envelopes over N processes, each running a full ``MessageProcessor``.
+
+    Envelopes are hashed by (topic, device id) so every device stays on one process and
+    keeps its order; the parent only hashes and enqueues, and aggregates the metrics each
+    worker reports once a second.
+
+    With ``on_handoff``, workers send flow-control receipts back once their messages are
+    handed off. A worker that dies with receipts outstanding, or reports messages it could
+    neither store nor journal, calls ``on_worker_lost`` so the client can get those messages
+    redelivered.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        on_handoff: Callable[[list[int]], None] | None = None,
+        on_worker_lost: Callable[[], None] | None = None,
+    ) -> None:
+        self.workers = workers
+        self._on_handoff = on_handoff
+        self._on_worker_lost = on_worker_lost
+        self._context = multiprocessing.get_context("spawn")
+        maxsize = int(os.getenv("MQTT_SHARD_QUEUE", os.getenv("MQTT_MESSAGE_QUEUE", "10000")))
+        self._queues = [self._context.Queue(maxsize=maxsize) for _ in range(workers)]
+        self._metrics_queue = self._context.Queue()
+        self._acks = self._context.Queue() if on_handoff is not None else None
+        self._outstanding: list[set[int]] = [set() for _ in range(workers)]
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._worker_metrics: dict[int, dict] = {}
+        self._drop_on_full = _parse_bool(os.getenv("MQTT_DROP_ON_FULL", "true"))
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._dispatched = [0] * workers
+        self._dropped = [0] * workers
+        self._restarts = 0
+        self._rate = {"at": time.monotonic(), "processed": 0, "per_second": 0.0}
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._spawn(index)
+        threading.Thread(target=self._supervise, name="mqtt-shard-supervisor", daemon=True).start()
+        threading.Thread(target=self._collect, name="mqtt-shard-metrics", daemon=True).start()
+        if self._acks is not None:
+            threading.Thread(target=self._release, name="mqtt-shard-acks", daemon=True).start()
+        logger.info("started %s mqtt processing worker(s)", self.workers)
+
+    def stop(self) -> None:
+        """Ask every worker to drain and exit; terminate the ones that miss the deadline."""
+        self._stop_event.set()
+        deadline = time.monotonic() + float(os.getenv("MQTT_SHARD_STOP_TIMEOUT_SECONDS", "30"))
+        for index, shard in enumerate(self._queues):
+            try:
+                shard.put(None, timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Full:
+                logger.warning("mqtt worker %s queue still full at shutdown", index)
+        for index, process in self._processes.items():
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(
+                    "mqtt worker %s did not drain its queue (%s left); terminating",
+                    index,
+                    _qsize(self._queues[index]),
+                )
+                process.terminate()
+                process.join(timeout=5)
+                # Items left in the queue must not keep this process from exiting.
+                self._queues[index].cancel_join_thread()
+
+    def enqueue(self, envelope: MessageEnvelope) -> None:
+        index = shard_for(envelope, self.workers)
+        item = (
+            envelope.topic,
+            envelope.qos,
+            envelope.retained,
+            envelope.payload,
+            envelope.timestamp,
+            envelope.receipt,
+        )
+        if envelope.receipt is not None and self._acks is not None:
+            with self._lock:
+                self._outstanding[index].add(envelope.receipt)
+        try:
+            self._queues[index].put_nowait(item)
+        except queue.Full:
+            if self._drop_on_full:
+                with self._lock:
+                    self._dropped[index] += 1
+                logger.warning("shard %s queue full; dropping topic=%s", index, envelope.topic)
+                self._handoff(index, [envelope.receipt])
+                return
+            self._queues[index].put(item)
+        with self._lock:
+            self._dispatched[index] += 1
+
+    def backlog(self) -> int:
+        with self._lock:
+            reported = sum(
+                metrics.get("queue_size", 0) for metrics in self._worker_metrics.values()
+            )
+        return reported + sum(_qsize(shard) for shard in self._queues)
+
+    def metrics(self) -> dict:
+        totals: dict[str, float] = {}
+        workers = []
+        with self._lock:
+            reported = dict(self._worker_metrics)
+            dispatched = list(self._dispatched)
+            dropped = list(self._dropped)
+        for index in range(self.workers):
+            worker = reported.get(index, {})
+            process = self._processes.get(index)
+            entry = {
+                "index": index,
+                "pid": process.pid if process else None,
+                "alive": bool(process and process.is_alive()),
+                "shard_queue_size": _qsize(self._queues[index]),
+                "dispatched": dispatched[index],
+                "shard_dropped": dropped[index],
+                **worker,
+            }
+            workers.append(entry)
+            for key, value in worker.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        processed = int(totals.get("processed", 0))
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._rate["at"]
+            if elapsed >= METRICS_INTERVAL_SECONDS:
+                self._rate["per_second"] = (processed - self._rate["processed"]) / elapsed
+                self._rate.update(at=now, processed=processed)
+            per_second = self._rate["per_second"]
+        shard_queue_size = sum(entry["shard_queue_size"] for entry in workers)
+        return {
+            **totals,
+            "dropped": int(totals.get("dropped", 0)) + sum(dropped),
+            "shard_dropped": sum(dropped),
+            "dispatched": sum(dispatched),
+            "shard_queue_size": shard_queue_size,
+            "queue_size": shard_queue_size + int(totals.get("queue_size", 0)),
+            "messages_per_second": round(per_second, 1),
+            "worker_count": self.workers,
+            "worker_restarts": self._restarts,
+            "workers": workers,
+        }
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(index, self._queues[index], self._metrics_queue, self._acks),
+            name=f"mqtt-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _supervise(self) -> None:
+        while not self._stop_event.wait(1.0):
+            for index, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                logger.warning("mqtt worker %s exited with %s; restarting", index, process.exitcode)
+                self._restarts += 1
+                with self._lock:
+                    lost = bool(self._outstanding[index])
+                    self._outstanding[index].clear()
+                self._spawn(index)
+                if lost and self._on_worker_lost is not None:
+                    self._on_worker_lost()
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                index, metrics = self._metrics_queue.get(timeout=1.0)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                self._worker_metrics[index] = metrics
+
+    def _release(self) -> None:
+        while True:
+            try:
+                index, receipts = self._acks.get(timeout=1.0)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            if receipts is None:
+                self._lost()
+            else:
+                self._handoff(index, receipts)
+
+    def _lost(self) -> None:
+        # Redelivery drops the connection and with it every outstanding receipt.
+        with self._lock:
+            for outstanding in self._outstanding:
+                outstanding.clear()
+        if self._on_worker_lost is not None:
+            self._on_worker_lost()
+
+    def _handoff(self, index: int, receipts: list[int | None]) -> None:
+        if self._on_handoff is None:
+            return
+        receipts = [receipt for receipt in receipts if receipt is not None]
+        with self._lock:
+            self._outstanding[index].difference_update(receipts)
+        if receipts:
+            self._on_handoff(receipts)
+
+
+def _qsize(shard) -> int:
+    try:
+        return shard.qsize()
+    except NotImplementedError:
+        return 0
@@ -4,24 +4,30 @@ import logging
 import os
 from datetime import datetime
 
+from services.mqtt.client import AckingClient
 from services.mqtt.processor import MessageEnvelope, MessageProcessor
-from services.mqtt.topics import get_topics
+from services.mqtt.sharding import ShardedProcessor
+from services.mqtt.topics import get_shared_group, subscription_filters
 
 logger = logging.getLogger("mqtt.subscriber")
 
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
-        topics = get_topics()
+        topics = subscription_filters()
         qos = int(os.getenv("MQTT_QOS", "0"))
         for topic in topics:
             client.subscribe(topic, qos=qos)
-        logger.info("connected; subscribed to %s topic(s)", len(topics))
+        group = get_shared_group()
+        if group:
+            logger.info("connected; subscribed to %s topic(s) in group %s", len(topics), group)
+        else:
+            logger.info("connected; subscribed to %s topic(s)", len(topics))
     else:
         logger.error("connect failed rc=%s", rc)
 
 
-def on_disconnect(client, userdata, rc):
+def on_disconnect(client, userdata, rc, properties=None):
     if rc != 0:
         logger.warning("unexpected disconnect rc=%s", rc)
     else:
@@ -36,8 +42,9 @@ def on_message(client, userdata, msg):
         retained=msg.retain,
         payload=msg.payload,
         timestamp=timestamp,
+        receipt=client.defer_ack(msg) if isinstance(client, AckingClient) else None,
     )
-    if isinstance(userdata, MessageProcessor):
+    if isinstance(userdata, (MessageProcessor, ShardedProcessor)):
         userdata.enqueue(envelope)
         return
     logger.info(
@@ -0,0 +1,140 @@
+from services.mqtt.assembly import PacketAssembler, SharedPacketAssembler
+
+
+def _assembler(**overrides):
+    options = {"ttl_seconds": 10, "max_buffers": 100, "max_bytes": 10_000}
+    options.update(overrides)
+    return PacketAssembler(**options)
+
+
+def test_parts_from_different_devices_with_the_same_time_stay_apart():
+    assembler = _assembler()
+
+    assert assembler.add("RT", {"id": "a", "time": "1", "isend": "0", "ua": 1}, 10, now=0) is None
+    assert assembler.add("RT", {"id": "b", "time": "1", "isend": "0", "ua": 2}, 10, now=0) is None
+    packet = assembler.add("RT", {"id": "a", "time": "1", "isend": "1", "ub": 3}, 10, now=1)
+
+    assert packet == {"id": "a", "time": "1", "isend": "1", "ua": 1, "ub": 3}
+    assert assembler.add("RT", {"ua": 9}, 5, now=1) == {"ua": 9}
+    metrics = assembler.metrics()
+    assert metrics["completed"] == 1
+    assert metrics["open_buffers"] == 1
+    assert metrics["buffered_bytes"] == 10
+
+
+def test_idle_buffers_expire_and_caps_evict_the_oldest():
+    assembler = _assembler(max_buffers=2, max_bytes=25)
+
+    assembler.add("RT", {"id": "a", "time": "1", "isend": "0"}, 10, now=0)
+    assembler.add("RT", {"id": "b", "time": "1", "isend": "0"}, 10, now=5)
+    assembler.add("RT", {"id": "c", "time": "1", "isend": "0"}, 10, now=6)
+    assert assembler.metrics()["evicted"] == 1
+
+    assembler.add("RT", {"id": "b", "time": "1", "isend": "0", "ua": 1}, 10, now=7)
+    assert assembler.metrics()["evicted"] == 2
+    assembler.add("RT", {"id": "d", "time": "1", "isend": "0"}, 1, now=8)
+    assert assembler.add("RT", {"id": "b", "time": "1", "isend": "1"}, 10, now=9)["ua"] == 1
+
+    assert assembler.expire(now=30) == 1
+    metrics = assembler.metrics()
+    assert metrics["expired"] == 1
+    assert metrics["partial_packets"] == 3
+    assert metrics["open_buffers"] == 0
+    assert metrics["buffered_bytes"] == 0
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.ready = {}
+        self.clock = 0.0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def time(self):
+        return int(self.clock), int(round(self.clock % 1 * 1_000_000))
+
+    def hexists(self, key, field):
+        return field in self.hashes.get(key, {})
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, key):
+        return int(self.hashes.pop(key, None) is not None)
+
+    def expire(self, key, seconds):
+        return True
+
+    def zadd(self, key, mapping):
+        self.ready.update(mapping)
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        keys = sorted((score, member) for member, score in self.ready.items() if score <= high)
+        return [member for _, member in keys][start : start + num]
+
+    def zrem(self, key, member):
+        return int(self.ready.pop(member, None) is not None)
+
+    def zcard(self, key):
+        return len(self.ready)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def test_shared_assembly_merges_parts_received_by_different_replicas():
+    redis = FakeRedis()
+    first, second = (
+        SharedPacketAssembler(redis, ttl_seconds=300, settle_ms=500, poll_ms=0) for _ in range(2)
+    )
+
+    assert first.add("T", {"id": "m1", "time": "t", "isend": "0", "ua": 1}, 10, now=0.0) is None
+    assert (
+        second.add(
+            "T", {"id": "m1", "time": "t", "isend": "1", "ub": 2}, 10, now=0.1, timestamp="ts"
+        )
+        is None
+    )
+    assert first.ready(now=0.2) == []
+
+    claims = second.ready(now=0.7) + first.ready(now=0.7)
+    assert claims == [("T", "ts", {"id": "m1", "time": "t", "isend": "1", "ua": 1, "ub": 2})]
+    assert list(redis.hashes.values()) == [{SharedPacketAssembler.CLAIMED_FIELD: "1"}]
+    assert first.add("T", {"id": "m1", "ua": 1}, 10) == {"id": "m1", "ua": 1}
+
+
+def test_shared_assembly_drops_parts_that_arrive_after_the_claim():
+    redis = FakeRedis()
+    first, second = (
+        SharedPacketAssembler(redis, ttl_seconds=300, settle_ms=500, poll_ms=0) for _ in range(2)
+    )
+    # Replica clocks are ignored: deadlines follow the Redis server time.
+    redis.clock = 100.0
+    second.add("T", {"id": "m1", "time": "t", "isend": "1", "ub": 2}, 10, timestamp="ts")
+    first.add("T", {"id": "m1", "time": "t", "isend": "0", "ua": 1}, 10)
+    assert first.ready() == []
+
+    redis.clock = 100.6
+    assert first.ready() == [("T", "ts", {"id": "m1", "time": "t", "isend": "1", "ub": 2, "ua": 1})]
+
+    # A late part and a redelivered final part neither reopen nor re-emit the packet.
+    second.add("T", {"id": "m1", "time": "t", "isend": "0", "uc": 3}, 10)
+    first.add("T", {"id": "m1", "time": "t", "isend": "1", "ub": 2}, 10, timestamp="ts")
+    redis.clock = 102.0
+    assert first.ready() + second.ready() == []
+    assert redis.ready == {}
+    assert first.metrics()["late_parts"] + second.metrics()["late_parts"] == 2
@@ -0,0 +1,52 @@
+import json
+
+from apps.telemetry.schemas import validate_message
+from apps.telemetry.topic_routes import route_for
+from services.mqtt.assembly import PacketAssembler
+from services.mqtt.bench import TrafficGenerator, TrafficProfile, run_benchmark
+
+
+def test_synthetic_traffic_assembles_into_valid_messages():
+    generator = TrafficGenerator(TrafficProfile(devices=3, parts=3, seed=7))
+    assembler = PacketAssembler(ttl_seconds=60, max_buffers=100, max_bytes=1_000_000)
+    stream = generator.messages()
+    packets = []
+    for _ in range(60):
+        topic, raw = next(stream)
+        packet = assembler.add(topic, json.loads(raw), len(raw))
+        if packet is not None:
+            packets.append((topic, packet))
+
+    topics = {topic for topic, _ in packets}
+    assert {"MQTT_RT_DATA", "MQTT_ENY_NOW"} <= topics
+    for topic, packet in packets:
+        route = route_for(topic)
+        if route.normalizer is not None:
+            continue
+        device_id = packet.pop("id", None)
+        message = {"device_id": device_id, "topic": topic, "timestamp": "t", "payload": packet}
+        validate_message(message, route.payload_model)
+
+
+def test_benchmark_reports_steps_latency_and_queue_depth(monkeypatch):
+    monkeypatch.setenv("MQTT_STORAGE_MODE", "batch")
+    monkeypatch.setenv("MQTT_BATCH_FLUSH_MS", "20")
+    monkeypatch.setenv("MQTT_BROADCAST_FLUSH_MS", "20")
+
+    report = run_benchmark(
+        rates=[200],
+        step_seconds=0.5,
+        profile=TrafficProfile(devices=5, seed=3),
+        sample_interval=0.1,
+        drain_seconds=5,
+    )
+
+    step = report["steps"][0]
+    assert step["published"] > 50
+    assert step["dropped"] == 0
+    assert step["sustained"]
+    assert report["max_sustained_rate"] > 0
+    assert step["latency"]["end_to_end"]["p50_ms"] is not None
+    assert report["processor"]["writer"]["documents"] == report["processor"]["processed"]
+    assert len(report["queue_depth"]) >= 3
+    assert report["broadcasts"] > 0
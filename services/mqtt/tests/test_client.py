@@ -0,0 +1,65 @@
+from unittest import mock
+
+import paho.mqtt.client as mqtt
+
+from services.mqtt.client import AckingClient, build_client
+
+
+def _message(mid: int, qos: int = 1) -> mqtt.MQTTMessage:
+    message = mqtt.MQTTMessage(mid=mid)
+    message.qos = qos
+    return message
+
+
+def test_deferred_pubacks_are_sent_in_arrival_order():
+    client = AckingClient(client_id="test", manual_ack=True)
+    receipts = {}
+    with mock.patch.object(mqtt.Client, "_send_puback") as send_puback:
+        for mid in (11, 12, 13):
+            receipts[mid] = client.defer_ack(_message(mid))
+            client._send_puback(mid)  # what paho does once on_message returns
+        assert client.defer_ack(_message(14, qos=0)) is None
+        assert send_puback.call_count == 0
+
+        client.release([receipts[12]])
+        assert send_puback.call_count == 0
+        client.release([receipts[11]])
+        client.release([receipts[13], receipts[13]])
+
+    assert [call.args[-1] for call in send_puback.call_args_list] == [11, 12, 13]
+    assert client.flow_metrics()["pending_acks"] == 0
+
+
+def test_reads_pause_at_high_water_until_low_water():
+    client = AckingClient(client_id="test")
+    backlog = [0]
+    client.set_read_gate(lambda: backlog[0], high_water=100, low_water=20)
+
+    assert not client._should_pause()
+    backlog[0] = 100
+    assert client._should_pause()
+    backlog[0] = 50
+    assert client._should_pause()
+    backlog[0] = 20
+    assert not client._should_pause()
+    assert client.flow_metrics()["read_pauses"] == 1
+
+
+def test_shared_group_subscribes_with_share_prefix_over_mqtt_v5(monkeypatch):
+    monkeypatch.setenv("MQTT_SHARED_GROUP", "ingest")
+    monkeypatch.setenv("MQTT_REPLICA_ID", "replica-2")
+    monkeypatch.setenv("MQTT_TOPICS", '["MQTT_RT_DATA", "CCCL/+/ENV_01"]')
+    monkeypatch.setenv("MQTT_CLEAN_SESSION", "false")
+    monkeypatch.delenv("MQTT_PROTOCOL", raising=False)
+
+    client = build_client()
+
+    assert client.subscription_status() == {
+        "group": "ingest",
+        "partition": "replica-2",
+        "client_id": "telemetry-subscriber-replica-2",
+        "protocol": "5",
+        "filters": ["$share/ingest/MQTT_RT_DATA", "$share/ingest/CCCL/+/ENV_01"],
+    }
+    assert client.connect_options["clean_start"] is False
+    assert client.connect_options["properties"].SessionExpiryInterval == 3600
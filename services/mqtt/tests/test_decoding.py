@@ -0,0 +1,38 @@
+import pytest
+
+from services.mqtt.decoding import KeyNormalizer, json_decoder, normalize_key
+from services.mqtt.processor import _parse_payload
+
+
+def test_key_normalizer_reuses_known_layouts():
+    normalizer = KeyNormalizer(max_layouts=1)
+    first = normalizer.normalize("MQTT_RT_DATA", {"U+": 1, "Pf(a)": 2, "Hum %": 3, "id": "x"})
+    second = normalizer.normalize("MQTT_RT_DATA", {"U+": 4, "Pf(a)": 5, "Hum %": 6, "id": "y"})
+    normalizer.normalize("MQTT_RT_DATA", {"other": 1})
+
+    assert first == {"uplus": 1, "pf_a": 2, "hum_percent": 3, "id": "x"}
+    assert second == {"uplus": 4, "pf_a": 5, "hum_percent": 6, "id": "y"}
+    assert normalizer.metrics() == {"key_cache_hits": 1, "key_cache_misses": 2, "layouts": 1}
+    assert normalize_key(" Temp-1 (C) ") == "tempminus1_c"
+
+
+def test_key_normalizer_caps_layouts_across_topics():
+    normalizer = KeyNormalizer(max_layouts=8)
+    for index in range(100):
+        normalizer.normalize(f"devices/{index}", {"U+": index})
+
+    assert normalizer.metrics()["layouts"] == 8
+    assert normalizer.normalize("devices/99", {"U+": 1}) == {"uplus": 1}
+    assert normalizer.metrics()["key_cache_hits"] == 1
+
+
+@pytest.mark.parametrize("name", ["auto", "json"])
+def test_parse_payload_falls_back_for_non_strict_json(name):
+    _, loads = json_decoder(name)
+
+    assert _parse_payload(b'{"a": 1.5}', pretty_json=False, loads=loads) == {"a": 1.5}
+    assert _parse_payload(b'{"a": NaN}', pretty_json=False, loads=loads)["a"] != 0
+    assert _parse_payload(b"not json", pretty_json=False, loads=loads) == "not json"
+    assert _parse_payload(b"\xff\x00", pretty_json=False, loads=loads) == "ff00"
+    with pytest.raises(ValueError):
+        json_decoder("yaml")
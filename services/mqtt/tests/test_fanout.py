@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from services.mqtt.fanout import CoalescingBroadcaster
+
+
+class RecordingLayer:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def group_send(self, group, event):
+        await asyncio.sleep(self.delay)
+        self.sent.append((group, event["message"]["device_id"], event["message"]["value"]))
+
+
+def _message(device_id, value):
+    return {"topic": "MQTT_RT_DATA", "device_id": device_id, "value": value}
+
+
+def test_broadcaster_keeps_latest_message_per_device():
+    layer = RecordingLayer()
+    broadcaster = CoalescingBroadcaster(flush_ms=200, group="live", channel_layer=lambda: layer)
+    broadcaster.start()
+    for value in range(5):
+        broadcaster.submit(_message("a", value))
+    broadcaster.submit(_message("b", 0))
+    broadcaster.stop()
+
+    assert sorted(layer.sent) == [("live", "a", 4), ("live", "b", 0)]
+    metrics = broadcaster.metrics()
+    assert metrics["coalesced"] == 4
+    assert metrics["broadcasts"] == 2
+    assert metrics["pending"] == 0
+
+
+def test_submit_never_waits_on_a_slow_channel_layer():
+    layer = RecordingLayer(delay=0.5)
+    broadcaster = CoalescingBroadcaster(
+        maxsize=2, flush_ms=10, send_timeout=0.2, channel_layer=lambda: layer
+    )
+    broadcaster.start()
+    broadcaster.submit(_message("a", 0))
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    accepted = [broadcaster.submit(_message(device, 1)) for device in "bcd"]
+    elapsed = time.monotonic() - started
+    broadcaster.stop()
+
+    assert elapsed < 0.05
+    assert accepted == [True, True, False]
+    metrics = broadcaster.metrics()
+    assert metrics["dropped"] == 1
+    assert metrics["errors"] >= 1
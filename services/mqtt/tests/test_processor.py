@@ -0,0 +1,122 @@
+import functools
+import json
+from unittest import mock
+
+import paho.mqtt.client as mqtt
+from pymongo.errors import AutoReconnect
+
+from services.mqtt import processor as mqtt_processor
+from services.mqtt.client import AckingClient
+from services.mqtt.processor import MessageEnvelope, MessageProcessor
+
+
+def _envelope(device_id: str) -> MessageEnvelope:
+    return MessageEnvelope(
+        topic="MQTT_DAY_DATA",
+        qos=0,
+        retained=False,
+        payload=json.dumps({"id": device_id, "kwh": 1.5}).encode("utf-8"),
+        timestamp="2026-01-01T00:00:00Z",
+    )
+
+
+def test_celery_batch_mode_accumulates_messages_into_batch_tasks(monkeypatch):
+    monkeypatch.setenv("MQTT_STORAGE_MODE", "celery_batch")
+    monkeypatch.setenv("MQTT_BATCH_SIZE", "2")
+    monkeypatch.setenv("MQTT_BATCH_FLUSH_MS", "50")
+    with mock.patch.object(mqtt_processor, "mark_device_seen"), mock.patch.object(
+        mqtt_processor.CoalescingBroadcaster, "submit"
+    ), mock.patch.object(mqtt_processor.store_events_mongo_batch, "delay") as delay:
+        processor = MessageProcessor()
+        processor.start()
+        for device_id in ("a", "b", "c"):
+            processor.enqueue(_envelope(device_id))
+        processor.stop()
+
+    batches = [call.args[0] for call in delay.call_args_list]
+    assert [[message["device_id"] for message in batch] for batch in batches] == [["a", "b"], ["c"]]
+    assert len({message["event_id"] for batch in batches for message in batch}) == 3
+    assert processor.metrics()["batches_enqueued"] == 2
+
+
+def test_generator_message_is_flattened_and_validated_once(monkeypatch):
+    monkeypatch.setenv("MQTT_STORAGE_MODE", "batch")
+    raw = {"data": [{"tp": 1767225600000, "point": [{"id": 7, "val": 230.5}]}]}
+    envelope = MessageEnvelope(
+        topic="CCCL/PURBACHAL/ENM_01",
+        qos=0,
+        retained=False,
+        payload=json.dumps(raw).encode("utf-8"),
+        timestamp="2026-01-01T00:00:00Z",
+    )
+    with mock.patch.object(mqtt_processor.CoalescingBroadcaster, "submit") as broadcast, mock.patch(
+        "services.mqtt.writer.MongoBatchWriter.submit"
+    ) as store:
+        processor = MessageProcessor()
+        processor.start()
+        processor.enqueue(envelope)
+        processor.stop()
+
+    event = store.call_args.args[0]
+    assert broadcast.call_args.args[0] is event
+    assert event.to_dict()["payload"] == {"timestamp": 1767225600000, "7": 230.5}
+
+
+def test_flow_control_hands_off_receipts_after_storage(monkeypatch):
+    monkeypatch.setenv("MQTT_FLOW_CONTROL", "true")
+    handed_off = []
+    envelopes = [
+        MessageEnvelope(**{**vars(_envelope("a")), "receipt": 1}),
+        MessageEnvelope(
+            topic="MQTT_RT_DATA",
+            qos=1,
+            retained=False,
+            payload=b'{"id": "b", "ua": "not-a-number"}',
+            timestamp="2026-01-01T00:00:00Z",
+            receipt=2,
+        ),
+    ]
+    with mock.patch.object(mqtt_processor, "mark_device_seen"), mock.patch.object(
+        mqtt_processor.CoalescingBroadcaster, "submit"
+    ), mock.patch.object(mqtt_processor.store_event_mongo_task, "delay") as delay:
+        processor = MessageProcessor(on_handoff=handed_off.extend)
+        processor.start()
+        for envelope in envelopes:
+            processor.enqueue(envelope)
+        processor.stop()
+
+    assert delay.call_count == 1
+    assert handed_off == [1, 2]
+
+
+def test_messages_lost_to_a_failed_insert_are_never_acknowledged(monkeypatch):
+    monkeypatch.setenv("MQTT_STORAGE_MODE", "batch")
+    monkeypatch.setenv("MQTT_BATCH_FLUSH_MS", "10")
+    monkeypatch.delenv("INGEST_JOURNAL_DIR", raising=False)
+
+    def broken():
+        raise AutoReconnect("down")
+
+    client = AckingClient(client_id="test", manual_ack=True)
+    envelopes = []
+    for mid, device_id in ((21, "a"), (22, "b")):
+        message = mqtt.MQTTMessage(mid=mid)
+        message.qos = 1
+        receipt = client.defer_ack(message)
+        envelopes.append(MessageEnvelope(**{**vars(_envelope(device_id)), "receipt": receipt}))
+    writer = functools.partial(mqtt_processor.MongoBatchWriter, database=broken)
+    with mock.patch.object(mqtt_processor, "MongoBatchWriter", writer), mock.patch.object(
+        mqtt_processor, "mark_device_seen"
+    ), mock.patch.object(mqtt_processor.CoalescingBroadcaster, "submit"), mock.patch.object(
+        mqtt.Client, "_send_puback"
+    ) as send_puback:
+        processor = MessageProcessor(on_handoff=client.release, on_lost=client.redeliver)
+        processor.start()
+        for envelope in envelopes:
+            processor.enqueue(envelope)
+        processor.stop()
+
+    assert send_puback.call_count == 0
+    assert client.flow_metrics()["pending_acks"] == 2
+    assert client._redeliver is True
+    assert processor.metrics()["unacked_lost"] == 2
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management import call_command
+
+from services.mqtt.recording import RecordedMessage, paced, read_recording
+
+
+def test_reads_jsonl_and_tshark_recordings(tmp_path):
+    jsonl = tmp_path / "capture.jsonl"
+    jsonl.write_text(
+        "\n".join(
+            [
+                json.dumps({"topic": "A", "payload": {"id": "x"}, "timestamp": 1767225600000}),
+                json.dumps({"topic": "B", "payload": "text", "timestamp": "2026-01-01T00:00:01Z"}),
+                "",
+                json.dumps({"topic": "C", "payload_hex": "00ff", "timestamp": 1767225602.5}),
+            ]
+        )
+    )
+    tsv = tmp_path / "capture.tsv"
+    tsv.write_text("1767225600.25\tA,B\t7b7d,3a:29\n")
+
+    assert list(read_recording(jsonl)) == [
+        RecordedMessage("A", b'{"id": "x"}', 1767225600.0),
+        RecordedMessage("B", b"text", 1767225601.0),
+        RecordedMessage("C", b"\x00\xff", 1767225602.5),
+    ]
+    assert list(read_recording(tsv)) == [
+        RecordedMessage("A", b"{}", 1767225600.25),
+        RecordedMessage("B", b":)", 1767225600.25),
+    ]
+    assert RecordedMessage("A", b"", 1767225600.0).envelope().timestamp == "2026-01-01T00:00:00Z"
+
+
+def test_paced_replay_follows_recorded_gaps_at_the_chosen_speed():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    messages = [RecordedMessage("A", b"", at) for at in (100.0, 101.0, 104.0)]
+    assert list(paced(messages, 2, clock=lambda: now[0], sleep=sleep)) == messages
+    assert sleeps == [0.5, 1.5]
+    assert list(paced(messages, 0, clock=lambda: now[0], sleep=sleep)) == messages
+    assert len(sleeps) == 2
+
+
+def test_replay_command_runs_recording_through_processor(tmp_path, monkeypatch, capsys):
+    for name in ("MQTT_WORKER_INDEX", "MQTT_DROP_ON_FULL", "MQTT_STORAGE_MODE"):
+        monkeypatch.setenv(name, "")
+    monkeypatch.setenv("MQTT_BROADCAST_ENABLED", "")
+    monkeypatch.setenv("MQTT_TRACK_DEVICES", "")
+    monkeypatch.setenv("MQTT_FLOW_CONTROL", "")
+    capture = tmp_path / "capture.jsonl"
+    parts = [
+        {"id": "m1", "time": "t1", "isend": "0", "kwh": 1},
+        {"id": "m1", "time": "t1", "isend": "1", "kvarh": 2},
+        {"id": "m2", "kwh": 3},
+    ]
+    capture.write_text(
+        "\n".join(
+            json.dumps({"topic": "MQTT_DAY_DATA", "payload": part, "timestamp": 1767225600 + i})
+            for i, part in enumerate(parts)
+        )
+    )
+
+    call_command("replay_mqtt", str(capture), "--storage-mode", "none", "--no-broadcast", "--json")
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["replayed"] == 3
+    assert report["processed"] == 2
+    assert report["assembly"]["completed"] == 1
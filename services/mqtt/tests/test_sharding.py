@@ -0,0 +1,86 @@
+import json
+import time
+
+from services.mqtt.processor import MessageEnvelope
+from services.mqtt.sharding import ShardedProcessor, shard_for, shard_key
+
+
+def _envelope(topic: str, payload: dict) -> MessageEnvelope:
+    return MessageEnvelope(
+        topic=topic,
+        qos=0,
+        retained=False,
+        payload=json.dumps(payload).encode("utf-8"),
+        timestamp="2026-01-01T00:00:00Z",
+    )
+
+
+def test_parts_of_a_device_packet_share_a_shard():
+    parts = [
+        _envelope("MQTT_RT_DATA", {"id": "GW-7", "time": "1", "isend": "0", "Ua": 230}),
+        _envelope("MQTT_RT_DATA", {"time": "1", "id": "GW-7", "isend": "1", "Ia": 4}),
+        _envelope("MQTT_RT_DATA", {"device_id": "GW-7", "time": "2"}),
+    ]
+
+    assert {shard_key(part) for part in parts} == {b"MQTT_RT_DATA\0GW-7"}
+    assert len({shard_for(part, 8) for part in parts}) == 1
+    assert shard_key(_envelope("CCCL/PURBACHAL/ENV_01", {"temp": 21})) == b"CCCL/PURBACHAL/ENV_01"
+
+
+def test_nested_point_ids_do_not_pick_the_shard():
+    reading = {"data": [{"tp": 1767225600000, "point": [{"id": 7, "val": 230.5}]}]}
+    labelled = {"note": '"id": "x"', "points": [{"id": 7}], "device_id": "GEN-1"}
+
+    assert shard_key(_envelope("CCCL/PURBACHAL/GEN_01", reading)) == b"CCCL/PURBACHAL/GEN_01"
+    assert shard_key(_envelope("GEN", labelled)) == b"GEN\0GEN-1"
+
+
+def test_devices_spread_over_shards():
+    shards = {shard_for(_envelope("MQTT_RT_DATA", {"id": f"GW-{index}"}), 4) for index in range(64)}
+
+    assert shards == {0, 1, 2, 3}
+
+
+def test_full_shard_queue_drops_and_reports(monkeypatch):
+    monkeypatch.setenv("MQTT_SHARD_QUEUE", "1")
+    monkeypatch.setenv("MQTT_DROP_ON_FULL", "true")
+    processor = ShardedProcessor(2)
+    envelope = _envelope("MQTT_RT_DATA", {"id": "GW-1"})
+    index = shard_for(envelope, 2)
+
+    processor.enqueue(envelope)
+    processor.enqueue(envelope)
+    metrics = processor.metrics()
+
+    assert metrics["dispatched"] == 1
+    assert metrics["dropped"] == metrics["shard_dropped"] == 1
+    assert metrics["workers"][index]["shard_queue_size"] == 1
+    assert metrics["workers"][index]["alive"] is False
+
+
+def test_stop_terminates_workers_that_do_not_drain(monkeypatch):
+    monkeypatch.setenv("MQTT_SHARD_QUEUE", "1")
+    monkeypatch.setenv("MQTT_SHARD_STOP_TIMEOUT_SECONDS", "0.2")
+    monkeypatch.setenv("MQTT_DROP_ON_FULL", "true")
+
+    class StuckProcess:
+        terminated = False
+
+        def is_alive(self):
+            return not self.terminated
+
+        def join(self, timeout=None):
+            pass
+
+        def terminate(self):
+            self.terminated = True
+
+    processor = ShardedProcessor(1)
+    processor._processes[0] = StuckProcess()
+    processor.enqueue(_envelope("MQTT_RT_DATA", {"id": "GW-1"}))
+    started = time.monotonic()
+
+    processor.stop()
+
+    assert time.monotonic() - started < 5
+    assert processor._processes[0].terminated
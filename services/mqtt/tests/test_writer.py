@@ -0,0 +1,158 @@
+import queue
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from services.mqtt.writer import MongoBatchWriter
+
+
+class FakeCollection:
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def insert_many(self, documents, ordered=True):
+        if self.name in self.failing:
+            raise AutoReconnect("down")
+        self.calls.append((self.name, [doc["device_id"] for doc in documents], ordered))
+
+
+class FakeDatabase:
+    def __init__(self, failing=()):
+        self.calls = []
+        self.failing = set(failing)
+
+    def __getitem__(self, name):
+        collection = FakeCollection(self.calls, name)
+        collection.failing = self.failing
+        return collection
+
+
+def _message(topic, device_id):
+    return {
+        "topic": topic,
+        "device_id": device_id,
+        "timestamp": "2026-01-01T00:00:00Z",
+        "payload": {},
+    }
+
+
+def test_writer_groups_batches_by_collection():
+    database = FakeDatabase()
+    writer = MongoBatchWriter(batch_size=3, flush_ms=5000, database=lambda: database)
+    writer.start()
+
+    assert writer.submit(_message("MQTT_RT_DATA", "a"))
+    assert writer.submit(_message("MQTT_ENY_NOW", "b"))
+    assert writer.submit(_message("MQTT_RT_DATA", "c"))
+    assert not writer.submit(_message("UNKNOWN", "d"))
+    writer.stop()
+
+    calls = sorted(database.calls)
+    assert calls == [
+        ("grid_eny_now_data", ["b"], False),
+        ("grid_rt_data", ["a", "c"], False),
+        ("last_7_days_grid_eny_now_data", ["b"], False),
+        ("telemetry_events", ["a", "b", "c"], False),
+        ("today_grid_eny_now_data", ["b"], False),
+    ]
+    metrics = writer.metrics()
+    assert metrics["batches"] == 1
+    assert metrics["last_batch_size"] == 3
+    assert metrics["avg_batch_size"] == 3.0
+
+
+def test_writer_hands_failed_batches_to_journal():
+    def broken():
+        raise AutoReconnect("down")
+
+    failed = []
+
+    def on_failure(records):
+        failed.extend(records)
+        return len(records) - 1
+
+    stored, lost = [], []
+    writer = MongoBatchWriter(
+        batch_size=10,
+        flush_ms=10,
+        database=broken,
+        on_failure=on_failure,
+        on_stored=stored.extend,
+        on_lost=lost.extend,
+    )
+    writer.start()
+    writer.submit(_message("MQTT_RT_DATA", "a"), receipt=1)
+    writer.submit(_message("MQTT_DAY_DATA", "b"), receipt=2)
+    writer.stop()
+
+    assert [record["collections"] for record in failed] == [
+        ["grid_rt_data", "telemetry_events"],
+        ["grid_day_data", "telemetry_events"],
+    ]
+    assert all("_id" in record["document"] for record in failed)
+    metrics = writer.metrics()
+    assert metrics["errors"] >= 1
+    assert metrics["lost"] == 1
+    assert (stored, lost) == ([1], [2])
+
+
+def test_writer_survives_a_failing_batch_and_rejects_submits_once_stopped():
+    database = FakeDatabase()
+    calls = []
+
+    def on_stored(receipts):
+        calls.append(receipts)
+        if len(calls) == 1:
+            raise ValueError("boom")
+
+    writer = MongoBatchWriter(
+        batch_size=1, flush_ms=5000, database=lambda: database, on_stored=on_stored
+    )
+    writer.start()
+    writer.submit(_message("MQTT_RT_DATA", "a"), receipt=1)
+    writer.submit(_message("MQTT_RT_DATA", "b"), receipt=2)
+    writer.stop()
+
+    assert calls == [[1], [2]]
+    assert writer.metrics()["flush_errors"] == 1
+    with pytest.raises(RuntimeError):
+        writer.submit(_message("MQTT_RT_DATA", "c"))
+
+
+def test_submit_gives_up_when_the_queue_stays_full():
+    writer = MongoBatchWriter(batch_size=10, flush_ms=5000, queue_size=1, submit_timeout=0.01)
+    writer._thread.is_alive = lambda: True
+    writer.submit(_message("MQTT_RT_DATA", "a"))
+
+    with pytest.raises(queue.Full):
+        writer.submit(_message("MQTT_RT_DATA", "b"))
+
+
+def test_writer_journals_only_the_collections_that_failed():
+    database = FakeDatabase(failing=["grid_rt_data"])
+    failed, stored = [], []
+
+    def on_failure(records):
+        failed.extend(records)
+        return len(records)
+
+    writer = MongoBatchWriter(
+        batch_size=10,
+        flush_ms=10,
+        database=lambda: database,
+        on_failure=on_failure,
+        on_stored=stored.extend,
+    )
+    writer.start()
+    writer.submit(_message("MQTT_RT_DATA", "a"), receipt=1)
+    writer.submit(_message("MQTT_DAY_DATA", "b"), receipt=2)
+    writer.stop()
+
+    assert [record["collections"] for record in failed] == [["grid_rt_data"]]
+    assert sorted(database.calls) == [
+        ("grid_day_data", ["b"], False),
+        ("telemetry_events", ["a", "b"], False),
+    ]
+    assert stored == [1, 2]
+    assert writer.metrics()["lost"] == 0
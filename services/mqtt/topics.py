@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import os
+import socket
 
 
 def get_topics() -> list[str]:
@@ -15,3 +16,24 @@ def get_topics() -> list[str]:
     if isinstance(topics, str):
         topics = [topics]
     return [str(topic) for topic in topics if str(topic)]
+
+
+def get_shared_group() -> str:
+    """Shared-subscription group (``MQTT_SHARED_GROUP``); empty for plain subscriptions."""
+    group = os.getenv("MQTT_SHARED_GROUP", "").strip()
+    if any(char in group for char in "/+#"):
+        raise ValueError(f"MQTT_SHARED_GROUP may not contain '/', '+' or '#': {group!r}")
+    return group
+
+
+def get_replica_id() -> str:
+    return os.getenv("MQTT_REPLICA_ID") or socket.gethostname()
+
+
+def subscription_filters(topics: list[str] | None = None) -> list[str]:
+    """Topic filters to subscribe, as ``$share/<group>/<filter>`` when a group is set."""
+    topics = get_topics() if topics is None else topics
+    group = get_shared_group()
+    if not group:
+        return topics
+    return [topic if topic.startswith("$share/") else f"$share/{group}/{topic}" for topic in topics]
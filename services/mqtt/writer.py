@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Set, Tuple
+
+from pymongo.errors import PyMongoError
+
+from apps.telemetry.schemas import TelemetryMessage
+from apps.telemetry.services import prepare_event_document
+from common.mongo import get_mongo_database
+from services.journal import journal_record, write_journal_records
+from services.writers import BatchWriterState
+
+logger = logging.getLogger("mqtt.writer")
+
+
+class MongoBatchWriter:
+    """Stores telemetry messages in Mongo from a background thread in size/time batches.
+
+    Each message becomes one journal-style record (document with a pinned ``_id`` plus its
+    topic collections and ``telemetry_events``); a flush groups the batch by collection and
+    issues one unordered ``insert_many`` per collection. Records some collection did not
+    store go to ``on_failure``, narrowed to the collections still missing them, so they can
+    be journaled and replayed without duplicates; it returns how many records, in order, it
+    kept.
+
+    Receipts of messages that are now durable go to ``on_stored``; the rest go to
+    ``on_lost`` and must not be acknowledged.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        flush_ms: int,
+        queue_size: int = 10000,
+        database: Callable[[], object] = get_mongo_database,
+        on_failure: Callable[[List[dict]], int] | None = None,
+        on_stored: Callable[[List[int]], None] | None = None,
+        on_lost: Callable[[List[int]], None] | None = None,
+        submit_timeout: float = 5.0,
+    ) -> None:
+        self.state = BatchWriterState("mqtt-mongo-writer", batch_size=batch_size, flush_ms=flush_ms)
+        self._database = database
+        self._on_failure = on_failure
+        self._on_stored = on_stored
+        self._on_lost = on_lost
+        self._submit_timeout = submit_timeout
+        self._queue: queue.Queue[Tuple[dict, int | None]] = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.state.name, daemon=True)
+        self._metrics = {"lost": 0, "flush_errors": 0}
+        self._metrics_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    def submit(self, message: dict | TelemetryMessage, receipt: int | None = None) -> bool:
+        """Queue ``message`` for storage; ``False`` when its topic maps to no collection.
+
+        ``receipt`` is passed to ``on_stored`` once the message has been inserted or kept by
+        ``on_failure``, and to ``on_lost`` otherwise. Raises ``RuntimeError`` when the writer thread
+        is not running and ``queue.Full`` when the queue stays full for ``submit_timeout``.
+        """
+        document, collections = prepare_event_document(message)
+        if not collections:
+            return False
+        if not self._thread.is_alive():
+            raise RuntimeError(f"{self.state.name} is not running")
+        record = journal_record(document, [*collections, "telemetry_events"])
+        self._queue.put((record, receipt), timeout=self._submit_timeout)
+        return True
+
+    def metrics(self) -> dict:
+        payload = self.state.metrics()
+        with self._metrics_lock:
+            payload.update(self._metrics)
+        batches = payload["batches"]
+        payload["avg_batch_size"] = round(payload["documents"] / batches, 1) if batches else 0.0
+        payload["queue_size"] = self._queue.qsize()
+        return payload
+
+    def _run(self) -> None:
+        batch: List[Tuple[dict, int | None]] = []
+        last_flush = time.monotonic()
+        while not self._stop_event.is_set() or not self._queue.empty():
+            timeout = max(self.state.flush_ms / 1000 - (time.monotonic() - last_flush), 0.01)
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                while len(batch) < self.state.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            should_flush = len(batch) >= self.state.batch_size or (
+                batch and (time.monotonic() - last_flush) * 1000 >= self.state.flush_ms
+            )
+            if should_flush:
+                self._flush_safely(batch)
+                batch = []
+                last_flush = time.monotonic()
+            elif not batch:
+                last_flush = time.monotonic()
+
+        if batch:
+            self._flush_safely(batch)
+
+    def _flush_safely(self, batch: List[Tuple[dict, int | None]]) -> None:
+        # One bad batch must not kill the thread and strand everything queued behind it.
+        try:
+            self._flush(batch)
+        except Exception as exc:
+            logger.exception("mqtt writer flush error: %s", exc)
+            with self._metrics_lock:
+                self._metrics["flush_errors"] += 1
+            self._report(self._on_lost, batch)
+
+    def _flush(self, batch: List[Tuple[dict, int | None]]) -> None:
+        lost = self._write([record for record, _ in batch])
+        self._report(
+            self._on_stored, [item for index, item in enumerate(batch) if index not in lost]
+        )
+        self._report(self._on_lost, [item for index, item in enumerate(batch) if index in lost])
+
+    def _report(
+        self, callback: Callable[[List[int]], None] | None, batch: List[Tuple[dict, int | None]]
+    ) -> None:
+        receipts = [receipt for _, receipt in batch if receipt is not None]
+        if receipts and callback is not None:
+            callback(receipts)
+
+    def _write(self, batch: List[dict]) -> Set[int]:
+        """Store ``batch``; return the indexes of records that are neither stored nor kept."""
+        started = time.monotonic()
+        try:
+            pending = write_journal_records(self._database(), batch)
+        except PyMongoError as exc:
+            logger.error("mongo batch insert error: %s", exc)
+            pending = batch
+        self.state.record(
+            len(batch),
+            (time.monotonic() - started) * 1000,
+            ok=not pending,
+            queue_depth=self._queue.qsize(),
+        )
+        if not pending:
+            logger.debug("stored %s mqtt records", len(batch))
+            return set()
+        if pending is not batch:
+            logger.error("mongo batch partly stored; %s record(s) still pending", len(pending))
+        # ``pending`` only lists the collections each record still misses.
+        kept = self._on_failure(pending) if self._on_failure is not None else 0
+        if kept >= len(pending):
+            return set()
+        with self._metrics_lock:
+            self._metrics["lost"] += len(pending) - kept
+        positions = {id(record["document"]): index for index, record in enumerate(batch)}
+        return {positions[id(record["document"])] for record in pending[kept:]}
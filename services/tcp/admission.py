@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second with bursts of up to ``burst``; ``rate <= 0`` is off."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def take(self, now: float | None = None) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class AdmissionController:
+    """Decides whether a freshly accepted connection may be served.
+
+    ``admit`` returns ``None`` and reserves a slot for the source IP, or the rejection
+    reason (``"rate"``, ``"capacity"`` or ``"per_ip"``); every admitted connection must be
+    ``release``-d. Limits of zero or less are disabled.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_total: int,
+        max_per_ip: int,
+        accept_rate: float,
+        accept_burst: float,
+    ) -> None:
+        self.max_total = max_total
+        self.max_per_ip = max_per_ip
+        self._bucket = TokenBucket(accept_rate, accept_burst)
+        self._per_ip: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def admit(self, host: str, now: float | None = None) -> str | None:
+        with self._lock:
+            if not self._bucket.take(now):
+                return "rate"
+            if self.max_total > 0 and self._total >= self.max_total:
+                return "capacity"
+            count = self._per_ip.get(host, 0)
+            if self.max_per_ip > 0 and count >= self.max_per_ip:
+                return "per_ip"
+            self._per_ip[host] = count + 1
+            self._total += 1
+        return None
+
+    def release(self, host: str) -> None:
+        with self._lock:
+            count = self._per_ip.get(host, 0)
+            if not count:
+                return
+            self._total -= 1
+            if count > 1:
+                self._per_ip[host] = count - 1
+            else:
+                del self._per_ip[host]
+
+    def source_count(self) -> int:
+        with self._lock:
+            return len(self._per_ip)
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import resource
+import signal
+import threading
+import time
+from typing import Dict, List
+
+from services.tcp.framing import ModbusFrame, ModbusStreamDecoder
+from services.tcp.scheduler import PollTarget
+from services.tcp.server import TCPSocketServer
+
+logger = logging.getLogger("tcp.server")
+
+
+class AsyncTCPSocketServer(TCPSocketServer):
+    """Event-loop engine for the gateway protocol.
+
+    Each connection is a coroutine instead of an executor thread, so idle gateways only cost
+    a socket and a small task. Batching, health and ``_store_data`` are inherited unchanged;
+    ``_store_data`` only validates and enqueues, so it is called directly on the loop. The one
+    blocking step, journaling a reading the full queue rejects, runs on the default executor.
+    """
+
+    def __init__(self, *args, max_connections: int | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if max_connections is None:
+            max_connections = int(os.getenv("TCP_ASYNC_MAX_CLIENTS", "10000"))
+        self.max_connections = max_connections
+        self._admission.max_total = max_connections
+        self._active_connections = 0
+        self._stream_writers: set[asyncio.StreamWriter] = set()
+
+    def _overflow(self, document: dict, client_id: str) -> bool:
+        if self._journal is None:
+            return False
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return super()._overflow(document, client_id)
+        # The journal append writes (and may fsync) a file; keep it off the event loop.
+        future = loop.run_in_executor(None, self._journal_documents, [document])
+        future.add_done_callback(functools.partial(_log_overflow, client_id))
+        return True
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        addr = writer.get_extra_info("peername") or ("unknown", 0)
+        client_id = f"{addr[0]}:{addr[1]}"
+        if not self._admit(addr):
+            writer.close()
+            return
+
+        logger.info("new connection from %s", client_id)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            self._configure_client_socket(sock)
+        self._active_connections += 1
+        self._stream_writers.add(writer)
+        self._connection_opened()
+        accumulated_data: Dict[str, List[float]] = {}
+        decoder = ModbusStreamDecoder(self.profiles.heartbeats)
+        profile = self.profiles.default
+        poller = self._new_poller(profile)
+        target: PollTarget | None = None
+        timeout_retries = 0
+        identified = False
+        read_timeout = min(self.handshake_timeout, self.client_timeout)
+
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        reader.read(self.recv_buffer_size), timeout=read_timeout
+                    )
+                except asyncio.TimeoutError:
+                    if not poller.pending:
+                        raise
+                    logger.warning("timeout waiting for response from %s", client_id)
+                    with self._metrics_lock:
+                        self._metrics["timeouts_total"] += 1
+                    poller.reset()
+                    timeout_retries += 1
+                    if timeout_retries >= self.timeout_max_retries:
+                        logger.warning("max timeouts reached for %s; closing", client_id)
+                        break
+                    await asyncio.sleep(self._timeout_delay(timeout_retries))
+                    continue
+                if not data:
+                    logger.info("client disconnected: %s", client_id)
+                    break
+
+                for event in decoder.feed(data):
+                    if isinstance(event, ModbusFrame):
+                        index = poller.match(event)
+                        if index is None:
+                            logger.warning("unsolicited frame from %s", client_id)
+                            continue
+                        reading = self._collect_frame(
+                            profile, index, event, accumulated_data, client_id
+                        )
+                        if reading:
+                            self._store_data(reading, client_id, profile)
+                        continue
+
+                    if self._cycle_complete(poller, accumulated_data):
+                        break
+                    if event != profile.heartbeat:
+                        profile = self.profiles.select(event)
+                        poller = self._new_poller(profile)
+                        accumulated_data.clear()
+                    timeout_retries = 0
+                    if not identified:
+                        identified = True
+                        read_timeout = self.client_timeout
+                    logger.info("heartbeat from %s: %s", client_id, event)
+                    if self._scheduler is not None:
+                        target = self._schedule_polls(target, client_id, poller, writer.write)
+                        continue
+                    requests = poller.requests()
+                    logger.info("sending register request(s) to %s", client_id)
+                    writer.write(requests)
+                    await writer.drain()
+                self._count_discarded(decoder, client_id)
+                if self._cycle_complete(poller, accumulated_data):
+                    logger.info("closing %s after its last cycle (draining)", client_id)
+                    break
+
+        except asyncio.TimeoutError:
+            self._evict(client_id, identified)
+        except (ConnectionResetError, BrokenPipeError, OSError):
+            logger.warning("connection lost with %s", client_id)
+        except Exception as exc:
+            logger.exception("error handling %s: %s", client_id, exc)
+        finally:
+            if target is not None:
+                self._scheduler.remove(target)
+            self._admission.release(addr[0])
+            self._active_connections -= 1
+            self._stream_writers.discard(writer)
+            self._connection_closed()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError, OSError):
+                pass
+
+    async def serve(self) -> None:
+        listener = self._open_listener()
+        self._start_handoff(listener)
+        if threading.current_thread() is threading.main_thread():
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.begin_drain)
+        server = await asyncio.start_server(
+            self.handle_connection,
+            sock=listener,
+            backlog=self.backlog,
+        )
+        logger.info(
+            "asyncio server listening on %s:%s (max %s connections)",
+            self.host,
+            self.port,
+            self.max_connections,
+        )
+        async with server:
+            if self._scheduler is not None:
+                while not self._draining.is_set():
+                    await asyncio.sleep(self._scheduler.tick)
+                    try:
+                        self._scheduler.run_due(time.monotonic())
+                    except Exception as exc:
+                        logger.exception("poll scheduler error: %s", exc)
+            while not self._draining.is_set():
+                await asyncio.sleep(0.5)
+        await self._drain_connections()
+
+    async def _drain_connections(self) -> None:
+        if self._handoff:
+            self._handoff.close()
+        deadline = time.monotonic() + self.drain_timeout
+        while self._active_connections > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._stream_writers:
+            logger.warning(
+                "drain deadline reached; closing %s connection(s)", len(self._stream_writers)
+            )
+        for writer in list(self._stream_writers):
+            writer.transport.abort()
+        await asyncio.sleep(0)
+
+    def start_server(self) -> None:
+        _raise_nofile_limit(self.max_connections)
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logger.info("server shutdown requested")
+        except Exception as exc:
+            logger.exception("server error: %s", exc)
+        finally:
+            self._shutdown(timeout=self.flush_timeout)
+
+
+def _raise_nofile_limit(max_connections: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = max_connections + 256
+    if soft >= wanted:
+        return
+    target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError) as exc:
+        logger.warning("could not raise open file limit: %s", exc)
+        return
+    if target < wanted:
+        logger.warning("open file limit %s is below %s connections", target, max_connections)
+
+
+def _log_overflow(client_id: str, future: asyncio.Future) -> None:
+    if future.cancelled() or future.exception() is not None or not future.result():
+        logger.warning("tcp queue full; journal append failed for %s", client_id)
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import threading
+import time
+from typing import Dict, List
+
+from services.benchutil import MemoryCollection, percentile, rss_mb
+from services.tcp.async_server import AsyncTCPSocketServer, _raise_nofile_limit
+from services.tcp.server import (
+    DEFAULT_RESPONSE_CODECS,
+    DEFAULT_RESPONSE_PACKETS,
+    HEARTBEAT_PACKET,
+    TCPSocketServer,
+)
+from services.tcp.side_effects import SideEffectStage
+from services.tcp.simulator import (
+    FleetProfile,
+    GatewayResult,
+    fleet_process,
+    register_formats,
+    run_fleet,
+)
+
+
+class StoreRecorder:
+    """Wraps the ``solar_data`` collection and records when each client's readings landed."""
+
+    def __init__(self, collection) -> None:
+        self.collection = collection
+        self._lock = threading.Lock()
+        self.stored: Dict[str, List[float]] = {}
+        self.total = 0
+
+    def insert_many(self, documents: List[dict], ordered: bool = True):
+        result = self.collection.insert_many(documents, ordered=ordered)
+        now = time.time()
+        with self._lock:
+            for document in documents:
+                self.stored.setdefault(document["client_id"], []).append(now)
+            self.total += len(documents)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class _CountingSideEffects(SideEffectStage):
+    """Skips Redis/Channels so a benchmark without them measures only the ingest path."""
+
+    def _flush(self, batch) -> None:
+        with self._metrics_lock:
+            self._metrics["broadcasts"] += len(batch)
+
+
+def _bench_server_class(
+    base: type,
+    *,
+    memory: bool,
+    insert_latency_ms: float,
+    side_effects: bool,
+) -> type:
+    class BenchServer(base):
+        def _init_mongo(self) -> None:
+            if memory:
+                names = ["solar_data"]
+                if self.storage_mode != "single":
+                    names += ["today_solar_data", "current_month_solar_data"]
+                self.collections = {name: MemoryCollection(insert_latency_ms) for name in names}
+            else:
+                super()._init_mongo()
+            self.recorder = StoreRecorder(self.collections["solar_data"])
+            self.collections["solar_data"] = self.recorder
+            if not side_effects:
+                stage = self._side_effects
+                self._side_effects = _CountingSideEffects(
+                    topic=stage.topic, group=stage.group, event=stage.event
+                )
+
+    return BenchServer
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_benchmark(
+    *,
+    gateways: int = 1000,
+    duration: float = 30.0,
+    engine: str = "asyncio",
+    store: str = "memory",
+    insert_latency_ms: float = 0.0,
+    side_effects: bool = False,
+    fleet_processes: int = 1,
+    profile: FleetProfile | None = None,
+    host: str = "127.0.0.1",
+) -> dict:
+    """Run the server in this process against a simulated fleet and return the report.
+
+    The fleet runs in ``fleet_processes`` child processes so CPU and RSS are the server's
+    own; ``fleet_processes=0`` runs it in this process instead (used by the tests).
+    """
+    if profile is None:
+        profile = FleetProfile(
+            heartbeat=HEARTBEAT_PACKET,
+            register_formats=register_formats(DEFAULT_RESPONSE_PACKETS, DEFAULT_RESPONSE_CODECS),
+        )
+    base = AsyncTCPSocketServer if engine == "asyncio" else TCPSocketServer
+    server_class = _bench_server_class(
+        base,
+        memory=store == "memory",
+        insert_latency_ms=insert_latency_ms,
+        side_effects=side_effects,
+    )
+    _raise_nofile_limit(gateways * (2 if fleet_processes == 0 else 1))
+    port = _free_port(host)
+    server = server_class(
+        host=host,
+        port=port,
+        client_timeout=int(os.getenv("TCP_CLIENT_TIMEOUT", "120")),
+        backlog=int(os.getenv("TCP_BACKLOG", "1024")),
+        batch_size=int(os.getenv("TCP_BATCH_SIZE", "200")),
+        batch_flush_ms=int(os.getenv("TCP_BATCH_FLUSH_MS", "500")),
+    )
+    server_thread = threading.Thread(target=server.start_server, name="tcp-bench-server")
+    server_thread.start()
+    time.sleep(0.2)
+
+    cpu_before = _cpu_seconds()
+    started = time.time()
+    results = _run_fleet(host, port, gateways, profile, duration, fleet_processes)
+    elapsed = time.time() - started
+    cpu_used = _cpu_seconds() - cpu_before
+    resident_mb = rss_mb()
+
+    server.begin_drain()
+    server_thread.join()
+    return _report(server, results, elapsed, cpu_used, resident_mb, engine, store, fleet_processes)
+
+
+def _run_fleet(
+    host: str,
+    port: int,
+    gateways: int,
+    profile: FleetProfile,
+    duration: float,
+    fleet_processes: int,
+) -> List[GatewayResult]:
+    indices = list(range(gateways))
+    if fleet_processes <= 0:
+        return asyncio.run(run_fleet(host, port, indices, profile, duration))
+
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for part in range(fleet_processes):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=fleet_process,
+            args=(host, port, indices[part::fleet_processes], profile, duration, sender),
+            name=f"tcp-bench-fleet-{part}",
+        )
+        process.start()
+        sender.close()
+        workers.append((process, receiver))
+    results: List[GatewayResult] = []
+    for process, receiver in workers:
+        results.extend(receiver.recv())
+        process.join()
+    return results
+
+
+def _report(
+    server,
+    results: List[GatewayResult],
+    elapsed: float,
+    cpu_used: float,
+    rss_mb: float,
+    engine: str,
+    store: str,
+    fleet_processes: int,
+) -> dict:
+    recorder: StoreRecorder = server.recorder
+    latencies = []
+    for result in results:
+        stored = recorder.stored.get(result.client_id, [])
+        latencies.extend(
+            (stored_at - started_at) * 1000
+            for started_at, stored_at in zip(result.reading_starts, stored)
+        )
+    behaviors: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    for result in results:
+        behaviors[result.behavior] = behaviors.get(result.behavior, 0) + 1
+        if result.error:
+            errors[result.error] = errors.get(result.error, 0) + 1
+    p50 = percentile(latencies, 0.50)
+    p99 = percentile(latencies, 0.99)
+    return {
+        "engine": engine,
+        "store": store,
+        "poll_mode": server.poll_mode,
+        "storage_mode": server.storage_mode,
+        "gateways": len(results),
+        "behaviors": behaviors,
+        "gateway_errors": errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "readings_completed": sum(len(result.reading_starts) for result in results),
+        "readings_stored": recorder.total,
+        "readings_per_second": round(recorder.total / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": None if p50 is None else round(p50, 1),
+        "latency_p99_ms": None if p99 is None else round(p99, 1),
+        "cpu_percent": round(cpu_used / elapsed * 100, 1) if elapsed else 0.0,
+        "cpu_includes_fleet": fleet_processes <= 0,
+        "rss_mb": rss_mb,
+        "server": server.health_payload(),
+    }
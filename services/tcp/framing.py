@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import List, Sequence
+
+MBAP_HEADER = struct.Struct(">HHHB")
+MBAP_HEADER_SIZE = MBAP_HEADER.size
+MAX_MBAP_LENGTH = 254
+EXCEPTION_FLAG = 0x80
+
+FLOAT32 = struct.Struct(">f")
+INT64 = struct.Struct(">q")
+
+
+@dataclass(frozen=True, slots=True)
+class ModbusFrame:
+    transaction_id: int
+    unit_id: int
+    function_code: int
+    data: memoryview
+
+    @property
+    def is_exception(self) -> bool:
+        return bool(self.function_code & EXCEPTION_FLAG)
+
+
+class ModbusStreamDecoder:
+    """Reassembles MBAP frames and gateway heartbeats from a TCP byte stream.
+
+    ``feed`` accepts whatever ``recv`` returned and yields every complete item in order:
+    the matching heartbeat packet itself or a ``ModbusFrame``. Partial frames stay buffered
+    until the rest arrives; bytes that cannot start a heartbeat or a valid MBAP header are
+    skipped and counted in ``discarded``.
+    """
+
+    def __init__(
+        self,
+        heartbeats: bytes | Sequence[bytes],
+        max_buffer_size: int = 65536,
+    ) -> None:
+        if isinstance(heartbeats, (bytes, bytearray)):
+            heartbeats = (bytes(heartbeats),)
+        self.heartbeats = tuple(heartbeats)
+        self.max_buffer_size = max_buffer_size
+        self.discarded = 0
+        self._buffer = bytearray()
+        self._max_heartbeat = max(len(heartbeat) for heartbeat in self.heartbeats)
+
+    def feed(self, data: bytes) -> List[ModbusFrame | bytes]:
+        buffer = self._buffer
+        buffer += data
+        events: List[ModbusFrame | bytes] = []
+        heartbeats = self.heartbeats
+        offset = 0
+        size = len(buffer)
+        while offset < size:
+            if buffer.startswith(heartbeats, offset):
+                heartbeat = next(item for item in heartbeats if buffer.startswith(item, offset))
+                events.append(heartbeat)
+                offset += len(heartbeat)
+                continue
+            remaining = size - offset
+            if remaining < self._max_heartbeat and any(
+                heartbeat.startswith(buffer[offset:]) for heartbeat in heartbeats
+            ):
+                break
+            if remaining < MBAP_HEADER_SIZE:
+                if _may_start_header(buffer, offset, size):
+                    break
+                offset += 1
+                self.discarded += 1
+                continue
+            transaction_id, protocol_id, length, unit_id = MBAP_HEADER.unpack_from(buffer, offset)
+            if protocol_id != 0 or length < 2 or length > MAX_MBAP_LENGTH:
+                offset += 1
+                self.discarded += 1
+                continue
+            end = offset + 6 + length
+            if end > size:
+                break
+            pdu = bytes(buffer[offset + MBAP_HEADER_SIZE : end])
+            events.append(ModbusFrame(transaction_id, unit_id, pdu[0], memoryview(pdu)[1:]))
+            offset = end
+        del buffer[:offset]
+        if len(buffer) > self.max_buffer_size:
+            self.discarded += len(buffer)
+            buffer.clear()
+        return events
+
+
+def _may_start_header(buffer: bytearray, offset: int, size: int) -> bool:
+    # Protocol id bytes (offsets 2-3) must be zero once they have arrived.
+    return all(buffer[index] == 0 for index in range(offset + 2, min(offset + 4, size)))
+
+
+def decode_registers(
+    frame: ModbusFrame,
+    codec: struct.Struct,
+    scale: float = 1.0,
+) -> List[float]:
+    """Decode a read-registers reply into scaled numbers with one ``iter_unpack`` pass."""
+    if frame.is_exception:
+        raise ValueError(f"modbus exception code {frame.data[0] if frame.data else None}")
+    if not frame.data:
+        raise ValueError("empty register payload")
+    byte_count = frame.data[0]
+    block = frame.data[1 : 1 + byte_count]
+    if len(block) != byte_count or byte_count % codec.size:
+        raise ValueError(f"invalid register payload length {len(block)}")
+    return [value * scale for (value,) in codec.iter_unpack(block)]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+from typing import Callable
+
+logger = logging.getLogger("tcp.handoff")
+
+HANDOFF_REQUEST = b"HANDOFF"
+HANDOFF_ACK = b"OK"
+
+
+def request_listener(path: str, timeout: float = 5.0) -> socket.socket | None:
+    """Ask the process serving ``path`` for its listening socket over ``SCM_RIGHTS``.
+
+    Returns ``None`` when nothing is listening on ``path`` so the caller can bind normally.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as channel:
+            channel.settimeout(timeout)
+            channel.connect(path)
+            channel.sendall(HANDOFF_REQUEST)
+            message, fds, _, _ = socket.recv_fds(channel, len(HANDOFF_ACK), 1)
+    except OSError as exc:
+        logger.warning("listener handoff from %s failed: %s", path, exc)
+        return None
+    if message != HANDOFF_ACK or not fds:
+        for fd in fds:
+            os.close(fd)
+        logger.warning("listener handoff from %s returned no socket", path)
+        return None
+    return socket.socket(fileno=fds[0])
+
+
+class ListenerHandoffServer:
+    """Serves one listener handoff on a Unix socket, then calls ``on_handoff``.
+
+    The receiving process gets a duplicate of the listening descriptor, so the kernel accept
+    queue is never closed between the old and the new process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        listener: socket.socket,
+        on_handoff: Callable[[], None],
+    ) -> None:
+        self.path = path
+        self.listener = listener
+        self.on_handoff = on_handoff
+        self._channel: socket.socket | None = None
+
+    def start(self) -> None:
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            channel = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            channel.bind(self.path)
+            channel.listen(1)
+        except OSError as exc:
+            logger.warning("handoff socket %s unavailable: %s", self.path, exc)
+            return
+        self._channel = channel
+        threading.Thread(target=self._serve, name="tcp-handoff", daemon=True).start()
+        logger.info("listener handoff available on %s", self.path)
+
+    def close(self) -> None:
+        if self._channel is None:
+            return
+        self._channel.close()
+        self._channel = None
+
+    def _serve(self) -> None:
+        channel = self._channel
+        while channel is not None:
+            try:
+                conn, _ = channel.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.settimeout(5.0)
+                    if conn.recv(len(HANDOFF_REQUEST)) != HANDOFF_REQUEST:
+                        continue
+                    socket.send_fds(conn, [HANDOFF_ACK], [self.listener.fileno()])
+                except OSError as exc:
+                    logger.warning("listener handoff failed: %s", exc)
+                    continue
+            logger.info("listener handed off; draining")
+            channel.close()
+            self._channel = None
+            self.on_handoff()
+            return
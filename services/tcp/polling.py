@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from services.tcp.framing import ModbusFrame
+
+MAX_TRANSACTION_ID = 0xFFFF
+
+
+class CyclePoller:
+    """Sends one register request per heartbeat, taken from the server-wide cycle.
+
+    A reply only matches the outstanding request's transaction id: a heartbeat can trigger
+    the next request before the previous reply arrives, and that late reply must be dropped
+    rather than decoded against the new register block. The poll scheduler issues requests
+    from its own thread while the connection matches replies, so both sides go through
+    ``_lock``.
+    """
+
+    def __init__(self, next_response: Callable[[], Tuple[int, bytes]]) -> None:
+        self._next_response = next_response
+        self._pending_index: int | None = None
+        self._pending_transaction_id: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> bool:
+        return self._pending_index is not None
+
+    def requests(self) -> bytes:
+        with self._lock:
+            self._pending_index, packet = self._next_response()
+            self._pending_transaction_id = int.from_bytes(packet[:2], "big")
+            return packet
+
+    def match(self, frame: ModbusFrame) -> int | None:
+        with self._lock:
+            if self._pending_index is None or frame.transaction_id != self._pending_transaction_id:
+                return None
+            index, self._pending_index = self._pending_index, None
+            return index
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending_index = None
+
+
+class PipelinedPoller:
+    """Sends every register request per heartbeat and matches replies by transaction id.
+
+    Each connection owns its transaction id sequence, so replies can arrive in any order
+    and a full reading takes one heartbeat round trip instead of one per request. Like
+    ``CyclePoller`` it is shared with the poll scheduler's thread and guarded by ``_lock``.
+    """
+
+    def __init__(self, packets: List[bytes]) -> None:
+        self._templates = [bytes(packet[2:]) for packet in packets]
+        self._next_transaction_id = 1
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def requests(self) -> bytes:
+        frames = bytearray()
+        with self._lock:
+            self._pending.clear()
+            for index, template in enumerate(self._templates):
+                transaction_id = self._next_transaction_id
+                self._next_transaction_id = transaction_id % MAX_TRANSACTION_ID + 1
+                self._pending[transaction_id] = index
+                frames += transaction_id.to_bytes(2, "big")
+                frames += template
+        return bytes(frames)
+
+    def match(self, frame: ModbusFrame) -> int | None:
+        with self._lock:
+            return self._pending.pop(frame.transaction_id, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending.clear()
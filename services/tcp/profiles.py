@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from services.tcp.framing import ModbusFrame, decode_registers
+from services.tcp.schemas import DevicePayload, payload_model
+
+logger = logging.getLogger("tcp.profiles")
+
+REGISTER_TYPES = {
+    "int16": ">h",
+    "uint16": ">H",
+    "int32": ">i",
+    "uint32": ">I",
+    "float32": ">f",
+    "int64": ">q",
+    "uint64": ">Q",
+    "float64": ">d",
+}
+READ_REQUEST = struct.Struct(">HHHBBHH")
+READ_FUNCTION_CODES = {0x03, 0x04}
+RESERVED_FIELDS = {"timestamp", "client_id"}
+
+
+@dataclass(frozen=True, slots=True)
+class RegisterBlock:
+    field: str
+    request: bytes
+    codec: struct.Struct
+    scale: float = 1.0
+
+    def decode(self, frame: ModbusFrame) -> List[float]:
+        return decode_registers(frame, self.codec, self.scale)
+
+
+class DeviceProfile:
+    """Register map of one device model, compiled once into per-request decoders.
+
+    A connection picks its profile from the heartbeat it sends; replies are then decoded
+    by ``blocks[index]`` without looking at the device type again.
+    """
+
+    def __init__(self, name: str, heartbeat: bytes, blocks: Sequence[RegisterBlock]) -> None:
+        self.name = name
+        self.heartbeat = heartbeat
+        self.blocks = tuple(blocks)
+        self.requests = [block.request for block in self.blocks]
+        self.codecs = [block.codec for block in self.blocks]
+        self.fields = tuple(block.field for block in self.blocks)
+        self.payload_model: type[DevicePayload] = payload_model(name, self.fields)
+        self._cycle = itertools.cycle(enumerate(self.requests))
+        self._cycle_lock = threading.Lock()
+
+    def next_request(self) -> Tuple[int, bytes]:
+        with self._cycle_lock:
+            return next(self._cycle)
+
+
+class ProfileRegistry:
+    def __init__(self, profiles: Sequence[DeviceProfile], default: str | None = None) -> None:
+        if not profiles:
+            raise ValueError("at least one device profile is required")
+        self._by_heartbeat: Dict[bytes, DeviceProfile] = {}
+        for profile in profiles:
+            if profile.heartbeat in self._by_heartbeat:
+                raise ValueError(f"duplicate heartbeat for profile {profile.name}")
+            self._by_heartbeat[profile.heartbeat] = profile
+        by_name = {profile.name: profile for profile in profiles}
+        if default is not None and default not in by_name:
+            raise ValueError(f"unknown default device profile {default}")
+        self.default = by_name[default] if default is not None else profiles[0]
+        self.heartbeats = tuple(self._by_heartbeat)
+
+    def __iter__(self):
+        return iter(self._by_heartbeat.values())
+
+    def select(self, heartbeat: bytes) -> DeviceProfile:
+        return self._by_heartbeat.get(heartbeat, self.default)
+
+
+def compile_block(spec: dict) -> RegisterBlock:
+    field = spec["field"]
+    if not field.isidentifier() or field in RESERVED_FIELDS:
+        raise ValueError(f"invalid field name {field!r}")
+    data_type = spec.get("type", "float32")
+    if data_type not in REGISTER_TYPES:
+        raise ValueError(f"unsupported register type {data_type!r} for {field}")
+    codec = struct.Struct(REGISTER_TYPES[data_type])
+    request = bytes.fromhex(spec["request"])
+    if len(request) != READ_REQUEST.size:
+        raise ValueError(f"request for {field} is not a {READ_REQUEST.size}-byte read frame")
+    _, protocol_id, length, _, function_code, _, count = READ_REQUEST.unpack(request)
+    if protocol_id != 0 or length != 6 or function_code not in READ_FUNCTION_CODES:
+        raise ValueError(f"request for {field} is not a Modbus read-registers frame")
+    if (count * 2) % codec.size:
+        raise ValueError(f"{count} registers do not hold whole {data_type} values for {field}")
+    return RegisterBlock(field, request, codec, float(spec.get("scale", 1.0)))
+
+
+def compile_profile(spec: dict) -> DeviceProfile:
+    heartbeat = spec["heartbeat"]
+    return DeviceProfile(
+        spec["name"],
+        heartbeat.encode("ascii") if isinstance(heartbeat, str) else bytes(heartbeat),
+        [compile_block(block) for block in spec["registers"]],
+    )
+
+
+def load_profiles(path: str | Path) -> ProfileRegistry:
+    """Compile every profile in a JSON profile file."""
+    with open(path, encoding="utf-8") as handle:
+        spec = json.load(handle)
+    profiles = [compile_profile(profile) for profile in spec["profiles"]]
+    registry = ProfileRegistry(profiles, default=spec.get("default"))
+    logger.info(
+        "loaded %s device profile(s) from %s: %s",
+        len(profiles),
+        path,
+        ", ".join(profile.name for profile in profiles),
+    )
+    return registry
+
+
+def profiles_from_env(fallback: DeviceProfile) -> ProfileRegistry:
+    """Profiles from ``TCP_DEVICE_PROFILES``; only ``fallback`` when it is unset."""
+    path = os.getenv("TCP_DEVICE_PROFILES", "").strip()
+    if not path:
+        return ProfileRegistry([fallback])
+    return load_profiles(path)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import logging
+import math
+import random
+import threading
+from typing import Callable, Iterable, List
+
+from services.tcp.polling import CyclePoller, PipelinedPoller
+
+logger = logging.getLogger("tcp.scheduler")
+
+
+class Timer:
+    __slots__ = ("expires", "item", "cancelled")
+
+    def __init__(self, expires: int, item) -> None:
+        self.expires = expires
+        self.item = item
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hierarchical hashed timer wheel with O(1) schedule and cancel.
+
+    Level ``n`` has ``slots`` buckets spanning ``slots ** n`` ticks each; timers cascade one
+    level down whenever the level below wraps, so each timer is touched at most once per
+    level. Cancelled timers are dropped lazily when their bucket is reached.
+    """
+
+    def __init__(self, tick: float, *, slots: int = 256, levels: int = 4, now: float = 0.0):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.tick = tick
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[List[Timer]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._origin = now
+        self._current = 0
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def schedule(self, delay: float, item, now: float) -> Timer:
+        with self._lock:
+            ticks = max(math.ceil((now - self._origin + delay) / self.tick), self._current + 1)
+            timer = Timer(ticks, item)
+            self._place(timer)
+            self.size += 1
+            return timer
+
+    def advance(self, now: float) -> List:
+        """Move to ``now`` and return the items of every timer that expired."""
+        expired: List = []
+        target = int((now - self._origin) / self.tick)
+        with self._lock:
+            while self._current < target:
+                self._step(expired)
+        return expired
+
+    def _place(self, timer: Timer) -> None:
+        delta = timer.expires - self._current
+        for level in range(self.levels):
+            if delta < 1 << (self._bits * (level + 1)) or level == self.levels - 1:
+                index = (timer.expires >> (self._bits * level)) & self._mask
+                self._wheels[level][index].append(timer)
+                return
+
+    def _step(self, expired: List) -> None:
+        self._current += 1
+        current = self._current
+        for level in range(1, self.levels):
+            if current & ((1 << (self._bits * level)) - 1):
+                break
+            index = (current >> (self._bits * level)) & self._mask
+            bucket, self._wheels[level][index] = self._wheels[level][index], []
+            for timer in bucket:
+                if timer.cancelled:
+                    self.size -= 1
+                else:
+                    self._place(timer)
+        index = current & self._mask
+        bucket, self._wheels[0][index] = self._wheels[0][index], []
+        for timer in bucket:
+            self.size -= 1
+            if not timer.cancelled:
+                expired.append(timer.item)
+
+
+class PollTarget:
+    """A connection the scheduler polls; ``poller`` follows the connection's profile.
+
+    ``send`` runs on the scheduler thread and must not block: it returns ``False`` to skip
+    a poll the connection cannot take right now and raises ``OSError`` when it is gone.
+    """
+
+    __slots__ = ("client_id", "host", "poller", "send", "timer")
+
+    def __init__(
+        self,
+        client_id: str,
+        poller: CyclePoller | PipelinedPoller,
+        send: Callable[[bytes], object],
+    ) -> None:
+        self.client_id = client_id
+        self.host = client_id.rsplit(":", 1)[0]
+        self.poller = poller
+        self.send = send
+        self.timer: Timer | None = None
+
+
+class PollScheduler:
+    """Issues register polls per connection on server-chosen intervals.
+
+    Each target is polled every ``interval`` seconds (``high_res_interval`` for flagged
+    devices) with ``jitter`` spread. While the ingest queue is fuller than
+    ``backoff_threshold`` the intervals stretch linearly up to ``max_backoff`` times.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float,
+        jitter: float,
+        high_res_interval: float,
+        high_res_devices: Iterable[str] = (),
+        queue_depth: Callable[[], int],
+        queue_capacity: int,
+        backoff_threshold: float = 0.5,
+        max_backoff: float = 8.0,
+        tick: float = 0.1,
+        now: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.interval = interval
+        self.jitter = jitter
+        self.high_res_interval = high_res_interval
+        self.high_res_devices = set(high_res_devices)
+        self.queue_depth = queue_depth
+        self.queue_capacity = max(queue_capacity, 1)
+        self.backoff_threshold = backoff_threshold
+        self.max_backoff = max_backoff
+        self.tick = tick
+        self._wheel = TimerWheel(tick, now=now)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._targets = 0
+        self._metrics = {"polls_sent": 0, "polls_skipped": 0, "poll_errors": 0}
+
+    def add(self, target: PollTarget, now: float) -> None:
+        # The first poll lands anywhere in one interval so reconnect storms spread out.
+        first = self._random.uniform(0, self._interval_for(target))
+        with self._lock:
+            target.timer = self._wheel.schedule(first, target, now)
+            self._targets += 1
+
+    def remove(self, target: PollTarget) -> None:
+        with self._lock:
+            if target.timer is None:
+                return
+            target.timer.cancel()
+            target.timer = None
+            self._targets -= 1
+
+    def flag_high_resolution(self, device: str, enabled: bool = True) -> None:
+        if enabled:
+            self.high_res_devices.add(device)
+        else:
+            self.high_res_devices.discard(device)
+
+    def backoff_factor(self) -> float:
+        fill = self.queue_depth() / self.queue_capacity
+        if fill <= self.backoff_threshold:
+            return 1.0
+        span = max(1.0 - self.backoff_threshold, 1e-6)
+        return min(
+            1.0 + (fill - self.backoff_threshold) / span * (self.max_backoff - 1.0),
+            self.max_backoff,
+        )
+
+    def next_delay(self, target: PollTarget, backoff: float | None = None) -> float:
+        if backoff is None:
+            backoff = self.backoff_factor()
+        spread = self._random.uniform(-self.jitter, self.jitter)
+        return self._interval_for(target) * backoff * (1.0 + spread)
+
+    def run_due(self, now: float) -> int:
+        """Poll every target whose timer expired and reschedule it; return polls sent.
+
+        Targets are picked and rescheduled under the lock; the sends happen after it is
+        released so one slow socket cannot hold up ``add``/``remove`` or the metrics. A send
+        that would block is skipped and the target is polled again next interval.
+        """
+        due = self._wheel.advance(now)
+        if not due:
+            return 0
+        backoff = self.backoff_factor()
+        polls: List[tuple[PollTarget, bytes]] = []
+        skipped = 0
+        with self._lock:
+            for target in due:
+                if target.timer is None:
+                    continue
+                poller = target.poller
+                if poller.pending:
+                    skipped += 1
+                else:
+                    polls.append((target, poller.requests()))
+                delay = self.next_delay(target, backoff)
+                target.timer = self._wheel.schedule(delay, target, now)
+        sent = errors = 0
+        for target, frames in polls:
+            try:
+                accepted = target.send(frames)
+            except OSError as exc:
+                logger.warning("poll to %s failed: %s", target.client_id, exc)
+                errors += 1
+                self.remove(target)
+                continue
+            if accepted is False:
+                target.poller.reset()
+                skipped += 1
+                continue
+            sent += 1
+        with self._lock:
+            self._metrics["polls_sent"] += sent
+            self._metrics["polls_skipped"] += skipped
+            self._metrics["poll_errors"] += errors
+        return sent
+
+    def metrics(self) -> dict:
+        with self._lock:
+            payload = dict(self._metrics)
+            payload["targets"] = self._targets
+        payload["backoff_factor"] = round(self.backoff_factor(), 2)
+        payload["high_res_devices"] = len(self.high_res_devices)
+        return payload
+
+    def _interval_for(self, target: PollTarget) -> float:
+        devices = self.high_res_devices
+        if target.client_id in devices or target.host in devices:
+            return self.high_res_interval
+        return self.interval
@@ -1,16 +1,30 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List
+from typing import List, Sequence
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, create_model
 
 
-class SolarDataPayload(BaseModel):
+class DevicePayload(BaseModel):
     timestamp: datetime = Field(...)
     client_id: str
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class SolarDataPayload(DevicePayload):
     current: List[float]
     power: List[float]
     energy_consumption: List[float]
 
-    model_config = ConfigDict(extra="forbid")
+
+def payload_model(name: str, fields: Sequence[str]) -> type[DevicePayload]:
+    """Validation model for a register profile's reading; built once per profile."""
+    if tuple(fields) == ("current", "power", "energy_consumption"):
+        return SolarDataPayload
+    return create_model(
+        f"{name.title().replace('-', '').replace('_', '')}Payload",
+        __base__=DevicePayload,
+        **{field: (List[float], ...) for field in fields},
+    )
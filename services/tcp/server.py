@@ -1,15 +1,17 @@
 from __future__ import annotations
 
-import itertools
 import json
 import logging
 import os
 import queue
+import select
+import signal
 import socket
 import struct
 import threading
 import time
 import concurrent.futures
+import functools
 from datetime import datetime, timezone
 from typing import Dict, List, Tuple
 from http.server import BaseHTTPRequestHandler, HTTPServer
@@ -17,8 +19,27 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 import pymongo
 
 from common.mongo import get_mongo_database
-from apps.telemetry.services import broadcast_realtime, mark_device_seen
-from services.tcp.schemas import SolarDataPayload
+from services.journal import (
+    JournalReplayer,
+    insert_unstored,
+    journal_from_env,
+    journal_record,
+    replayer_from_env,
+    write_journal_records,
+)
+from services.tcp.admission import AdmissionController
+from services.tcp.framing import (
+    FLOAT32,
+    INT64,
+    ModbusFrame,
+    ModbusStreamDecoder,
+)
+from services.tcp.handoff import ListenerHandoffServer, request_listener
+from services.tcp.polling import CyclePoller, PipelinedPoller
+from services.tcp.profiles import DeviceProfile, RegisterBlock, profiles_from_env
+from services.tcp.scheduler import PollScheduler, PollTarget
+from services.tcp.side_effects import SideEffectStage
+from services.writers import BatchWriterState
 
 logger = logging.getLogger("tcp.server")
 if not logging.getLogger().handlers:
@@ -30,6 +51,8 @@ DEFAULT_RESPONSE_PACKETS = [
     bytes.fromhex("01 6E 00 00 00 06 01 03 0B ED 00 06"),
     bytes.fromhex("01 B6 00 00 00 06 01 03 0C 83 00 08"),
 ]
+DEFAULT_RESPONSE_CODECS = [FLOAT32, FLOAT32, INT64]
+DEFAULT_FIELDS = ["current", "power", "energy_consumption"]
 
 
 class TCPSocketServer:
@@ -39,33 +62,52 @@ class TCPSocketServer:
         port: int,
         heartbeat_packet: bytes = HEARTBEAT_PACKET,
         response_packets: List[bytes] | None = None,
+        response_codecs: List[struct.Struct] | None = None,
         recv_buffer_size: int = 1024,
         client_timeout: int = 120,
         backlog: int = 50,
         batch_size: int = 200,
         batch_flush_ms: int = 500,
+        reuse_port: bool = False,
     ) -> None:
         self.host = host
         self.port = port
-        self.heartbeat_packet = heartbeat_packet
-        self.response_packets = response_packets or DEFAULT_RESPONSE_PACKETS
-        self.response_cycle = itertools.cycle(enumerate(self.response_packets))
-        self.cycle_lock = threading.Lock()
+        self.profiles = profiles_from_env(
+            _legacy_profile(
+                heartbeat_packet,
+                response_packets or DEFAULT_RESPONSE_PACKETS,
+                response_codecs or DEFAULT_RESPONSE_CODECS,
+            )
+        )
+        self.heartbeat_packet = self.profiles.default.heartbeat
+        self.response_packets = self.profiles.default.requests
+        self.response_codecs = self.profiles.default.codecs
         self.recv_buffer_size = recv_buffer_size
         self.client_timeout = client_timeout
         self.backlog = backlog
         self.batch_size = batch_size
         self.batch_flush_ms = batch_flush_ms
+        self.reuse_port = reuse_port
+        self.worker_index = os.getenv("TCP_WORKER_INDEX")
+        self.poll_mode = os.getenv("TCP_POLL_MODE", "cycle").strip().lower()
+        self.poll_schedule = os.getenv("TCP_POLL_SCHEDULE", "heartbeat").strip().lower()
+        self.storage_mode = os.getenv("TCP_STORAGE_MODE", "triple").strip().lower()
         self.timeout_max_retries = int(os.getenv("TCP_TIMEOUT_MAX_RETRIES", "3"))
         self.timeout_backoff_base = float(os.getenv("TCP_TIMEOUT_BACKOFF_BASE", "1.0"))
         self.timeout_backoff_max = float(os.getenv("TCP_TIMEOUT_BACKOFF_MAX", "10.0"))
-        self.mongo_lock = threading.Lock()
         self._queue: queue.Queue[dict] = queue.Queue(maxsize=int(os.getenv("TCP_QUEUE_SIZE", "5000")))
         self._stop_event = threading.Event()
         self._health_server: HTTPServer | None = None
         self._health_thread: threading.Thread | None = None
-        self._executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=int(os.getenv("TCP_MAX_CLIENTS", "100"))
+        self.max_clients = int(os.getenv("TCP_MAX_CLIENTS", "100"))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_clients)
+        self.handshake_timeout = float(os.getenv("TCP_HANDSHAKE_TIMEOUT_SECONDS", "30"))
+        self.keepalive_idle = int(os.getenv("TCP_KEEPALIVE_IDLE_SECONDS", "60"))
+        self._admission = AdmissionController(
+            max_total=self.max_clients,
+            max_per_ip=int(os.getenv("TCP_MAX_CONNECTIONS_PER_IP", "64")),
+            accept_rate=float(os.getenv("TCP_ACCEPT_RATE", "500")),
+            accept_burst=float(os.getenv("TCP_ACCEPT_BURST", "1000")),
         )
         self._metrics_lock = threading.Lock()
         self._metrics = {
@@ -76,9 +118,38 @@ class TCPSocketServer:
             "batches_flushed": 0,
             "parse_errors_total": 0,
             "mongo_errors_total": 0,
+            "journaled_total": 0,
+            "connections_rejected": 0,
+            "rejected_rate": 0,
+            "rejected_per_ip": 0,
+            "rejected_capacity": 0,
+            "evicted_half_open": 0,
+            "evicted_idle": 0,
         }
+        self._writers: List[BatchWriterState] = []
+        self._worker_threads: List[threading.Thread] = []
+        self.drain_timeout = float(os.getenv("TCP_DRAIN_TIMEOUT_SECONDS", "30"))
+        self.flush_timeout = float(os.getenv("TCP_FLUSH_TIMEOUT_SECONDS", "10"))
+        self._draining = threading.Event()
+        self._clients_lock = threading.Lock()
+        self._client_sockets: set[socket.socket] = set()
+        self._handoff: ListenerHandoffServer | None = None
+        self._side_effects = SideEffectStage(
+            topic="TCP_SOLAR_DATA",
+            group=os.getenv("TCP_WS_GROUP", "tcp_telemetry"),
+            event="tcp.message",
+            maxsize=int(os.getenv("TCP_SIDE_EFFECT_QUEUE_SIZE", "10000")),
+            flush_ms=int(os.getenv("TCP_SIDE_EFFECT_FLUSH_MS", "200")),
+        )
+        self._journal = journal_from_env(
+            "tcp" if self.worker_index is None else f"tcp-{self.worker_index}"
+        )
+        self._replayer: JournalReplayer | None = None
+        self._scheduler = self._build_scheduler() if self.poll_schedule == "timer" else None
         self._init_mongo()
         self._start_worker()
+        self._side_effects.start()
+        self._start_replayer()
         self._start_health_server()
 
     def _init_mongo(self) -> None:
@@ -89,17 +160,18 @@ class TCPSocketServer:
                 "solar_data",
                 expire_after_seconds=None,
             ),
-            "today_solar_data": self._ensure_timeseries(
+        }
+        if self.storage_mode != "single":
+            self.collections["today_solar_data"] = self._ensure_timeseries(
                 db,
                 "today_solar_data",
                 expire_after_seconds=86400,
-            ),
-            "current_month_solar_data": self._ensure_timeseries(
+            )
+            self.collections["current_month_solar_data"] = self._ensure_timeseries(
                 db,
                 "current_month_solar_data",
                 expire_after_seconds=2592000,
-            ),
-        }
+            )
         self._create_indexes()
 
     def _ensure_timeseries(
@@ -133,20 +205,21 @@ class TCPSocketServer:
         except pymongo.errors.OperationFailure as exc:
             logger.warning("index creation error: %s", exc)
 
-    def _store_data(self, data: Dict[str, List[float]], client_id: str) -> None:
-        if len(data) != 3:
+    def _store_data(
+        self,
+        data: Dict[str, List[float]],
+        client_id: str,
+        profile: DeviceProfile | None = None,
+    ) -> None:
+        profile = profile or self.profiles.default
+        if len(data) != len(profile.fields):
             return
 
         now = datetime.now(timezone.utc)
-        document = {
-            "timestamp": now,
-            "client_id": client_id,
-            "current": data.get("response_0", []),
-            "power": data.get("response_1", []),
-            "energy_consumption": data.get("response_2", []),
-        }
+        values = {field: data.get(field, []) for field in profile.fields}
+        document = {"timestamp": now, "client_id": client_id, **values}
         try:
-            SolarDataPayload.model_validate(document)
+            profile.payload_model.model_validate(document)
         except Exception as exc:
             logger.warning("invalid payload for %s: %s", client_id, exc)
             return
@@ -154,201 +227,514 @@ class TCPSocketServer:
             "device_id": client_id,
             "topic": "TCP_SOLAR_DATA",
             "timestamp": now.isoformat(),
-            "payload": {
-                "current": document["current"],
-                "power": document["power"],
-                "energy_consumption": document["energy_consumption"],
-            },
+            "payload": values,
         }
         try:
             self._queue.put_nowait(document)
         except queue.Full:
-            logger.warning("tcp queue full; dropping payload for %s", client_id)
-            return
-        try:
-            mark_device_seen(client_id, topic="TCP_SOLAR_DATA")
-        except Exception as exc:
-            logger.warning("device status update failed: %s", exc)
+            if not self._overflow(document, client_id):
+                logger.warning("tcp queue full; dropping payload for %s", client_id)
+                return
         with self._metrics_lock:
             self._metrics["messages_queued"] += 1
-        try:
-            broadcast_realtime(message, group=os.getenv("TCP_WS_GROUP", "tcp_telemetry"), event="tcp.message")
-        except Exception as exc:
-            logger.warning("tcp websocket broadcast failed: %s", exc)
-
-    def _process_response(self, index: int, hex_response: str) -> List[float]:
-        if "0103" not in hex_response:
-            return []
+        if not self._side_effects.submit(client_id, message):
+            logger.warning("side-effect queue full; skipping presence/broadcast for %s", client_id)
 
+    def _decode_frame(
+        self,
+        block: RegisterBlock,
+        frame: ModbusFrame,
+        client_id: str,
+    ) -> List[float]:
         try:
-            _, payload = hex_response.split("0103", 1)
-            payload = payload[2:]
-
-            chunk_size = 16 if index == 2 else 8
-            if len(payload) % chunk_size != 0:
-                logger.warning("invalid payload length %s", len(payload))
-                return []
-
-            chunks = [payload[i : i + chunk_size] for i in range(0, len(payload), chunk_size)]
-            converted_values: List[float] = []
-            for chunk in chunks:
-                try:
-                    fmt = "!f" if chunk_size == 8 else "!q"
-                    value = struct.unpack(fmt, bytes.fromhex(chunk))[0]
-                    converted_values.append(float(value))
-                except (struct.error, ValueError) as exc:
-                    logger.warning("data unpacking error: %s", exc)
-                    with self._metrics_lock:
-                        self._metrics["parse_errors_total"] += 1
-            return converted_values
-        except Exception as exc:
-            logger.warning("processing error: %s", exc)
+            return block.decode(frame)
+        except ValueError as exc:
+            logger.warning("invalid %s response from %s: %s", block.field, client_id, exc)
             with self._metrics_lock:
                 self._metrics["parse_errors_total"] += 1
             return []
 
+    def _collect_frame(
+        self,
+        profile: DeviceProfile,
+        index: int,
+        frame: ModbusFrame,
+        accumulated_data: Dict[str, List[float]],
+        client_id: str,
+    ) -> Dict[str, List[float]] | None:
+        """Add a decoded reply to ``accumulated_data``; return the reading once complete."""
+        block = profile.blocks[index]
+        values = self._decode_frame(block, frame, client_id)
+        if not values:
+            return None
+        accumulated_data[block.field] = values
+        if len(accumulated_data) < len(profile.blocks):
+            return None
+        reading = dict(accumulated_data)
+        accumulated_data.clear()
+        return reading
+
+    def _count_discarded(self, decoder: ModbusStreamDecoder, client_id: str) -> None:
+        if not decoder.discarded:
+            return
+        logger.warning("discarded %s unframed byte(s) from %s", decoder.discarded, client_id)
+        with self._metrics_lock:
+            self._metrics["parse_errors_total"] += 1
+        decoder.discarded = 0
+
     def _start_worker(self) -> None:
-        threading.Thread(target=self._worker_loop, name="tcp-store-worker", daemon=True).start()
+        writer_count = max(int(os.getenv("TCP_WRITERS", "1")), 1)
+        adaptive = os.getenv("TCP_BATCH_ADAPTIVE", "false").strip().lower() in {"1", "true", "yes"}
+        self._writers = [
+            BatchWriterState(
+                f"tcp-store-worker-{index}",
+                batch_size=self.batch_size,
+                flush_ms=self.batch_flush_ms,
+                adaptive=adaptive,
+                min_batch_size=int(os.getenv("TCP_BATCH_MIN_SIZE", "10")),
+                max_batch_size=int(os.getenv("TCP_BATCH_MAX_SIZE", "5000")),
+                min_flush_ms=int(os.getenv("TCP_BATCH_MIN_FLUSH_MS", "50")),
+                target_latency_ms=float(os.getenv("TCP_BATCH_TARGET_LATENCY_MS", "250")),
+            )
+            for index in range(writer_count)
+        ]
+        self._worker_threads = [
+            threading.Thread(
+                target=self._worker_loop, args=(writer,), name=writer.name, daemon=True
+            )
+            for writer in self._writers
+        ]
+        for thread in self._worker_threads:
+            thread.start()
 
-    def _worker_loop(self) -> None:
+    def _worker_loop(self, writer: BatchWriterState) -> None:
         batch: List[dict] = []
         last_flush = time.monotonic()
-        while not self._stop_event.is_set():
-            timeout = max(self.batch_flush_ms / 1000 - (time.monotonic() - last_flush), 0.1)
+        while not self._stop_event.is_set() or not self._queue.empty():
+            timeout = max(writer.flush_ms / 1000 - (time.monotonic() - last_flush), 0.01)
             try:
-                item = self._queue.get(timeout=timeout)
-                batch.append(item)
+                batch.append(self._queue.get(timeout=timeout))
                 self._queue.task_done()
+                while len(batch) < writer.batch_size:
+                    batch.append(self._queue.get_nowait())
+                    self._queue.task_done()
             except queue.Empty:
                 pass
 
-            should_flush = len(batch) >= self.batch_size or (
-                batch and (time.monotonic() - last_flush) * 1000 >= self.batch_flush_ms
+            should_flush = len(batch) >= writer.batch_size or (
+                batch and (time.monotonic() - last_flush) * 1000 >= writer.flush_ms
             )
             if should_flush:
-                self._flush_batch(batch)
+                self._flush_batch(batch, writer)
                 batch = []
                 last_flush = time.monotonic()
+            elif not batch:
+                last_flush = time.monotonic()
 
         if batch:
-            self._flush_batch(batch)
+            self._flush_batch(batch, writer)
 
-    def _flush_batch(self, batch: List[dict]) -> None:
+    def _flush_batch(self, batch: List[dict], writer: BatchWriterState | None = None) -> None:
         if not batch:
             return
-        try:
-            with self.mongo_lock:
-                self.collections["solar_data"].insert_many(batch, ordered=False)
-                self.collections["today_solar_data"].insert_many(batch, ordered=False)
-                self.collections["current_month_solar_data"].insert_many(batch, ordered=False)
+        started = time.monotonic()
+        unstored: Dict[int, List[str]] = {}
+        for name, collection in self.collections.items():
+            for index in self._insert_batch(name, collection, batch):
+                unstored.setdefault(index, []).append(name)
+        if writer:
+            writer.record(
+                len(batch),
+                (time.monotonic() - started) * 1000,
+                ok=not unstored,
+                queue_depth=self._queue.qsize(),
+            )
+        if not unstored:
             logger.info("stored %s tcp records", len(batch))
             with self._metrics_lock:
                 self._metrics["batches_flushed"] += 1
+            return
+        with self._metrics_lock:
+            self._metrics["mongo_errors_total"] += 1
+        indexes = sorted(unstored)
+        self._journal_documents(
+            [batch[index] for index in indexes], [unstored[index] for index in indexes]
+        )
+
+    def _insert_batch(self, name: str, collection, batch: List[dict]) -> List[int]:
+        """Insert ``batch`` into ``collection``; return the indexes it did not store."""
+        try:
+            unstored = insert_unstored(collection, batch)
         except pymongo.errors.PyMongoError as exc:
-            logger.error("mongo batch insert error: %s", exc)
-            with self._metrics_lock:
-                self._metrics["mongo_errors_total"] += 1
+            logger.error("mongo batch insert error in %s: %s", name, exc)
+            return list(range(len(batch)))
+        if unstored:
+            logger.error(
+                "mongo batch insert error in %s: %s of %s documents not stored",
+                name,
+                len(unstored),
+                len(batch),
+            )
+        return unstored
+
+    def _overflow(self, document: dict, client_id: str) -> bool:
+        """Keep a reading the full queue rejected; ``False`` when it is dropped."""
+        return self._journal_documents([document])
+
+    def _journal_documents(
+        self, documents: List[dict], collections: List[List[str]] | None = None
+    ) -> bool:
+        """Journal ``documents`` for the collections that still need them (default: all)."""
+        if self._journal is None:
+            return False
+        names = list(self.collections)
+        stored = 0
+        for index, document in enumerate(documents):
+            targets = collections[index] if collections is not None else names
+            if self._journal.append(journal_record(document, targets)):
+                stored += 1
+        with self._metrics_lock:
+            self._metrics["journaled_total"] += stored
+        return stored == len(documents)
+
+    def _start_replayer(self) -> None:
+        if self._journal is None:
+            return
+        self._replayer = replayer_from_env(
+            self._journal,
+            lambda records: write_journal_records(get_mongo_database(), records),
+            name="tcp-journal-replayer",
+        )
+        self._replayer.start()
+
+    def _build_scheduler(self) -> PollScheduler:
+        high_res = os.getenv("TCP_POLL_HIGH_RES_DEVICES", "")
+        return PollScheduler(
+            interval=float(os.getenv("TCP_POLL_INTERVAL_SECONDS", "60")),
+            jitter=float(os.getenv("TCP_POLL_JITTER", "0.1")),
+            high_res_interval=float(os.getenv("TCP_POLL_HIGH_RES_INTERVAL_SECONDS", "5")),
+            high_res_devices=[device.strip() for device in high_res.split(",") if device.strip()],
+            queue_depth=self._queue.qsize,
+            queue_capacity=self._queue.maxsize,
+            backoff_threshold=float(os.getenv("TCP_POLL_BACKOFF_THRESHOLD", "0.5")),
+            max_backoff=float(os.getenv("TCP_POLL_MAX_BACKOFF", "8")),
+            tick=int(os.getenv("TCP_POLL_TICK_MS", "100")) / 1000,
+            now=time.monotonic(),
+        )
+
+    def _schedule_polls(
+        self,
+        target: PollTarget | None,
+        client_id: str,
+        poller: CyclePoller | PipelinedPoller,
+        send,
+    ) -> PollTarget:
+        """Register the connection with the poll scheduler, or point it at a new poller."""
+        if target is None:
+            target = PollTarget(client_id, poller, send)
+            self._scheduler.add(target, time.monotonic())
+        else:
+            target.poller = poller
+        return target
+
+    def _scheduler_loop(self) -> None:
+        while not self._draining.wait(self._scheduler.tick):
+            try:
+                self._scheduler.run_due(time.monotonic())
+            except Exception as exc:
+                logger.exception("poll scheduler error: %s", exc)
+
+    def _new_poller(self, profile: DeviceProfile) -> CyclePoller | PipelinedPoller:
+        if self.poll_mode == "pipelined":
+            return PipelinedPoller(profile.requests)
+        return CyclePoller(profile.next_request)
+
+    def _timeout_delay(self, timeout_retries: int) -> float:
+        return min(
+            self.timeout_backoff_base * (2 ** (timeout_retries - 1)),
+            self.timeout_backoff_max,
+        )
+
+    def _connection_opened(self) -> None:
+        with self._metrics_lock:
+            self._metrics["connections_total"] += 1
+            self._metrics["active_connections"] += 1
+
+    def _connection_closed(self) -> None:
+        with self._metrics_lock:
+            self._metrics["active_connections"] -= 1
 
     def handle_client(self, client_socket: socket.socket, addr: Tuple[str, int]) -> None:
         client_id = f"{addr[0]}:{addr[1]}"
         accumulated_data: Dict[str, List[float]] = {}
+        decoder = ModbusStreamDecoder(self.profiles.heartbeats)
+        profile = self.profiles.default
+        poller = self._new_poller(profile)
+        target: PollTarget | None = None
         timeout_retries = 0
 
+        identified = False
+
         with client_socket:
-            client_socket.settimeout(self.client_timeout)
-            with self._metrics_lock:
-                self._metrics["connections_total"] += 1
-                self._metrics["active_connections"] += 1
+            client_socket.settimeout(min(self.handshake_timeout, self.client_timeout))
+            self._connection_opened()
+            with self._clients_lock:
+                self._client_sockets.add(client_socket)
 
             try:
                 while True:
-                    data = client_socket.recv(self.recv_buffer_size)
+                    try:
+                        data = client_socket.recv(self.recv_buffer_size)
+                    except socket.timeout:
+                        if not poller.pending:
+                            raise
+                        logger.warning("timeout waiting for response from %s", client_id)
+                        with self._metrics_lock:
+                            self._metrics["timeouts_total"] += 1
+                        poller.reset()
+                        timeout_retries += 1
+                        if timeout_retries >= self.timeout_max_retries:
+                            logger.warning("max timeouts reached for %s; closing", client_id)
+                            break
+                        time.sleep(self._timeout_delay(timeout_retries))
+                        continue
                     if not data:
                         logger.info("client disconnected: %s", client_id)
                         break
-                    timeout_retries = 0
 
-                    logger.info("heartbeat from %s: %s", client_id, data)
-
-                    if data == self.heartbeat_packet:
-                        with self.cycle_lock:
-                            index, response_packet = next(self.response_cycle)
-
-                        logger.info("sending response #%s to %s", index, client_id)
-                        client_socket.sendall(response_packet)
-
-                        try:
-                            response = client_socket.recv(self.recv_buffer_size)
-                            if not response:
-                                logger.warning("client %s disconnected after response", client_id)
-                                break
-
-                            if len(response) < 6:
-                                logger.warning("short response from %s", client_id)
-                                with self._metrics_lock:
-                                    self._metrics["parse_errors_total"] += 1
+                    for event in decoder.feed(data):
+                        if isinstance(event, ModbusFrame):
+                            index = poller.match(event)
+                            if index is None:
+                                logger.warning("unsolicited frame from %s", client_id)
                                 continue
-                            hex_response = response.hex().upper()
-                            logger.info("response from %s: %s", client_id, hex_response)
-                            values = self._process_response(index, hex_response)
-                            if values:
-                                accumulated_data[f"response_{index}"] = values
-                                if len(accumulated_data) == 3:
-                                    self._store_data(accumulated_data, client_id)
-                                    accumulated_data = {}
-
-                        except (socket.timeout, socket.error):
-                            logger.warning("timeout waiting for response from %s", client_id)
-                            with self._metrics_lock:
-                                self._metrics["timeouts_total"] += 1
-                            timeout_retries += 1
-                            if timeout_retries >= self.timeout_max_retries:
-                                logger.warning("max timeouts reached for %s; closing", client_id)
-                                break
-                            delay = min(
-                                self.timeout_backoff_base * (2 ** (timeout_retries - 1)),
-                                self.timeout_backoff_max,
+                            reading = self._collect_frame(
+                                profile, index, event, accumulated_data, client_id
+                            )
+                            if reading:
+                                self._store_data(reading, client_id, profile)
+                            continue
+
+                        if self._cycle_complete(poller, accumulated_data):
+                            break
+                        if event != profile.heartbeat:
+                            profile = self.profiles.select(event)
+                            poller = self._new_poller(profile)
+                            accumulated_data.clear()
+                        timeout_retries = 0
+                        if not identified:
+                            identified = True
+                            client_socket.settimeout(self.client_timeout)
+                        logger.info("heartbeat from %s: %s", client_id, event)
+                        if self._scheduler is not None:
+                            target = self._schedule_polls(
+                                target,
+                                client_id,
+                                poller,
+                                functools.partial(_send_poll, client_socket),
                             )
-                            time.sleep(delay)
                             continue
-                    else:
-                        logger.warning("unrecognized packet from %s: %s", client_id, data)
+                        requests = poller.requests()
+                        logger.info("sending register request(s) to %s", client_id)
+                        client_socket.sendall(requests)
+                    self._count_discarded(decoder, client_id)
+                    if self._cycle_complete(poller, accumulated_data):
+                        logger.info("closing %s after its last cycle (draining)", client_id)
+                        break
 
             except socket.timeout:
-                logger.warning("connection timeout with %s", client_id)
-                with self._metrics_lock:
-                    self._metrics["timeouts_total"] += 1
+                self._evict(client_id, identified)
             except (socket.error, ConnectionResetError, BrokenPipeError):
                 logger.warning("connection lost with %s", client_id)
             except Exception as exc:
                 logger.exception("error handling %s: %s", client_id, exc)
             finally:
-                with self._metrics_lock:
-                    self._metrics["active_connections"] -= 1
+                if target is not None:
+                    self._scheduler.remove(target)
+                self._admission.release(addr[0])
+                with self._clients_lock:
+                    self._client_sockets.discard(client_socket)
+                self._connection_closed()
+
+    def _admit(self, addr: Tuple[str, int]) -> bool:
+        reason = self._admission.admit(addr[0])
+        if reason is None:
+            return True
+        logger.warning("rejecting %s:%s (%s)", addr[0], addr[1], reason)
+        with self._metrics_lock:
+            self._metrics["connections_rejected"] += 1
+            self._metrics[f"rejected_{reason}"] += 1
+        return False
+
+    def _evict(self, client_id: str, identified: bool) -> None:
+        """Count a connection closed for silence; half-open ones never sent a heartbeat."""
+        logger.warning("connection timeout with %s", client_id)
+        with self._metrics_lock:
+            self._metrics["timeouts_total"] += 1
+            self._metrics["evicted_idle" if identified else "evicted_half_open"] += 1
+
+    def _configure_client_socket(self, client_socket: socket.socket) -> None:
+        if self.keepalive_idle <= 0:
+            return
+        try:
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                client_socket.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle
+                )
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except OSError as exc:
+            logger.debug("keepalive setup failed: %s", exc)
+
+    def _cycle_complete(
+        self,
+        poller: CyclePoller | PipelinedPoller,
+        accumulated_data: Dict[str, List[float]],
+    ) -> bool:
+        """True when draining and the connection has no reading in flight."""
+        return self._draining.is_set() and not poller.pending and not accumulated_data
+
+    def _handoff_path(self) -> str:
+        """``TCP_HANDOFF_SOCKET``, suffixed with the worker index under the supervisor."""
+        handoff_path = os.getenv("TCP_HANDOFF_SOCKET", "").strip()
+        if handoff_path and self.worker_index is not None:
+            # Workers share the env; each needs its own socket to hand its listener over.
+            return f"{handoff_path}.{self.worker_index}"
+        return handoff_path
+
+    def _open_listener(self) -> socket.socket:
+        handoff_path = self._handoff_path()
+        listener = request_listener(handoff_path)
+        if listener is not None:
+            logger.info("took over listener from previous process via %s", handoff_path)
+            return listener
+        inherited_fd = os.getenv("TCP_LISTEN_FD", "").strip()
+        if inherited_fd:
+            logger.info("using inherited listener fd %s", inherited_fd)
+            return socket.socket(fileno=int(inherited_fd))
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(self.backlog)
+        return server_socket
+
+    def _start_handoff(self, listener: socket.socket) -> None:
+        handoff_path = self._handoff_path()
+        if not handoff_path:
+            return
+        self._handoff = ListenerHandoffServer(handoff_path, listener, self.begin_drain)
+        self._handoff.start()
+
+    def begin_drain(self) -> None:
+        """Stop accepting; open connections close once their current cycle is stored."""
+        if self._draining.is_set():
+            return
+        logger.info("draining: no longer accepting connections")
+        self._draining.set()
+
+    def _drain(self) -> None:
+        self.begin_drain()
+        if self._handoff:
+            self._handoff.close()
+        deadline = time.monotonic() + self.drain_timeout
+        while time.monotonic() < deadline:
+            with self._metrics_lock:
+                if self._metrics["active_connections"] <= 0:
+                    break
+            time.sleep(0.1)
+        self._close_clients()
+        self._shutdown(timeout=self.flush_timeout)
+
+    def _close_clients(self) -> None:
+        with self._clients_lock:
+            clients = list(self._client_sockets)
+        if clients:
+            logger.warning("drain deadline reached; closing %s connection(s)", len(clients))
+        for client_socket in clients:
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
     def start_server(self) -> None:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((self.host, self.port))
-            server_socket.listen(self.backlog)
+        server_socket = self._open_listener()
+        self._start_handoff(server_socket)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.begin_drain())
+        if self._scheduler is not None:
+            threading.Thread(
+                target=self._scheduler_loop, name="tcp-poll-scheduler", daemon=True
+            ).start()
+        # select() can report a connection another worker (or a reset peer) takes first;
+        # a non-blocking listener turns that into BlockingIOError instead of a stuck accept.
+        server_socket.setblocking(False)
+        with server_socket:
             logger.info("server listening on %s:%s", self.host, self.port)
 
             try:
-                while True:
-                    client_socket, addr = server_socket.accept()
+                while not self._draining.is_set():
+                    readable, _, _ = select.select([server_socket], [], [], 1.0)
+                    if not readable:
+                        continue
+                    try:
+                        client_socket, addr = server_socket.accept()
+                    except BlockingIOError:
+                        continue
+                    if not self._admit(addr):
+                        client_socket.close()
+                        continue
                     logger.info("new connection from %s:%s", addr[0], addr[1])
+                    self._configure_client_socket(client_socket)
                     self._executor.submit(self.handle_client, client_socket, addr)
             except KeyboardInterrupt:
                 logger.info("server shutdown requested")
             except Exception as exc:
                 logger.exception("server error: %s", exc)
             finally:
-                self._stop_event.set()
-                self._queue.join()
-                self._executor.shutdown(wait=True)
-                if self._health_server:
-                    self._health_server.shutdown()
-                    self._health_server.server_close()
+                self._drain()
+
+    def _shutdown(self, timeout: float | None = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._executor.shutdown(wait=True)
+        self._stop_event.set()
+        for thread in self._worker_threads:
+            thread.join(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+        self._journal_leftovers()
+        self._side_effects.stop()
+        if self._replayer:
+            self._replayer.stop()
+        if self._journal:
+            self._journal.close()
+        if self._health_server:
+            self._health_server.shutdown()
+            self._health_server.server_close()
+
+    def _journal_leftovers(self) -> None:
+        leftovers: List[dict] = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        if leftovers and not self._journal_documents(leftovers):
+            logger.error("flush deadline reached; %s tcp record(s) not stored", len(leftovers))
+
+    def health_payload(self) -> dict:
+        with self._metrics_lock:
+            payload = dict(self._metrics)
+        payload["queue_size"] = self._queue.qsize()
+        payload["writers"] = [writer.metrics() for writer in self._writers]
+        payload["side_effects"] = self._side_effects.metrics()
+        payload["admission_sources"] = self._admission.source_count()
+        if self._scheduler is not None:
+            payload["scheduler"] = self._scheduler.metrics()
+        if self._journal is not None:
+            payload["journal"] = self._journal.metrics()
+        return payload
 
     def _start_health_server(self) -> None:
         port = int(os.getenv("TCP_HEALTH_PORT", "7001"))
@@ -363,10 +749,7 @@ class TCPSocketServer:
                     self.send_response(404)
                     self.end_headers()
                     return
-                with server._metrics_lock:
-                    payload = dict(server._metrics)
-                payload["queue_size"] = server._queue.qsize()
-                body = json.dumps(payload).encode("utf-8")
+                body = json.dumps(server.health_payload()).encode("utf-8")
                 self.send_response(200)
                 self.send_header("Content-Type", "application/json")
                 self.send_header("Content-Length", str(len(body)))
@@ -388,15 +771,50 @@ class TCPSocketServer:
         self._health_thread.start()
 
     def _run_health_server(self, port: int, handler) -> None:
+        host = os.getenv("TCP_HEALTH_HOST", self.host)
         try:
-            httpd = HTTPServer((self.host, port), handler)
+            httpd = HTTPServer((host, port), handler)
             self._health_server = httpd
-            logger.info("tcp health server listening on %s:%s", self.host, port)
+            logger.info("tcp health server listening on %s:%s", host, port)
             httpd.serve_forever()
         except Exception as exc:
             logger.warning("health server error: %s", exc)
 
 
+def _legacy_profile(
+    heartbeat: bytes,
+    packets: List[bytes],
+    codecs: List[struct.Struct],
+) -> DeviceProfile:
+    """The built-in profile described by the constructor arguments."""
+    fields = [
+        DEFAULT_FIELDS[index] if index < len(DEFAULT_FIELDS) else f"response_{index}"
+        for index in range(len(packets))
+    ]
+    return DeviceProfile(
+        "default",
+        heartbeat,
+        [RegisterBlock(*block) for block in zip(fields, packets, codecs)],
+    )
+
+
+def _send_poll(client_socket: socket.socket, frames: bytes) -> bool:
+    """Scheduler-side send that never blocks; ``False`` when the socket cannot take it now."""
+    # A socket with a timeout waits for room before sending, so check writability first.
+    _, writable, _ = select.select([], [client_socket], [], 0)
+    if not writable:
+        return False
+    try:
+        sent = client_socket.send(frames, socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return False
+    if sent < len(frames):
+        # The rest of a torn request would desynchronise the gateway; drop the connection.
+        client_socket.shutdown(socket.SHUT_RDWR)
+        raise BrokenPipeError(f"poll request cut short after {sent} of {len(frames)} bytes")
+    return True
+
+
 def run() -> None:
     host = os.getenv("TCP_HOST", "0.0.0.0")
     port = int(os.getenv("TCP_PORT", "6000"))
@@ -404,7 +822,15 @@ def run() -> None:
     timeout = int(os.getenv("TCP_CLIENT_TIMEOUT", "120"))
     backlog = int(os.getenv("TCP_BACKLOG", "50"))
 
-    server = TCPSocketServer(
+    mode = os.getenv("TCP_SERVER_MODE", "threaded").strip().lower()
+    if mode == "asyncio":
+        from services.tcp.async_server import AsyncTCPSocketServer
+
+        server_class = AsyncTCPSocketServer
+    else:
+        server_class = TCPSocketServer
+
+    server = server_class(
         host=host,
         port=port,
         recv_buffer_size=recv_buffer,
@@ -412,5 +838,7 @@ def run() -> None:
         backlog=backlog,
         batch_size=int(os.getenv("TCP_BATCH_SIZE", "200")),
         batch_flush_ms=int(os.getenv("TCP_BATCH_FLUSH_MS", "500")),
+        reuse_port=os.getenv("TCP_REUSE_PORT", "false").strip().lower() in {"1", "true", "yes"},
     )
     server.start_server()
+
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from apps.telemetry.services import broadcast_realtime_many, mark_devices_seen
+
+logger = logging.getLogger("tcp.side_effects")
+
+
+class SideEffectStage:
+    """Runs device presence and WebSocket fan-out off the socket handlers.
+
+    Handlers only ``submit``; a single thread drains the bounded queue every ``flush_ms``,
+    marks every device seen in one pipelined Redis round trip and broadcasts only the
+    latest reading per device.
+    """
+
+    def __init__(
+        self,
+        *,
+        topic: str,
+        group: str,
+        event: str,
+        maxsize: int = 10000,
+        flush_ms: int = 200,
+        max_batch: int = 1000,
+    ) -> None:
+        self.topic = topic
+        self.group = group
+        self.event = event
+        self.flush_ms = flush_ms
+        self.max_batch = max_batch
+        self._queue: queue.Queue[Tuple[str, dict]] = queue.Queue(maxsize=maxsize)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tcp-side-effects", daemon=True)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0,
+            "dropped": 0,
+            "broadcasts": 0,
+            "coalesced": 0,
+            "errors": 0,
+        }
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+
+    def submit(self, device_id: str, message: dict) -> bool:
+        try:
+            self._queue.put_nowait((device_id, message))
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics["dropped"] += 1
+            return False
+        with self._metrics_lock:
+            self._metrics["submitted"] += 1
+        return True
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            payload = dict(self._metrics)
+        payload["queue_size"] = self._queue.qsize()
+        return payload
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set() or not self._queue.empty():
+            batch = self._drain()
+            if batch:
+                self._flush(batch)
+
+    def _drain(self) -> List[Tuple[str, dict]]:
+        deadline = time.monotonic() + self.flush_ms / 1000
+        batch: List[Tuple[str, dict]] = []
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Tuple[str, dict]]) -> None:
+        latest: Dict[str, dict] = {}
+        for device_id, message in batch:
+            latest[device_id] = message
+        try:
+            mark_devices_seen(latest.keys(), topic=self.topic)
+        except Exception as exc:
+            logger.warning("device status update failed: %s", exc)
+            with self._metrics_lock:
+                self._metrics["errors"] += 1
+        try:
+            broadcast_realtime_many(list(latest.values()), group=self.group, event=self.event)
+        except Exception as exc:
+            logger.warning("tcp websocket broadcast failed: %s", exc)
+            with self._metrics_lock:
+                self._metrics["errors"] += 1
+            return
+        with self._metrics_lock:
+            self._metrics["broadcasts"] += len(latest)
+            self._metrics["coalesced"] += len(batch) - len(latest)
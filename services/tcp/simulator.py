@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import resource
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+REQUEST_FRAME = struct.Struct(">HHHBBHH")
+RESPONSE_HEADER = struct.Struct(">HHHBBB")
+
+
+@dataclass(frozen=True)
+class FleetProfile:
+    """How a simulated gateway fleet behaves.
+
+    ``register_formats`` maps the start register of each poll request to the struct format of
+    one value (``">f"`` or ``">q"``), so replies carry as many values as the request asks for.
+    ``slow_fraction`` of gateways delay every reply by ``slow_delay``; ``silent_fraction`` send
+    heartbeats but never answer, exercising the server's timeout path.
+    """
+
+    heartbeat: bytes
+    register_formats: Dict[int, str]
+    requests_per_heartbeat: int = 1
+    heartbeat_interval: float = 1.0
+    reply_timeout: float = 10.0
+    slow_fraction: float = 0.0
+    slow_delay: float = 0.5
+    silent_fraction: float = 0.0
+    ramp_seconds: float = 1.0
+    seed: int = 1
+
+
+@dataclass
+class GatewayResult:
+    client_id: str
+    behavior: str
+    heartbeats: int = 0
+    replies: int = 0
+    reading_starts: List[float] = field(default_factory=list)
+    error: str | None = None
+
+
+def register_formats(packets: List[bytes], codecs: List[struct.Struct]) -> Dict[int, str]:
+    """Map each poll request's start register to its value format."""
+    formats = {}
+    for packet, codec in zip(packets, codecs):
+        start = REQUEST_FRAME.unpack(packet)[5]
+        formats[start] = codec.format if codec.format.startswith(">") else f">{codec.format}"
+    return formats
+
+
+def _behavior(profile: FleetProfile, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < profile.silent_fraction:
+        return "silent"
+    if roll < profile.silent_fraction + profile.slow_fraction:
+        return "slow"
+    return "normal"
+
+
+def build_reply(request: bytes, value_format: str, rng: random.Random, energy: List[int]) -> bytes:
+    transaction_id, _, _, unit_id, function_code, _, count = REQUEST_FRAME.unpack(request)
+    codec = struct.Struct(value_format)
+    values = (count * 2) // codec.size
+    if value_format.endswith("q"):
+        energy[0] += rng.randint(1, 50)
+        data = b"".join(codec.pack(energy[0] + offset) for offset in range(values))
+    else:
+        data = b"".join(codec.pack(rng.uniform(0.0, 250.0)) for _ in range(values))
+    header = RESPONSE_HEADER.pack(
+        transaction_id, 0, 3 + len(data), unit_id, function_code, len(data)
+    )
+    return header + data
+
+
+async def run_gateway(
+    index: int,
+    host: str,
+    port: int,
+    profile: FleetProfile,
+    stop_at: float,
+) -> GatewayResult:
+    rng = random.Random(profile.seed * 1_000_003 + index)
+    behavior = _behavior(profile, rng)
+    await asyncio.sleep(rng.uniform(0, profile.ramp_seconds))
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as exc:
+        return GatewayResult(client_id="", behavior=behavior, error=str(exc))
+    local = writer.get_extra_info("sockname")
+    result = GatewayResult(client_id=f"{local[0]}:{local[1]}", behavior=behavior)
+    starts = list(profile.register_formats)
+    answered: set[int] = set()
+    reading_started: float | None = None
+    energy = [rng.randint(0, 10_000_000)]
+    try:
+        while time.time() < stop_at:
+            sent_at = time.time()
+            writer.write(profile.heartbeat)
+            await writer.drain()
+            result.heartbeats += 1
+            if reading_started is None:
+                reading_started = sent_at
+            for _ in range(profile.requests_per_heartbeat):
+                request = await asyncio.wait_for(
+                    reader.readexactly(REQUEST_FRAME.size), timeout=profile.reply_timeout
+                )
+                if behavior == "silent":
+                    continue
+                if behavior == "slow":
+                    await asyncio.sleep(profile.slow_delay)
+                start = REQUEST_FRAME.unpack(request)[5]
+                value_format = profile.register_formats.get(start)
+                if value_format is None:
+                    continue
+                writer.write(build_reply(request, value_format, rng, energy))
+                result.replies += 1
+                answered.add(starts.index(start))
+            await writer.drain()
+            if len(answered) == len(starts):
+                result.reading_starts.append(reading_started)
+                answered.clear()
+                reading_started = None
+            delay = profile.heartbeat_interval - (time.time() - sent_at)
+            if delay > 0:
+                await asyncio.sleep(min(delay, max(stop_at - time.time(), 0)))
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as exc:
+        result.error = type(exc).__name__
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    return result
+
+
+async def run_fleet(
+    host: str,
+    port: int,
+    indices: List[int],
+    profile: FleetProfile,
+    duration: float,
+) -> List[GatewayResult]:
+    stop_at = time.time() + profile.ramp_seconds + duration
+    return await asyncio.gather(
+        *(run_gateway(index, host, port, profile, stop_at) for index in indices)
+    )
+
+
+def fleet_process(host, port, indices, profile, duration, conn) -> None:
+    """``multiprocessing`` target: run part of the fleet and send the results back."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = len(indices) + 256
+    if soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    conn.send(asyncio.run(run_fleet(host, port, indices, profile, duration)))
+    conn.close()
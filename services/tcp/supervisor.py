@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+logger = logging.getLogger("tcp.supervisor")
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=os.getenv("TCP_LOG_LEVEL", "INFO"))
+
+
+def _run_worker(index: int, health_port: int) -> None:
+    os.environ["TCP_WORKER_INDEX"] = str(index)
+    os.environ["TCP_REUSE_PORT"] = "true"
+    os.environ["TCP_HEALTH_HOST"] = "127.0.0.1"
+    os.environ["TCP_HEALTH_PORT"] = str(health_port)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from services.tcp.server import run
+
+    run()
+
+
+class TCPSupervisor:
+    """Runs N TCP server processes that share the listening port through ``SO_REUSEPORT``.
+
+    Every worker owns its queue, Mongo writers and journal and serves ``/health`` on a
+    loopback port; the supervisor serves the public ``/health`` with summed counters and the
+    per-worker payloads, and restarts workers that exit unexpectedly.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.health_port = int(os.getenv("TCP_HEALTH_PORT", "7001"))
+        self.worker_health_base = int(os.getenv("TCP_WORKER_HEALTH_BASE_PORT", "7100"))
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, multiprocessing.Process] = {}
+        self._restarts = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        for index in range(self.workers):
+            self._spawn(index)
+        self._start_health_server()
+        logger.info("tcp supervisor started %s worker(s)", self.workers)
+        try:
+            while not self._stop_event.wait(1.0):
+                for index, process in list(self._processes.items()):
+                    if not process.is_alive():
+                        logger.warning(
+                            "tcp worker %s exited with %s; restarting", index, process.exitcode
+                        )
+                        self._restarts += 1
+                        self._spawn(index)
+        finally:
+            self._terminate()
+
+    def health_payload(self) -> dict:
+        totals: dict[str, float] = {}
+        workers = []
+        for index, process in sorted(self._processes.items()):
+            payload = self._fetch_worker_health(index)
+            workers.append(
+                {
+                    "index": index,
+                    "pid": process.pid,
+                    "alive": process.is_alive(),
+                    **(payload or {}),
+                }
+            )
+            for key, value in (payload or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return {
+            **totals,
+            "worker_count": self.workers,
+            "worker_restarts": self._restarts,
+            "workers": workers,
+        }
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_run_worker,
+            args=(index, self.worker_health_base + index),
+            name=f"tcp-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _fetch_worker_health(self, index: int) -> dict | None:
+        url = f"http://127.0.0.1:{self.worker_health_base + index}/health"
+        try:
+            with urlopen(url, timeout=1.0) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except (URLError, HTTPError, TimeoutError, ConnectionError, json.JSONDecodeError):
+            return None
+
+    def _handle_signal(self, signum, frame) -> None:
+        self._stop_event.set()
+
+    def _terminate(self) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=30)
+
+    def _start_health_server(self) -> None:
+        if self.health_port <= 0:
+            return
+
+        supervisor = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/health":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = json.dumps(supervisor.health_payload()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except BrokenPipeError:
+                    return
+
+            def log_message(self, format, *args):
+                return
+
+        def _run():
+            host = os.getenv("TCP_HOST", "0.0.0.0")
+            try:
+                httpd = HTTPServer((host, self.health_port), HealthHandler)
+                logger.info("tcp supervisor health listening on %s:%s", host, self.health_port)
+                httpd.serve_forever()
+            except Exception as exc:
+                logger.warning("health server error: %s", exc)
+
+        threading.Thread(target=_run, name="tcp-health-server", daemon=True).start()
+
+
+def run_supervisor(workers: int) -> None:
+    TCPSupervisor(workers).run()
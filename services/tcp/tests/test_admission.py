@@ -0,0 +1,34 @@
+from services.tcp.admission import AdmissionController, TokenBucket
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2.0, burst=2.0)
+    bucket._updated = 0.0
+
+    assert bucket.take(0.0) and bucket.take(0.0)
+    assert not bucket.take(0.0)
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+
+
+def test_admission_limits_per_ip_and_total_until_released():
+    admission = AdmissionController(max_total=3, max_per_ip=2, accept_rate=0, accept_burst=0)
+
+    assert admission.admit("10.0.0.1") is None
+    assert admission.admit("10.0.0.1") is None
+    assert admission.admit("10.0.0.1") == "per_ip"
+    assert admission.admit("10.0.0.2") is None
+    assert admission.admit("10.0.0.3") == "capacity"
+
+    admission.release("10.0.0.1")
+    admission.release("10.0.0.9")
+    assert admission.admit("10.0.0.3") is None
+    assert admission.source_count() == 3
+
+
+def test_admission_rejects_floods_over_accept_rate():
+    admission = AdmissionController(max_total=0, max_per_ip=0, accept_rate=1.0, accept_burst=2)
+
+    results = [admission.admit("10.0.0.1", now=admission._bucket._updated) for _ in range(3)]
+
+    assert results == [None, None, "rate"]
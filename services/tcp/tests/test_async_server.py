@@ -0,0 +1,227 @@
+import asyncio
+import queue
+import struct
+import threading
+from unittest import mock
+
+import pytest
+
+from services.tcp import server as tcp_server
+from services.tcp.async_server import AsyncTCPSocketServer
+
+
+def _response_frame(index: int, transaction_id: int = 1) -> bytes:
+    if index == 0:
+        data = struct.pack(">5f", 1, 2, 3, 4, 5)
+    elif index == 1:
+        data = struct.pack(">3f", 6, 7, 8)
+    else:
+        data = struct.pack(">2q", 9, 10)
+    header = struct.pack(">HHHBBB", transaction_id, 0, 3 + len(data), 0x01, 0x03, len(data))
+    return header + data
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("TCP_HEALTH_PORT", "0")
+    with mock.patch.object(tcp_server.TCPSocketServer, "_init_mongo"), mock.patch.object(
+        tcp_server.TCPSocketServer, "_start_worker"
+    ):
+        instance = AsyncTCPSocketServer("127.0.0.1", 0, client_timeout=2, max_connections=1)
+    yield instance
+    instance._executor.shutdown(wait=True)
+
+
+def test_async_server_accumulates_full_reading(server):
+    stored = []
+    server._store_data = lambda data, client_id, profile: stored.append(dict(data))
+
+    async def scenario():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(3):
+            writer.write(tcp_server.HEARTBEAT_PACKET)
+            await writer.drain()
+            request = await reader.read(64)
+            index = server.response_packets.index(request)
+            writer.write(_response_frame(index, int.from_bytes(request[:2], "big")))
+            await writer.drain()
+        writer.close()
+        await asyncio.sleep(0.1)
+        listener.close()
+        await listener.wait_closed()
+
+    asyncio.run(scenario())
+
+    assert stored == [
+        {
+            "current": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "power": [6.0, 7.0, 8.0],
+            "energy_consumption": [9.0, 10.0],
+        }
+    ]
+    assert server._metrics["connections_total"] == 1
+    assert server._metrics["active_connections"] == 0
+
+
+def test_async_server_pipelined_polling_matches_replies_by_transaction_id(server):
+    stored = []
+    server.poll_mode = "pipelined"
+    server._store_data = lambda data, client_id, profile: stored.append(dict(data))
+
+    async def scenario():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(tcp_server.HEARTBEAT_PACKET)
+        await writer.drain()
+        requests = await reader.readexactly(12 * len(server.response_packets))
+        transaction_ids = [
+            struct.unpack_from(">H", requests, offset)[0] for offset in range(0, len(requests), 12)
+        ]
+        replies = [
+            _response_frame(index, transaction_id)
+            for index, transaction_id in enumerate(transaction_ids)
+        ]
+        writer.write(b"".join(reversed(replies)))
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return transaction_ids
+
+    transaction_ids = asyncio.run(scenario())
+
+    assert len(set(transaction_ids)) == 3
+    assert stored == [
+        {
+            "current": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "power": [6.0, 7.0, 8.0],
+            "energy_consumption": [9.0, 10.0],
+        }
+    ]
+
+
+def test_async_server_rejects_connections_over_limit(server):
+    async def scenario():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        _, first = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.sleep(0.05)
+        second_reader, second = await asyncio.open_connection("127.0.0.1", port)
+        closed = await asyncio.wait_for(second_reader.read(1), timeout=1)
+        first.close()
+        second.close()
+        await asyncio.sleep(0.05)
+        listener.close()
+        await listener.wait_closed()
+        return closed
+
+    assert asyncio.run(scenario()) == b""
+    assert server._metrics["connections_rejected"] == 1
+
+
+def test_async_server_evicts_connections_that_never_send_a_heartbeat(server):
+    server.handshake_timeout = 0.1
+
+    async def scenario():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        closed = await asyncio.wait_for(reader.read(1), timeout=1)
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return closed
+
+    assert asyncio.run(scenario()) == b""
+    assert server._metrics["evicted_half_open"] == 1
+    assert server._admission.source_count() == 0
+
+
+def test_async_server_journals_overflow_off_the_event_loop(server):
+    appended = []
+
+    class Journal:
+        def append(self, record):
+            appended.append(threading.current_thread())
+            return True
+
+    server._journal = Journal()
+    server.collections = {"solar_data": None}
+    server._queue = queue.Queue(maxsize=1)
+    server._queue.put_nowait({})
+    reading = {
+        "current": [1.0, 2.0, 3.0, 4.0, 5.0],
+        "power": [6.0, 7.0, 8.0],
+        "energy_consumption": [9.0, 10.0],
+    }
+
+    async def scenario():
+        server._store_data(reading, "10.0.0.1:1234", server.profiles.default)
+        loop_thread = threading.current_thread()
+        for _ in range(50):
+            if appended:
+                break
+            await asyncio.sleep(0.01)
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+
+    assert len(appended) == 1
+    assert appended[0] is not loop_thread
+    assert server._metrics["journaled_total"] == 1
+
+
+def test_flush_journals_only_collections_that_failed(server):
+    from pymongo.errors import BulkWriteError, PyMongoError
+
+    class Collection:
+        def __init__(self, error=None):
+            self.error = error
+            self.inserted = []
+
+        def insert_many(self, documents, ordered=True):
+            self.inserted.extend(documents)
+            if self.error:
+                raise self.error
+
+    class Journal:
+        def __init__(self):
+            self.records = []
+
+        def append(self, record):
+            self.records.append(record)
+            return True
+
+    server._journal = Journal()
+    server.collections = {
+        "solar_data": Collection(),
+        "today_solar_data": Collection(PyMongoError("down")),
+        "current_month_solar_data": Collection(
+            BulkWriteError(
+                {"writeErrors": [{"index": 1, "code": 121}, {"index": 2, "code": 11000}]}
+            )
+        ),
+    }
+    batch = [{"_id": 1}, {"_id": 2}, {"_id": 3}]
+
+    server._flush_batch(batch)
+
+    assert [record["collections"] for record in server._journal.records] == [
+        ["today_solar_data"],
+        ["today_solar_data", "current_month_solar_data"],
+        ["today_solar_data"],
+    ]
+    assert server._metrics["mongo_errors_total"] == 1
+    assert server._metrics["journaled_total"] == 3
+
+
+def test_supervised_workers_get_their_own_handoff_socket(server, monkeypatch):
+    monkeypatch.setenv("TCP_HANDOFF_SOCKET", "/tmp/tcp.sock")
+    assert server._handoff_path() == "/tmp/tcp.sock"
+
+    server.worker_index = "2"
+    assert server._handoff_path() == "/tmp/tcp.sock.2"
@@ -0,0 +1,47 @@
+import random
+import struct
+
+from services.tcp.bench import run_benchmark
+from services.tcp.server import (
+    DEFAULT_RESPONSE_CODECS,
+    DEFAULT_RESPONSE_PACKETS,
+    HEARTBEAT_PACKET,
+)
+from services.tcp.simulator import FleetProfile, build_reply, register_formats
+
+
+def test_build_reply_answers_the_requested_register_count():
+    formats = register_formats(DEFAULT_RESPONSE_PACKETS, DEFAULT_RESPONSE_CODECS)
+    request = DEFAULT_RESPONSE_PACKETS[2]
+
+    reply = build_reply(request, formats[0x0C83], random.Random(1), [100])
+
+    transaction_id, _, length, _, function_code, byte_count = struct.unpack_from(">HHHBBB", reply)
+    assert transaction_id == 0x01B6
+    assert function_code == 0x03
+    assert byte_count == 16 and length == 19
+    assert struct.unpack_from(">2q", reply, 9)[1] > 100
+
+
+def test_benchmark_stores_readings_from_simulated_fleet(monkeypatch):
+    monkeypatch.setenv("TCP_HEALTH_PORT", "0")
+    monkeypatch.setenv("TCP_POLL_MODE", "pipelined")
+    monkeypatch.setenv("TCP_BATCH_FLUSH_MS", "50")
+    profile = FleetProfile(
+        heartbeat=HEARTBEAT_PACKET,
+        register_formats=register_formats(DEFAULT_RESPONSE_PACKETS, DEFAULT_RESPONSE_CODECS),
+        requests_per_heartbeat=3,
+        heartbeat_interval=0.05,
+        ramp_seconds=0.1,
+        silent_fraction=0.3,
+        reply_timeout=0.5,
+    )
+
+    report = run_benchmark(
+        gateways=10, duration=0.5, fleet_processes=0, profile=profile, engine="asyncio"
+    )
+
+    assert report["readings_stored"] == report["readings_completed"] > 0
+    assert report["behaviors"]["silent"] >= 1
+    assert report["latency_p50_ms"] is not None
+    assert report["server"]["messages_queued"] == report["readings_stored"]
@@ -0,0 +1,62 @@
+import struct
+
+import pytest
+
+from services.tcp.framing import (
+    FLOAT32,
+    INT64,
+    ModbusFrame,
+    ModbusStreamDecoder,
+    decode_registers,
+)
+
+HEARTBEAT = b"GWCCCL0001"
+
+
+def _frame(transaction_id: int, data: bytes, function_code: int = 0x03) -> bytes:
+    pdu = bytes([function_code, len(data)]) + data
+    return struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, 1) + pdu
+
+
+def test_decoder_reassembles_frame_split_across_reads():
+    decoder = ModbusStreamDecoder(HEARTBEAT)
+    raw = _frame(0x0126, struct.pack(">2f", 1.5, -2.0))
+
+    assert decoder.feed(raw[:5]) == []
+    assert decoder.feed(raw[5:11]) == []
+    (frame,) = decoder.feed(raw[11:])
+
+    assert frame.transaction_id == 0x0126
+    assert decode_registers(frame, FLOAT32) == [1.5, -2.0]
+
+
+def test_decoder_splits_coalesced_heartbeats_and_frames():
+    decoder = ModbusStreamDecoder(HEARTBEAT)
+    raw = HEARTBEAT + _frame(1, struct.pack(">q", 42)) + HEARTBEAT[:4]
+
+    events = decoder.feed(raw)
+    assert events[0] == HEARTBEAT
+    assert decode_registers(events[1], INT64) == [42.0]
+    assert decoder.feed(HEARTBEAT[4:]) == [HEARTBEAT]
+
+
+def test_decoder_skips_garbage_before_frame():
+    decoder = ModbusStreamDecoder(HEARTBEAT)
+    events = decoder.feed(b"\xff\xfe" + _frame(7, struct.pack(">f", 3.0)))
+
+    assert [event.transaction_id for event in events] == [7]
+    assert decoder.discarded == 2
+
+
+def test_decode_registers_rejects_exception_and_bad_lengths():
+    exception = ModbusFrame(1, 1, 0x83, memoryview(b"\x02"))
+    with pytest.raises(ValueError):
+        decode_registers(exception, FLOAT32)
+
+    short = ModbusFrame(1, 1, 0x03, memoryview(b"\x08\x00\x00\x00\x00"))
+    with pytest.raises(ValueError):
+        decode_registers(short, FLOAT32)
+
+    misaligned = ModbusFrame(1, 1, 0x03, memoryview(b"\x06" + bytes(6)))
+    with pytest.raises(ValueError):
+        decode_registers(misaligned, FLOAT32)
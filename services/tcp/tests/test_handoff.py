@@ -0,0 +1,30 @@
+import socket
+import threading
+
+from services.tcp.handoff import ListenerHandoffServer, request_listener
+
+
+def test_listener_is_handed_off_and_keeps_accepting(tmp_path):
+    path = str(tmp_path / "handoff.sock")
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    port = listener.getsockname()[1]
+    handed_off = threading.Event()
+    server = ListenerHandoffServer(path, listener, handed_off.set)
+    server.start()
+
+    inherited = request_listener(path)
+    assert inherited is not None
+    assert handed_off.wait(2.0)
+    listener.close()
+
+    with inherited, socket.create_connection(("127.0.0.1", port), timeout=2.0):
+        inherited.settimeout(2.0)
+        conn, _ = inherited.accept()
+        conn.close()
+
+
+def test_request_listener_without_previous_process(tmp_path):
+    assert request_listener(str(tmp_path / "missing.sock")) is None
+    assert request_listener("") is None
@@ -0,0 +1,29 @@
+from services.tcp.framing import ModbusFrame
+from services.tcp.polling import CyclePoller, PipelinedPoller
+
+
+def _reply(transaction_id: int) -> ModbusFrame:
+    return ModbusFrame(transaction_id, 1, 0x03, memoryview(b"\x00"))
+
+
+def test_cycle_poller_drops_a_reply_that_arrives_after_the_next_heartbeat():
+    cycle = iter([(0, b"\x01\x26current"), (1, b"\x01\x27power")])
+    poller = CyclePoller(lambda: next(cycle))
+
+    poller.requests()
+    poller.requests()  # the next heartbeat came before the reply to 0x0126
+
+    assert poller.match(_reply(0x0126)) is None
+    assert poller.pending
+    assert poller.match(_reply(0x0127)) == 1
+    assert not poller.pending
+
+
+def test_pipelined_poller_matches_replies_in_any_order():
+    poller = PipelinedPoller([b"\x00\x00a", b"\x00\x00b"])
+    frames = poller.requests()
+
+    assert frames == b"\x00\x01a\x00\x02b"
+    assert poller.match(_reply(2)) == 1
+    assert poller.match(_reply(1)) == 0
+    assert poller.match(_reply(1)) is None
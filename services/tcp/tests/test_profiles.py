@@ -0,0 +1,82 @@
+import json
+import struct
+
+import pytest
+
+from services.tcp.framing import ModbusFrame, ModbusStreamDecoder
+from services.tcp.profiles import compile_profile, load_profiles
+
+
+def _reply(data: bytes) -> ModbusFrame:
+    return ModbusFrame(1, 1, 0x03, memoryview(bytes([len(data)]) + data))
+
+
+def test_shipped_profile_matches_built_in_defaults():
+    from services.tcp import server as tcp_server
+
+    registry = load_profiles("services/tcp/device_profiles.json")
+
+    assert registry.default.heartbeat == tcp_server.HEARTBEAT_PACKET
+    assert registry.default.requests == tcp_server.DEFAULT_RESPONSE_PACKETS
+    assert list(registry.default.fields) == tcp_server.DEFAULT_FIELDS
+
+
+def test_profile_selected_by_heartbeat_decodes_with_scaling(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(
+        json.dumps(
+            {
+                "profiles": [
+                    {
+                        "name": "meter",
+                        "heartbeat": "METER00042",
+                        "registers": [
+                            {
+                                "field": "voltage",
+                                "request": "00 01 00 00 00 06 01 04 00 00 00 02",
+                                "type": "uint16",
+                                "scale": 0.1,
+                            }
+                        ],
+                    },
+                    {
+                        "name": "gwcc",
+                        "heartbeat": "GWCCCL0001",
+                        "registers": [
+                            {"field": "power", "request": "00 02 00 00 00 06 01 03 00 00 00 02"}
+                        ],
+                    },
+                ]
+            }
+        )
+    )
+    registry = load_profiles(path)
+    decoder = ModbusStreamDecoder(registry.heartbeats)
+
+    (heartbeat,) = decoder.feed(b"METER00042")
+    profile = registry.select(heartbeat)
+
+    assert profile.name == "meter"
+    assert profile.blocks[0].decode(_reply(struct.pack(">2H", 2300, 2310))) == pytest.approx(
+        [230.0, 231.0]
+    )
+    reading = {"timestamp": "2024-01-01T00:00:00Z", "client_id": "gw", "voltage": [230.0]}
+    assert profile.payload_model.model_validate(reading).voltage == [230.0]
+    assert registry.select(b"UNKNOWN").name == "meter"
+
+
+def test_compile_profile_rejects_misaligned_register_count():
+    with pytest.raises(ValueError):
+        compile_profile(
+            {
+                "name": "bad",
+                "heartbeat": "BAD",
+                "registers": [
+                    {
+                        "field": "energy",
+                        "request": "00 01 00 00 00 06 01 03 00 00 00 03",
+                        "type": "int64",
+                    }
+                ],
+            }
+        )
@@ -0,0 +1,128 @@
+import socket
+import time
+
+from services.tcp.framing import ModbusFrame
+from services.tcp.polling import CyclePoller
+from services.tcp.scheduler import PollScheduler, PollTarget, TimerWheel
+from services.tcp.server import _send_poll
+
+
+def test_timer_wheel_expires_across_levels_in_order():
+    wheel = TimerWheel(0.1, slots=4, levels=3)
+    for delay in (5.0, 0.25, 1.0, 2.0):
+        wheel.schedule(delay, delay, now=0.0)
+    cancelled = wheel.schedule(0.5, "cancelled", now=0.0)
+    cancelled.cancel()
+
+    fired = []
+    for step in range(1, 61):
+        fired.extend((round(step * 0.1, 1), item) for item in wheel.advance(step * 0.1))
+
+    assert fired == [(0.3, 0.25), (1.0, 1.0), (2.0, 2.0), (5.0, 5.0)]
+    assert wheel.size == 0
+
+
+def _scheduler(depth, **kwargs):
+    options = dict(
+        interval=10.0,
+        jitter=0.0,
+        high_res_interval=1.0,
+        queue_depth=lambda: depth[0],
+        queue_capacity=100,
+        backoff_threshold=0.5,
+        max_backoff=5.0,
+        tick=0.1,
+        seed=1,
+    )
+    options.update(kwargs)
+    return PollScheduler(**options)
+
+
+def test_scheduler_polls_high_res_devices_faster_and_backs_off_when_queue_is_deep():
+    depth = [0]
+    scheduler = _scheduler(depth, high_res_devices=["10.0.0.2"])
+    normal = PollTarget("10.0.0.1:5000", CyclePoller(lambda: (0, b"req")), lambda data: None)
+    fast = PollTarget("10.0.0.2:5001", CyclePoller(lambda: (0, b"req")), lambda data: None)
+
+    assert scheduler.next_delay(normal) == 10.0
+    assert scheduler.next_delay(fast) == 1.0
+    depth[0] = 75
+    assert scheduler.backoff_factor() == 3.0
+    assert scheduler.next_delay(fast) == 3.0
+    depth[0] = 100
+    assert scheduler.next_delay(normal) == 50.0
+
+
+def test_scheduler_skips_targets_with_outstanding_poll_and_stops_after_remove():
+    sent = []
+    scheduler = _scheduler([0], interval=1.0)
+    target = PollTarget("10.0.0.1:5000", CyclePoller(lambda: (0, b"req")), sent.append)
+    scheduler.add(target, now=0.0)
+
+    now = 0.0
+    for _ in range(25):
+        now += 0.1
+        scheduler.run_due(now)
+    assert sent == [b"req"]
+    assert scheduler.metrics()["polls_skipped"] >= 1
+
+    target.poller.match(ModbusFrame(int.from_bytes(b"re", "big"), 1, 0x03, memoryview(b"")))
+    for _ in range(15):
+        now += 0.1
+        scheduler.run_due(now)
+    assert sent == [b"req", b"req"]
+
+    scheduler.remove(target)
+    for _ in range(30):
+        now += 0.1
+        scheduler.run_due(now)
+    assert len(sent) == 2
+    assert scheduler.metrics()["targets"] == 0
+
+
+def test_scheduler_sends_outside_its_lock_and_drops_failed_targets():
+    scheduler = _scheduler([0], interval=1.0)
+    locked = []
+
+    def send(data):
+        locked.append(scheduler._lock.locked())
+        raise OSError("peer gone")
+
+    target = PollTarget("10.0.0.1:5000", CyclePoller(lambda: (0, b"req")), send)
+    scheduler.add(target, now=0.0)
+    for step in range(1, 31):
+        scheduler.run_due(step * 0.1)
+
+    assert locked == [False]
+    metrics = scheduler.metrics()
+    assert metrics["poll_errors"] == 1
+    assert metrics["targets"] == 0
+
+
+def test_scheduler_skips_polls_a_connection_cannot_take_without_blocking():
+    scheduler = _scheduler([0], interval=1.0)
+    target = PollTarget("10.0.0.1:5000", CyclePoller(lambda: (0, b"req")), lambda data: False)
+    scheduler.add(target, now=0.0)
+    for step in range(1, 31):
+        scheduler.run_due(step * 0.1)
+
+    metrics = scheduler.metrics()
+    assert metrics["polls_sent"] == 0
+    assert metrics["polls_skipped"] >= 2
+    assert metrics["targets"] == 1
+    assert not target.poller.pending
+
+
+def test_send_poll_returns_instead_of_blocking_on_a_full_socket():
+    local, remote = socket.socketpair()
+    local.settimeout(5)
+    local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    try:
+        while _send_poll(local, b"\x00" * 64):
+            pass
+        started = time.monotonic()
+        assert _send_poll(local, b"req") is False
+        assert time.monotonic() - started < 1
+    finally:
+        local.close()
+        remote.close()
@@ -0,0 +1,36 @@
+from services.tcp import side_effects
+from services.tcp.side_effects import SideEffectStage
+
+
+def test_flush_batches_presence_and_coalesces_broadcasts(monkeypatch):
+    seen_calls = []
+    broadcasts = []
+    monkeypatch.setattr(
+        side_effects,
+        "mark_devices_seen",
+        lambda device_ids, topic: seen_calls.append((list(device_ids), topic)),
+    )
+    monkeypatch.setattr(
+        side_effects,
+        "broadcast_realtime_many",
+        lambda messages, group, event: broadcasts.append((messages, group, event)),
+    )
+    stage = SideEffectStage(topic="TCP_SOLAR_DATA", group="tcp", event="tcp.message")
+
+    stage.submit("gw-1", {"seq": 1})
+    stage.submit("gw-2", {"seq": 2})
+    stage.submit("gw-1", {"seq": 3})
+    stage._flush(stage._drain())
+
+    assert seen_calls == [(["gw-1", "gw-2"], "TCP_SOLAR_DATA")]
+    assert broadcasts == [([{"seq": 3}, {"seq": 2}], "tcp", "tcp.message")]
+    metrics = stage.metrics()
+    assert metrics["broadcasts"] == 2
+    assert metrics["coalesced"] == 1
+
+
+def test_submit_drops_when_queue_is_full():
+    stage = SideEffectStage(topic="TCP_SOLAR_DATA", group="tcp", event="tcp.message", maxsize=1)
+    assert stage.submit("gw-1", {})
+    assert not stage.submit("gw-2", {})
+    assert stage.metrics()["dropped"] == 1
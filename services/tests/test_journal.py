@@ -0,0 +1,139 @@
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from services.journal import IngestJournal, journal_record, write_journal_records
+
+
+def test_journal_replays_records_in_order_and_removes_segments(tmp_path):
+    journal = IngestJournal(tmp_path, segment_bytes=256)
+    for index in range(20):
+        assert journal.append({"index": index, "ts": datetime(2026, 1, 1, tzinfo=timezone.utc)})
+    assert journal.metrics()["segments"] > 1
+
+    batches = []
+    assert journal.replay(batches.append, batch_size=7) == 20
+
+    assert [record["index"] for batch in batches for record in batch] == list(range(20))
+    assert journal.metrics()["segments"] == 0
+    assert journal.metrics()["bytes"] == 0
+
+
+def test_journal_retries_unhandled_remainder_after_failure(tmp_path):
+    journal = IngestJournal(tmp_path)
+    for index in range(5):
+        journal.append({"index": index})
+
+    seen = []
+
+    def flaky(batch):
+        if len(seen) == 2:
+            raise RuntimeError("mongo down")
+        seen.append([record["index"] for record in batch])
+
+    with pytest.raises(RuntimeError):
+        journal.replay(flaky, batch_size=2)
+    seen.append("recovered")
+    journal.replay(lambda batch: seen.append([record["index"] for record in batch]), batch_size=2)
+
+    assert seen == [[0, 1], [2, 3], "recovered", [4]]
+
+
+def test_journal_survives_restart_and_torn_tail(tmp_path):
+    journal = IngestJournal(tmp_path)
+    journal.append({"index": 1})
+    journal.append({"index": 2})
+    journal.close()
+    segment = next(tmp_path.glob("*/segment-*.log"))
+    with open(segment, "ab") as handle:
+        handle.write(b"\x00\x00\x01\x00partial")
+
+    reopened = IngestJournal(tmp_path)
+    replayed = []
+    reopened.replay(replayed.extend)
+
+    assert [record["index"] for record in replayed] == [1, 2]
+    assert reopened.metrics()["corrupt_records"] == 1
+
+
+def test_journal_drops_when_full(tmp_path):
+    journal = IngestJournal(tmp_path, max_bytes=64)
+    assert journal.append({"value": "x"})
+    assert not journal.append({"value": "x" * 100})
+    assert journal.metrics()["dropped"] == 1
+
+
+def test_journal_record_pins_object_id():
+    document = {"client_id": "gw"}
+    record = journal_record(document, ["solar_data"])
+    assert record["document"]["_id"] == document["_id"]
+    assert record["collections"] == ["solar_data"]
+
+
+def test_processes_sharing_a_directory_keep_their_own_segments(tmp_path):
+    old = IngestJournal(tmp_path)
+    old.append({"n": 1})
+    new = IngestJournal(tmp_path)
+
+    # A hot restart: the new process replays while the old one is still appending.
+    assert new.replay(lambda batch: None) == 0
+    old.append({"n": 2})
+    old.close()
+
+    replayed = []
+    new.replay(replayed.extend)
+
+    assert [record["n"] for record in replayed] == [1, 2]
+    assert [path.name for path in tmp_path.iterdir()] == [new.directory.name]
+
+
+def test_segments_left_in_the_directory_itself_are_adopted(tmp_path):
+    legacy = IngestJournal(tmp_path)
+    legacy.append({"n": 1})
+    legacy.close()
+    for segment in legacy.directory.glob("segment-*.log"):
+        segment.rename(tmp_path / segment.name)
+
+    replayed = []
+    IngestJournal(tmp_path).replay(replayed.extend)
+
+    assert replayed == [{"n": 1}]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.down = {"today_solar_data"}
+        self.inserted = []
+
+    def __getitem__(self, name):
+        database = self
+
+        class Collection:
+            def insert_many(self, documents, ordered=True):
+                if name in database.down:
+                    raise AutoReconnect("down")
+                database.inserted.extend((name, document["n"]) for document in documents)
+
+        return Collection()
+
+
+def test_replay_retries_only_the_collections_that_failed(tmp_path):
+    database = FakeDatabase()
+    journal = IngestJournal(tmp_path)
+    for n in (1, 2):
+        journal.append(journal_record({"n": n}, ["solar_data", "today_solar_data"]))
+
+    def handler(records):
+        return write_journal_records(database, records)
+
+    assert journal.replay(handler) == 2
+    assert database.inserted == [("solar_data", 1), ("solar_data", 2)]
+
+    with pytest.raises(AutoReconnect):
+        journal.replay(handler)
+    database.down.clear()
+    assert journal.replay(handler) == 2
+
+    assert database.inserted[2:] == [("today_solar_data", 1), ("today_solar_data", 2)]
+    assert journal.metrics()["segments"] == 0
@@ -0,0 +1,43 @@
+from services.writers import BatchWriterState
+
+
+def _writer(**kwargs):
+    return BatchWriterState("writer-0", batch_size=200, flush_ms=500, adaptive=True, **kwargs)
+
+
+def test_batches_grow_under_backlog_up_to_max():
+    writer = _writer(max_batch_size=500)
+    writer.record(200, 20.0, ok=True, queue_depth=1000)
+    assert writer.batch_size == 400
+    writer.record(400, 20.0, ok=True, queue_depth=1000)
+    assert writer.batch_size == 500
+
+
+def test_slow_inserts_shrink_batches():
+    writer = _writer(target_latency_ms=100)
+    writer.record(200, 300.0, ok=True, queue_depth=1000)
+    assert writer.batch_size == 100
+
+
+def test_idle_writer_flushes_sooner_and_recovers_under_load():
+    writer = _writer(min_flush_ms=100)
+    writer.record(3, 5.0, ok=True, queue_depth=0)
+    writer.record(3, 5.0, ok=True, queue_depth=0)
+    assert writer.flush_ms == 125
+    assert writer.batch_size == 112
+
+    writer.record(112, 5.0, ok=True, queue_depth=5000)
+    assert writer.flush_ms == 500
+
+
+def test_static_writer_only_records_metrics():
+    writer = BatchWriterState("writer-0", batch_size=200, flush_ms=500)
+    writer.record(200, 40.0, ok=True, queue_depth=5000)
+    writer.record(200, 60.0, ok=False, queue_depth=5000)
+
+    metrics = writer.metrics()
+    assert writer.batch_size == 200
+    assert metrics["batches"] == 1
+    assert metrics["documents"] == 200
+    assert metrics["errors"] == 1
+    assert metrics["last_latency_ms"] == 60.0
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import threading
+
+
+class BatchWriterState:
+    """Batch sizing and metrics for one Mongo writer thread.
+
+    With ``adaptive`` enabled, batches double while the queue holds more than one batch of
+    backlog, halve when an insert exceeds ``target_latency_ms``, and the flush interval
+    shrinks while the writer is idle so single readings are stored sooner.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        batch_size: int,
+        flush_ms: int,
+        adaptive: bool = False,
+        min_batch_size: int = 10,
+        max_batch_size: int = 5000,
+        min_flush_ms: int = 50,
+        target_latency_ms: float = 250.0,
+    ) -> None:
+        self.name = name
+        self.adaptive = adaptive
+        self.base_flush_ms = flush_ms
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.max_batch_size = max(max_batch_size, batch_size)
+        self.min_flush_ms = min(min_flush_ms, flush_ms)
+        self.target_latency_ms = target_latency_ms
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._lock = threading.Lock()
+        self._metrics = {
+            "batches": 0,
+            "documents": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "last_latency_ms": 0.0,
+            "avg_latency_ms": 0.0,
+        }
+
+    def record(self, size: int, latency_ms: float, *, ok: bool, queue_depth: int) -> None:
+        with self._lock:
+            if ok:
+                self._metrics["batches"] += 1
+                self._metrics["documents"] += size
+            else:
+                self._metrics["errors"] += 1
+            self._metrics["last_batch_size"] = size
+            self._metrics["last_latency_ms"] = round(latency_ms, 3)
+            previous = self._metrics["avg_latency_ms"]
+            average = latency_ms if not previous else previous * 0.8 + latency_ms * 0.2
+            self._metrics["avg_latency_ms"] = round(average, 3)
+        if self.adaptive:
+            self._adapt(size, latency_ms, queue_depth)
+
+    def _adapt(self, size: int, latency_ms: float, queue_depth: int) -> None:
+        if latency_ms > self.target_latency_ms:
+            self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+        elif queue_depth > self.batch_size:
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+            self.flush_ms = self.base_flush_ms
+        elif queue_depth == 0 and size < self.batch_size:
+            self.batch_size = max(self.batch_size * 3 // 4, self.min_batch_size)
+            self.flush_ms = max(self.flush_ms // 2, self.min_flush_ms)
+        else:
+            self.flush_ms = min(self.flush_ms * 2, self.base_flush_ms)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            payload = dict(self._metrics)
+        payload["name"] = self.name
+        payload["batch_size"] = self.batch_size
+        payload["flush_ms"] = self.flush_ms
+        return payload